@@ -0,0 +1,160 @@
+# School calendar: one-off and repeating activities, date-range reads and ICS export.
+# A repeating activity is one row in activities (its first date) plus a rule in activity_recurrence; occurrences
+# are expanded only inside the requested range, so the weekly view reads a fortnight of rows through the
+# (date, activity) index however long the calendar grows. Writes to either table bump the 'activities'
+# generation in table_versions, which is what the app's cached weekly list is keyed on.
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+import pandas as pd
+from services import ServiceError
+from validation import is_valid_activity
+# label: (RRULE, step); monthly steps by calendar month on the same day, skipping months too short for it
+REPEATS = {'weekly': ('FREQ=WEEKLY', timedelta(days=7)), 'fortnightly': ('FREQ=WEEKLY;INTERVAL=2', timedelta(days=14)),
+           'monthly': ('FREQ=MONTHLY', None)}
+COLUMNS = ['id', 'activity', 'date', 'description', 'repeat', 'until']
+def ensure_activities(conn: sqlite3.Connection) -> None:
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS activity_recurrence (activity_id INTEGER PRIMARY KEY REFERENCES activities (id),
+            repeat TEXT NOT NULL, until DATE);
+        CREATE TRIGGER IF NOT EXISTS activity_recurrence_version_insert AFTER INSERT ON activity_recurrence
+        BEGIN UPDATE table_versions SET generation = generation + 1 WHERE name = 'activities'; END;
+        CREATE TRIGGER IF NOT EXISTS activity_recurrence_version_update AFTER UPDATE ON activity_recurrence
+        BEGIN UPDATE table_versions SET generation = generation + 1 WHERE name = 'activities'; END;
+        CREATE TRIGGER IF NOT EXISTS activity_recurrence_version_delete AFTER DELETE ON activity_recurrence
+        BEGIN UPDATE table_versions SET generation = generation + 1 WHERE name = 'activities'; END;
+    """)
+def week_start(on: Optional[date] = None) -> date:
+    on = on or datetime.now().date()
+    return on - timedelta(days=on.weekday())
+# === WRITES ===
+def _check(activity, repeat, on, until):
+    if not is_valid_activity(activity):
+        raise ServiceError("Invalid activity name")
+    if repeat is not None and repeat not in REPEATS:
+        raise ServiceError(f"Repeat must be one of: {', '.join(REPEATS)}")
+    if repeat is not None and until is not None and until < on:
+        raise ServiceError("Repeat end date is before the first date")
+def _set_repeat(conn, activity_id, repeat, until):
+    if repeat is None:
+        conn.execute("DELETE FROM activity_recurrence WHERE activity_id = ?", (activity_id,))
+    else:
+        conn.execute("INSERT OR REPLACE INTO activity_recurrence VALUES (?, ?, ?)",
+                     (activity_id, repeat, until.isoformat() if until else None))
+def add_activity(conn: sqlite3.Connection, activity: str, on: date, description: Optional[str] = None,
+                 repeat: Optional[str] = None, until: Optional[date] = None) -> int:
+    _check(activity, repeat, on, until)
+    try:
+        with conn:
+            new_id = (conn.execute("SELECT MAX(id) FROM activities").fetchone()[0] or 0) + 1
+            conn.execute("INSERT INTO activities VALUES (?, ?, ?, ?)",
+                         (new_id, activity.strip(), on.isoformat(), description.strip() if description else None))
+            _set_repeat(conn, new_id, repeat, until)
+    except sqlite3.IntegrityError:
+        raise ServiceError("Activity for this date already exists")
+    return new_id
+def update_activity(conn: sqlite3.Connection, activity_id: int, activity: str, on: date, description: Optional[str] = None,
+                    repeat: Optional[str] = None, until: Optional[date] = None) -> int:
+    _check(activity, repeat, on, until)
+    try:
+        with conn:
+            cursor = conn.execute("UPDATE activities SET activity = ?, date = ?, description = ? WHERE id = ?",
+                                  (activity.strip(), on.isoformat(), description.strip() if description else None, activity_id))
+            if cursor.rowcount == 0:
+                raise ServiceError("Activity ID not found")
+            _set_repeat(conn, activity_id, repeat, until)
+    except sqlite3.IntegrityError:
+        raise ServiceError("Activity for this date already exists")
+    return activity_id
+def get_activity(conn: sqlite3.Connection, activity_id: int) -> Optional[dict]:
+    row = conn.execute("""
+        SELECT a.id, a.activity, a.date, a.description, r.repeat, r.until
+        FROM activities a LEFT JOIN activity_recurrence r ON r.activity_id = a.id WHERE a.id = ?
+    """, (activity_id,)).fetchone()
+    return dict(zip(COLUMNS, row)) if row else None
+# === READS ===
+def _add_months(day, months):
+    # None when the month has no such day (e.g. the 31st)
+    month = day.month - 1 + months
+    try:
+        return day.replace(year=day.year + month // 12, month=month % 12 + 1)
+    except ValueError:
+        return None
+def _dates(first, repeat, until, start, end):
+    # Occurrence dates of one rule within [start, end]
+    last = min(end, until) if until else end
+    rule, step = REPEATS[repeat]
+    if step is not None:
+        skip = max(0, (start - first).days // step.days)
+        day = first + skip * step
+        while day <= last:
+            if day >= start:
+                yield day
+            day += step
+        return
+    months = max(0, (start.year - first.year) * 12 + start.month - first.month - 1)
+    while True:
+        day = _add_months(first, months)
+        months += 1
+        if day is None:
+            continue
+        if day > last:
+            return
+        if day >= start:
+            yield day
+def occurrences(conn: sqlite3.Connection, start: date, end: date) -> pd.DataFrame:
+    # Every activity falling in [start, end], repeating ones once per occurrence, ordered by date
+    single = conn.execute("""
+        SELECT a.id, a.activity, a.date, a.description, NULL, NULL FROM activities a
+        WHERE a.date BETWEEN ? AND ? AND NOT EXISTS (SELECT 1 FROM activity_recurrence r WHERE r.activity_id = a.id)
+    """, (start.isoformat(), end.isoformat())).fetchall()
+    repeating = conn.execute("""
+        SELECT a.id, a.activity, a.date, a.description, r.repeat, r.until FROM activity_recurrence r
+        JOIN activities a ON a.id = r.activity_id
+        WHERE a.date <= ? AND (r.until IS NULL OR r.until >= ?)
+    """, (end.isoformat(), start.isoformat())).fetchall()
+    rows = [r[:2] + (date.fromisoformat(r[2]),) + r[3:] for r in single]
+    for r in repeating:
+        until = date.fromisoformat(r[5]) if r[5] else None
+        rows += [r[:2] + (day,) + r[3:] for day in _dates(date.fromisoformat(r[2]), r[4], until, start, end)]
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    return df.sort_values(['date', 'activity'], ignore_index=True)
+def all_activities(conn: sqlite3.Connection) -> pd.DataFrame:
+    # One row per activity as stored (first date and rule), newest first
+    return pd.read_sql_query("""
+        SELECT a.id, a.activity, a.date, a.description, r.repeat, r.until
+        FROM activities a LEFT JOIN activity_recurrence r ON r.activity_id = a.id ORDER BY a.date DESC, a.id
+    """, conn)
+# === ICS ===
+def _ics_text(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+def _fold(line):
+    # RFC 5545 lines are at most 75 octets; continuation lines start with a space
+    data = line.encode('utf-8')
+    parts = []
+    while len(data) > (74 if parts else 75):
+        cut = 74 if parts else 75
+        while cut and (data[cut] & 0xC0) == 0x80:  # do not split a UTF-8 sequence
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+    parts.append(data)
+    return b'\r\n '.join(parts).decode('utf-8')
+def to_ics(conn: sqlite3.Connection, calendar_name: str = "School Activities", domain: str = "school.local") -> str:
+    # Whole calendar as an iCalendar file; repeating activities become one VEVENT with an RRULE
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//School Management//Activities//EN", "CALSCALE:GREGORIAN",
+             f"X-WR-CALNAME:{_ics_text(calendar_name)}"]
+    for row in all_activities(conn).itertuples():
+        first = date.fromisoformat(row.date)
+        lines += ["BEGIN:VEVENT", f"UID:activity-{row.id}@{domain}", f"DTSTAMP:{stamp}",
+                  f"DTSTART;VALUE=DATE:{first:%Y%m%d}", f"DTEND;VALUE=DATE:{first + timedelta(days=1):%Y%m%d}",
+                  f"SUMMARY:{_ics_text(row.activity)}"]
+        if row.description:
+            lines.append(f"DESCRIPTION:{_ics_text(row.description)}")
+        if row.repeat:
+            rule = REPEATS[row.repeat][0]
+            lines.append(f"RRULE:{rule};UNTIL={date.fromisoformat(row.until):%Y%m%d}" if row.until else f"RRULE:{rule}")
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
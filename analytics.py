@@ -0,0 +1,142 @@
+# Materialized results analytics: per class/subject statistics, score distribution, subject positions,
+# overall class positions and teacher aggregates through subject_assignments.
+# Triggers on results and students record which (class, subject) groups changed in result_stats_dirty;
+# refresh() recomputes only those groups with window functions, so reading the analytics stays cheap.
+import sqlite3
+from typing import Optional
+import pandas as pd
+PASS_MARK = 50
+# (label, low, high) inclusive score bands
+BUCKETS = [('0-39', 0, 39), ('40-49', 40, 49), ('50-59', 50, 59), ('60-69', 60, 69), ('70-79', 70, 79), ('80-100', 80, 100)]
+def ensure_analytics(conn: sqlite3.Connection) -> None:
+    created = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'result_stats'").fetchone() is None
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS result_stats_dirty (class TEXT NOT NULL, subject TEXT NOT NULL, PRIMARY KEY (class, subject));
+        CREATE TABLE IF NOT EXISTS result_stats (class TEXT NOT NULL, subject TEXT NOT NULL, students INTEGER NOT NULL,
+            mean REAL, median REAL, min INTEGER, max INTEGER, pass_rate REAL, PRIMARY KEY (class, subject));
+        CREATE TABLE IF NOT EXISTS result_distribution (class TEXT NOT NULL, subject TEXT NOT NULL, bucket TEXT NOT NULL,
+            students INTEGER NOT NULL, PRIMARY KEY (class, subject, bucket));
+        CREATE TABLE IF NOT EXISTS result_ranks (class TEXT NOT NULL, subject TEXT NOT NULL, student_id INTEGER NOT NULL,
+            score INTEGER NOT NULL, position INTEGER NOT NULL, PRIMARY KEY (class, subject, student_id));
+        CREATE TABLE IF NOT EXISTS class_positions (class TEXT NOT NULL, student_id INTEGER NOT NULL, subjects INTEGER NOT NULL,
+            total INTEGER NOT NULL, average REAL NOT NULL, position INTEGER NOT NULL, PRIMARY KEY (class, student_id));
+        CREATE TRIGGER IF NOT EXISTS results_stats_insert AFTER INSERT ON results BEGIN
+            INSERT OR IGNORE INTO result_stats_dirty SELECT class, NEW.subject FROM students WHERE id = NEW.student_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS results_stats_update AFTER UPDATE ON results BEGIN
+            INSERT OR IGNORE INTO result_stats_dirty SELECT class, OLD.subject FROM students WHERE id = OLD.student_id;
+            INSERT OR IGNORE INTO result_stats_dirty SELECT class, NEW.subject FROM students WHERE id = NEW.student_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS results_stats_delete AFTER DELETE ON results BEGIN
+            INSERT OR IGNORE INTO result_stats_dirty SELECT class, OLD.subject FROM students WHERE id = OLD.student_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS students_stats_class AFTER UPDATE OF class ON students WHEN OLD.class IS NOT NEW.class BEGIN
+            INSERT OR IGNORE INTO result_stats_dirty SELECT OLD.class, subject FROM results WHERE student_id = OLD.id;
+            INSERT OR IGNORE INTO result_stats_dirty SELECT NEW.class, subject FROM results WHERE student_id = NEW.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS students_stats_delete AFTER DELETE ON students BEGIN
+            INSERT OR IGNORE INTO result_stats_dirty SELECT OLD.class, subject FROM results WHERE student_id = OLD.id;
+        END;
+    """)
+    if created:
+        rebuild(conn)
+def rebuild(conn: sqlite3.Connection) -> int:
+    # Marks every group dirty and refreshes; for first install or after bulk edits made with triggers off
+    with conn:
+        conn.execute("""
+            INSERT OR IGNORE INTO result_stats_dirty SELECT DISTINCT s.class, r.subject FROM results r JOIN students s ON s.id = r.student_id
+        """)
+    return refresh(conn)
+def refresh(conn: sqlite3.Connection) -> int:
+    # Recomputes the dirty groups in one write transaction; returns how many groups were refreshed
+    if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM result_stats_dirty)").fetchone()[0]:
+        return 0
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        groups = conn.execute("SELECT COUNT(*) FROM result_stats_dirty").fetchone()[0]
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS scored (class TEXT, subject TEXT, student_id INTEGER, score INTEGER)
+        """)
+        conn.execute("DELETE FROM temp.scored")
+        conn.execute("""
+            INSERT INTO temp.scored
+            SELECT s.class, r.subject, r.student_id, r.score FROM results r JOIN students s ON s.id = r.student_id
+            WHERE (s.class, r.subject) IN (SELECT class, subject FROM result_stats_dirty)
+        """)
+        for table in ('result_stats', 'result_distribution', 'result_ranks'):
+            conn.execute(f"DELETE FROM {table} WHERE (class, subject) IN (SELECT class, subject FROM result_stats_dirty)")
+        conn.execute("""
+            INSERT INTO result_stats
+            WITH ordered AS (
+                SELECT class, subject, score,
+                       ROW_NUMBER() OVER (PARTITION BY class, subject ORDER BY score) AS n,
+                       COUNT(*) OVER (PARTITION BY class, subject) AS size
+                FROM temp.scored
+            )
+            SELECT class, subject, COUNT(*), ROUND(AVG(score), 2),
+                   AVG(CASE WHEN n IN ((size + 1) / 2, (size + 2) / 2) THEN score END),
+                   MIN(score), MAX(score), ROUND(AVG(score >= ?), 4)
+            FROM ordered GROUP BY class, subject
+        """, (PASS_MARK,))
+        bucket = "CASE " + " ".join(f"WHEN score <= {high} THEN '{label}'" for label, _, high in BUCKETS) + " END"
+        conn.execute(f"""
+            INSERT INTO result_distribution
+            SELECT class, subject, {bucket}, COUNT(*) FROM temp.scored GROUP BY class, subject, {bucket}
+        """)
+        conn.execute("""
+            INSERT INTO result_ranks
+            SELECT class, subject, student_id, score, RANK() OVER (PARTITION BY class, subject ORDER BY score DESC)
+            FROM temp.scored
+        """)
+        # Overall positions depend on every subject in the class, so the whole class is recomputed
+        conn.execute("DELETE FROM class_positions WHERE class IN (SELECT class FROM result_stats_dirty)")
+        conn.execute("""
+            INSERT INTO class_positions
+            SELECT class, student_id, subjects, total, average, RANK() OVER (PARTITION BY class ORDER BY average DESC)
+            FROM (
+                SELECT s.class, r.student_id, COUNT(*) AS subjects, SUM(r.score) AS total, ROUND(AVG(r.score), 2) AS average
+                FROM results r JOIN students s ON s.id = r.student_id
+                WHERE s.class IN (SELECT class FROM result_stats_dirty)
+                GROUP BY s.class, r.student_id
+            )
+        """)
+        conn.execute("DELETE FROM result_stats_dirty")
+    return groups
+# === READS ===
+# Each read refreshes first, so callers always see current figures at the cost of the changed groups only
+def _read(conn, sql, params=()):
+    refresh(conn)
+    return pd.read_sql_query(sql, conn, params=params)
+def class_subject_stats(conn: sqlite3.Connection, class_name: Optional[str] = None) -> pd.DataFrame:
+    if class_name is None:
+        return _read(conn, "SELECT * FROM result_stats ORDER BY class, subject")
+    return _read(conn, "SELECT * FROM result_stats WHERE class = ? ORDER BY subject", (class_name,))
+def distribution(conn: sqlite3.Connection, class_name: str, subject: str) -> pd.DataFrame:
+    df = _read(conn, "SELECT bucket, students FROM result_distribution WHERE class = ? AND subject = ?", (class_name, subject))
+    df = pd.DataFrame({'bucket': [b[0] for b in BUCKETS]}).merge(df, how='left', on='bucket')
+    return df.fillna({'students': 0}).astype({'students': int})
+def subject_ranking(conn: sqlite3.Connection, class_name: str, subject: str) -> pd.DataFrame:
+    return _read(conn, """
+        SELECT k.position, k.student_id, s.first_name || ' ' || COALESCE(s.middle_name, '') || ' ' || s.surname AS full_name, k.score
+        FROM result_ranks k JOIN students s ON s.id = k.student_id
+        WHERE k.class = ? AND k.subject = ? ORDER BY k.position, k.student_id
+    """, (class_name, subject))
+def class_ranking(conn: sqlite3.Connection, class_name: str) -> pd.DataFrame:
+    return _read(conn, """
+        SELECT p.position, p.student_id, s.first_name || ' ' || COALESCE(s.middle_name, '') || ' ' || s.surname AS full_name,
+               p.subjects, p.total, p.average
+        FROM class_positions p JOIN students s ON s.id = p.student_id
+        WHERE p.class = ? ORDER BY p.position, p.student_id
+    """, (class_name,))
+def teacher_stats(conn: sqlite3.Connection) -> pd.DataFrame:
+    # Per teacher over the class/subject pairs assigned to them, weighted by how many students sat each
+    return _read(conn, """
+        SELECT t.id AS teacher_id, t.name, COUNT(*) AS classes, SUM(r.students) AS students,
+               ROUND(SUM(r.mean * r.students) / SUM(r.students), 2) AS mean,
+               ROUND(SUM(r.pass_rate * r.students) / SUM(r.students), 4) AS pass_rate
+        FROM subject_assignments a
+        JOIN teachers t ON t.id = a.teacher_id
+        JOIN result_stats r ON r.class = a.class AND r.subject = a.subject
+        GROUP BY t.id, t.name ORDER BY mean DESC
+    """)
@@ -0,0 +1,255 @@
+# Optional JSON/HTTP API over school.db for attendance tablets, the SMS job and other integrations.
+# Stdlib only: asyncio serves HTTP/1.1 with keep-alive, every database call runs in a worker thread (asyncio.to_thread).
+#   python api.py --host 0.0.0.0 --port 8502
+# Set SCHOOL_API_TOKEN to require "Authorization: Bearer <token>"; SCHOOL_DB picks the database like the app does,
+# or --tenant <key> serves one school from the tenants registry (run one API process per school).
+#
+# GET  /students, /attendance, /results, /fees, /timetables   ?<filter>=..&limit=100&after=<cursor>
+# GET  /students/<id>                                            student with results and attendance
+# POST /attendance      {"date": "2025-01-31", "records": [{"student_id": 1, "present": true}, ...]}
+# POST /results         {"records": [{"student_id": 1, "subject": "Mathematics", "score": 71}, ...]}
+# POST /fees/payments   {"payments": [{"student_id": 1, "amount": 50, "collected_by": "Bursar"}, ...]}
+# POST /timetables      {"slots": [{"class": "P3", "day": "Monday", "period": 1, "subject": "ICT", "teacher_id": 4}, ...]}
+# POST /sync            {"events": [...]}  batches pushed by sync.Outbox; see sync.merge_events for the reply
+# Lists page by rowid: pass the returned "next" as ?after= until it comes back null. GET responses carry an ETag
+# built from the table generation counters, so a client polling with If-None-Match gets 304 without a query.
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+from datetime import date
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+import pandas as pd
+import services
+import sync
+import tenants
+from services import ServiceError
+from validation import validate_results
+DATABASE = os.environ.get('SCHOOL_DB', 'school.db')
+API_TOKEN = os.environ.get('SCHOOL_API_TOKEN')
+MAX_LIMIT = 1000
+MAX_BODY = 5 * 1024 * 1024
+# resource: (table, {query filter: SQL condition}, tables whose generations make up the ETag)
+RESOURCES = {
+    'students': ('students', {'class': "class = ?", 'gender': "gender = ?"}, ['students']),
+    'attendance': ('attendance', {'date': "date = ?", 'student_id': "student_id = ?",
+                                  'class': "student_id IN (SELECT id FROM students WHERE class = ?)"}, ['attendance', 'students']),
+    'results': ('results', {'student_id': "student_id = ?", 'subject': "subject = ?",
+                            'class': "student_id IN (SELECT id FROM students WHERE class = ?)"}, ['results', 'students']),
+    'fees': ('fees', {'class': "class = ?", 'student_id': "student_id = ?"}, ['fees']),
+    'timetables': ('timetables', {'class': "class = ?", 'day': "day = ?", 'teacher_id': "teacher_id = ?"}, ['timetables']),
+}
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+# === DATABASE ===
+# Plain functions run in worker threads; each thread keeps one connection for its lifetime
+_local = threading.local()
+def db():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = services.connect(DATABASE)
+        conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+def etag_for(tables, target):
+    generations = sorted(services.table_generations(db(), tables).items())
+    return '"' + hashlib.sha1(f"{target}|{generations}".encode()).hexdigest()[:20] + '"'
+def list_rows(resource, params):
+    table, filters, _ = RESOURCES[resource]
+    unknown = set(params) - set(filters) - {'limit', 'after'}
+    if unknown:
+        raise HTTPError(400, f"Unknown filter: {', '.join(sorted(unknown))}")
+    try:
+        limit = max(1, min(int(params.get('limit', 100)), MAX_LIMIT))
+        after = int(params.get('after', 0))
+    except ValueError:
+        raise HTTPError(400, "limit and after must be integers")
+    used = [name for name in params if name in filters]
+    where = " AND ".join(["rowid > ?"] + [filters[name] for name in used])
+    cursor = db().execute(f"SELECT rowid AS _cursor, * FROM {table} WHERE {where} ORDER BY rowid LIMIT ?",
+                          [after] + [params[name] for name in used] + [limit + 1])
+    columns = [c[0] for c in cursor.description]
+    rows = [dict(zip(columns, r)) for r in cursor.fetchall()]
+    next_cursor = rows[limit - 1]['_cursor'] if len(rows) > limit else None
+    items = rows[:limit]
+    for row in items:
+        del row['_cursor']
+    return {'items': items, 'next': next_cursor}
+def get_student(student_id):
+    try:
+        report = services.student_report(db(), student_id)
+    except ServiceError as e:
+        raise HTTPError(404, str(e))
+    return {'student': report['student'], 'results': report['results'].to_dict('records'),
+            'attendance': report['attendance'].to_dict('records')}
+def post_attendance(body):
+    day = date.fromisoformat(body['date']) if body.get('date') else None
+    records = body.get('records') or []
+    present = [int(r['student_id']) for r in records if r.get('present')]
+    absent = [int(r['student_id']) for r in records if not r.get('present')]
+    conn = db()
+    known = {r[0] for r in conn.execute("SELECT id FROM students")}
+    unknown = sorted(set(present + absent) - known)
+    if unknown:
+        raise HTTPError(422, f"Unknown student IDs: {unknown[:20]}")
+    client_id = str(body.get('client_id') or 'api')
+    applied = (services.mark_attendance_bulk(conn, present, True, day, client_id)
+               + services.mark_attendance_bulk(conn, absent, False, day, client_id))
+    return {'received': len(records), 'applied': applied}
+def post_results(body):
+    batch = pd.DataFrame(body.get('records') or [], columns=['student_id', 'subject', 'score'])
+    conn = db()
+    student_ids = [r[0] for r in conn.execute("SELECT id FROM students")]
+    checked = validate_results(batch, student_ids, services.known_subjects(conn))
+    rejected = checked[checked['error'] != '']
+    saved = services.upsert_results(conn, checked[checked['error'] == ''])
+    return {'saved': saved, 'rejected': rejected[['row', 'error']].to_dict('records')}
+def post_sync(body):
+    events = body.get('events')
+    if not isinstance(events, list):
+        raise HTTPError(400, "events must be a list")
+    return sync.merge_events(db(), events)
+def post_each(func, items, args):
+    # Applies one service call per item; failures are reported by position and do not stop the batch
+    done, errors = 0, []
+    conn = db()
+    for index, item in enumerate(items):
+        try:
+            func(conn, *(item.get(a) for a in args))
+            done += 1
+        except (ServiceError, TypeError, ValueError) as e:
+            errors.append({'index': index, 'error': str(e)})
+    return {'done': done, 'errors': errors}
+def post_payments(body):
+    return post_each(services.record_payment, body.get('payments') or [], ['student_id', 'amount', 'collected_by'])
+def post_timetables(body):
+    return post_each(services.add_timetable_slot, body.get('slots') or [], ['class', 'day', 'period', 'subject', 'teacher_id'])
+# === ROUTING ===
+# (method, path pattern, handler, tables for the ETag or None for writes)
+ROUTES = [
+    ('GET', re.compile(r'/students/(\d+)'), lambda m, q, b: get_student(int(m.group(1))), ['students', 'results', 'attendance']),
+    ('GET', re.compile(r'/(students|attendance|results|fees|timetables)'), lambda m, q, b: list_rows(m.group(1), q), 'resource'),
+    ('POST', re.compile(r'/attendance'), lambda m, q, b: post_attendance(b), None),
+    ('POST', re.compile(r'/results'), lambda m, q, b: post_results(b), None),
+    ('POST', re.compile(r'/fees/payments'), lambda m, q, b: post_payments(b), None),
+    ('POST', re.compile(r'/timetables'), lambda m, q, b: post_timetables(b), None),
+    ('POST', re.compile(r'/sync'), lambda m, q, b: post_sync(b), None),
+]
+def dispatch(method, target, headers, body):
+    # Runs in a worker thread; returns (status, payload, extra headers)
+    url = urlsplit(target)
+    query = dict(parse_qsl(url.query))
+    for route_method, pattern, handler, tables in ROUTES:
+        match = pattern.fullmatch(url.path.rstrip('/') or '/')
+        if not match:
+            continue
+        if route_method != method:
+            continue
+        if tables is None:
+            if not isinstance(body, dict):
+                raise HTTPError(400, "Body must be a JSON object")
+            return 200, handler(match, query, body), {}
+        tables = RESOURCES[match.group(1)][2] if tables == 'resource' else tables
+        etag = etag_for(tables, target)
+        if etag in [t.strip() for t in headers.get('if-none-match', '').split(',')]:
+            return 304, None, {'ETag': etag}
+        return 200, handler(match, query, body), {'ETag': etag, 'Cache-Control': 'no-cache'}
+    raise HTTPError(404, "Not found")
+# === HTTP ===
+async def read_request(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY:
+        raise HTTPError(413, "Request body too large")
+    body = None
+    if length:
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except ValueError:
+            raise HTTPError(400, "Body is not valid JSON")
+    return method.upper(), target, version, headers, body
+def authorized(headers):
+    if not API_TOKEN:
+        return True
+    scheme, _, token = headers.get('authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), API_TOKEN)
+async def write_response(writer, status, payload=None, headers=None, keep_alive=True):
+    body = b'' if payload is None else json.dumps(payload, default=str).encode()
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Length: {len(body)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if payload is not None:
+        lines.append("Content-Type: application/json")
+    lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+async def handle(reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                if not authorized(headers):
+                    raise HTTPError(401, "Missing or invalid API token")
+                status, payload, extra = await asyncio.to_thread(dispatch, method, target, headers, body)
+                await write_response(writer, status, payload, extra, keep_alive)
+            except HTTPError as e:
+                keep_alive = False
+                await write_response(writer, e.status, {'error': str(e)}, keep_alive=False)
+            except (KeyError, TypeError, ValueError) as e:
+                keep_alive = False
+                await write_response(writer, 400, {'error': f"Bad request: {e}"}, keep_alive=False)
+            except Exception as e:
+                keep_alive = False
+                await write_response(writer, 500, {'error': str(e)}, keep_alive=False)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+async def serve(host='127.0.0.1', port=8502):
+    conn = services.connect(DATABASE)
+    services.ensure_table_versions(conn)
+    sync.ensure_sync_tables(conn)
+    conn.close()
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+def main():
+    parser = argparse.ArgumentParser(description="JSON/HTTP API over the school database")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--tenant', help="school key in the tenants registry; default SCHOOL_DB")
+    args = parser.parse_args()
+    if args.tenant:
+        global DATABASE
+        schools = tenants.load_tenants()
+        if args.tenant not in schools:
+            parser.error(f"unknown school '{args.tenant}', expected one of: {', '.join(schools)}")
+        DATABASE = schools[args.tenant].database
+    print(f"Serving {DATABASE} on http://{args.host}:{args.port}")
+    asyncio.run(serve(args.host, args.port))
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,69 @@
 import streamlit as st
-import pandas as pd
 import sqlite3
-from datetime import datetime
-import re
+from datetime import datetime, timedelta
 import base64
+import zipfile
 import os
-import shutil
+from validation import (
+    is_valid_email, is_valid_phone, is_valid_name, is_valid_name_part, is_valid_class, is_valid_subject,
+    is_valid_date, is_valid_username, is_valid_password, is_valid_role, is_valid_insurance_number, GENDERS, text,
+    parse_dates, invalid_name_part, invalid_phone, invalid_insurance_number, invalid_required, invalid_choice,
+    invalid_date, error_messages, validate_results
+)
+import maintenance
+import snapshot
+import startup
+import tenants
+# Imported on first use (see startup.py): the login page renders before pandas and the feature modules load
+pd = startup.deferred('pandas')
+activities = startup.deferred('activities')
+analytics = startup.deferred('analytics')
+compliance = startup.deferred('compliance')
+export = startup.deferred('export')
+fee_analytics = startup.deferred('fee_analytics')
+idcards = startup.deferred('idcards')
+notifications = startup.deferred('notifications')
+payroll = startup.deferred('payroll')
+profiles = startup.deferred('profiles')
+rollover = startup.deferred('rollover')
+schema = startup.deferred('schema')
+services = startup.deferred('services')
+sync = startup.deferred('sync')
+workload = startup.deferred('workload')
 # === CONFIG ===
-DATABASE = 'school.db'
-IMAGE_PATH = r"C:\Users\ameah\Desktop\app host\xschool"
-PHOTO_FOLDER = 'student_photos'
+# Database, assets and photo folder belong to the school picked at login; see tenants.py for the registry
+@st.cache_resource
+def tenant_registry():
+    return tenants.Registry.load()
+def current_tenant():
+    # Outside a logged-in session (login page, scripts, benchmarks) this is the first school in the registry
+    return tenant_registry().get(st.session_state.get('tenant'))
+def connect(tenant_key=None):
+    # Pooled connection to the school's database; close() returns it to that school's pool
+    registry = tenant_registry()
+    return registry.pool(tenant_key or current_tenant().key).connect()
+@st.cache_resource
+def tenant_snapshot(tenant_key):
+    return snapshot.Snapshot(tenant_registry().get(tenant_key).database)
+def export_dir(tenant):
+    # Parquet analytics export of one school (export.py); SCHOOL_EXPORT_DIR holds one folder per school
+    return os.path.join(export.EXPORT_DIR, tenant.key)
+def read_connect(tenant_key=None):
+    # For pages that only read: the school's in-memory snapshot (snapshot.py), or the file if it is too large to copy
+    tenant_key = tenant_key or current_tenant().key
+    return tenant_snapshot(tenant_key).connect() or connect(tenant_key)
+@st.cache_resource
+def notification_transport(tenant_key):
+    # SCHOOL_NOTIFY_TRANSPORT, or a JSON-lines file next to the school's database (see notifications.py)
+    database = tenant_registry().get(tenant_key).database
+    return notifications.transport_from_spec(notifications.TRANSPORT, os.path.splitext(database)[0] + "-notifications.jsonl")
+@st.cache_resource
+def notification_worker(tenant_key):
+    # The school's one sender and rate limit; "Send now" wakes it rather than sending itself
+    tenant = tenant_registry().get(tenant_key)
+    return notifications.start_worker(tenant.database, notification_transport(tenant_key), tenant.name)
 # === IMAGE ENCODER ===
+@st.cache_data
 def get_base64_image(image_path):
     try:
         with open(image_path, "rb") as f:
@@ -18,29 +71,15 @@ def get_base64_image(image_path):
     except Exception as e:
         st.error(f"Error loading image {image_path}: {str(e)}")
         return ""
-# === VALIDATION ===
-def is_valid_email(email): return bool(re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', email)) if email else False
-def is_valid_phone(phone): return bool(re.match(r'^\+?\d{10,15}$', phone)) if phone else False
-def is_valid_name_part(name): return bool(name.strip() and len(name.strip()) >= 1 and all(c.isalpha() or c.isspace() for c in name.strip()))
-def is_valid_class(class_name): return bool(class_name.strip())
-def is_valid_subject(subject): return bool(subject.strip() and len(subject.strip()) >= 2)
-def is_valid_date(dob, max_years=18):
-    today = datetime.now().date()
-    min_date = today.replace(year=today.year - max_years)
-    return min_date <= dob <= today if dob else False
-def is_valid_day(day): return day in ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
-def is_valid_period(period): return 1 <= period <= 8
-def is_valid_username(username): return bool(username.strip() and len(username.strip()) >= 3 and username.isalnum())
-def is_valid_password(password): return bool(password.strip() and len(password.strip()) >= 6)
-def is_valid_role(role): return role in ["admin", "headteacher", "teacher"]
-def is_valid_activity(activity): return bool(activity.strip() and len(activity.strip()) >= 2)
-def is_valid_insurance_number(ins): return bool(ins.strip() and len(ins.strip()) >= 5)
 # === DB INIT ===
-def init_db():
-    conn = sqlite3.connect(DATABASE)
+def init_db(database, photo_folder=None):
+    conn = sqlite3.connect(database)
     cursor = conn.cursor()
-    # Drop old students table if exists to recreate with new schema (for migration; in prod, use ALTER)
-    cursor.execute("DROP TABLE IF EXISTS students")
+    maintenance.enable_wal(conn)
+    # Recreate students only while it still has the old single-name schema, so admitted pupils survive restarts
+    student_columns = [row[1] for row in cursor.execute("PRAGMA table_info(students)").fetchall()]
+    if student_columns and 'first_name' not in student_columns:
+        cursor.execute("DROP TABLE students")
     tables = [
         ("users", "username TEXT PRIMARY KEY, password TEXT NOT NULL, role TEXT NOT NULL"),
         ("students", "id INTEGER PRIMARY KEY, first_name TEXT NOT NULL, middle_name TEXT, surname TEXT NOT NULL, class TEXT NOT NULL, dob DATE NOT NULL, gender TEXT NOT NULL, residence TEXT NOT NULL, guardian_name TEXT, guardian_phone TEXT, insurance_number TEXT, registration_date DATE DEFAULT CURRENT_DATE, has_medical_condition BOOLEAN DEFAULT 0, medical_details TEXT, passport_picture_path TEXT"),
@@ -68,35 +107,88 @@ def init_db():
             ('headteacher', 'head123', 'headteacher'),
             ('teacher1', 'teach123', 'teacher')
         ])
+    services.ensure_table_versions(conn)
+    sync.ensure_sync_tables(conn)
+    activities.ensure_activities(conn)
+    analytics.ensure_analytics(conn)
+    fee_analytics.ensure_fee_analytics(conn)
+    workload.ensure_workload_indexes(conn)
+    payroll.ensure_payroll(conn)
+    rollover.ensure_rollover(conn)
+    compliance.ensure_compliance(conn)
+    profiles.ensure_profile(conn)
+    notifications.ensure_notifications(conn)
+    export.ensure_export(conn)
     # Create photo folder
-    os.makedirs(PHOTO_FOLDER, exist_ok=True)
+    if photo_folder:
+        os.makedirs(photo_folder, exist_ok=True)
     conn.commit()
     conn.close()
+@st.cache_resource
+def ensure_db(tenant_key):
+    # Schema setup is needed once per school per process, not on every rerun; so are its maintenance, export and
+    # guardian notification threads
+    tenant = tenant_registry().get(tenant_key)
+    init_db(tenant.database, tenant.photo_folder)
+    maintenance.start_scheduler(tenant.database, folder=tenant.backup_dir)
+    export.start_scheduler(tenant.database, export_dir(tenant))
+    notification_worker(tenant_key)
+# === WARM-UP ===
+@st.cache_resource
+def warm_up():
+    # Begun by the first script run in the process (Streamlit has no boot hook; python startup.py starts sooner).
+    # Runs on its own thread, so the login page does not wait for it
+    phases = [('imports', startup.preload)]
+    for key, tenant in tenant_registry().tenants.items():
+        phases += [(f"assets {key}", lambda t=tenant: len(get_base64_image(os.path.join(t.image_path, "photo1.jpeg")))),
+                   (f"schema {key}", lambda k=key: ensure_db(k)),
+                   (f"snapshot {key}", lambda k=key: tenant_snapshot(k).refresh() is not None),
+                   (f"dashboard {key}", lambda k=key: warm_dashboard(k))]
+    startup.STATE.begin(phases)
+    return startup.STATE
+def warm_dashboard(tenant_key):
+    # The reads behind the first pages: dashboard tiles and totals, student and teacher pickers, class lists,
+    # the timetable and this week's activities
+    conn = read_connect(tenant_key)
+    try:
+        for table, columns in (('students', ['id', 'full_name', 'class']), ('teachers', ['id', 'name']),
+                               ('timetables', None), ('class_teachers', None)):
+            schema.load_frame(conn, table, columns)
+        fee_analytics.totals(conn)
+        generation = services.table_generations(conn, ['activities']).get('activities', 0)
+    finally:
+        conn.close()
+    return len(upcoming_activities(tenant_key, activities.week_start(), generation))
 # === DATA LOADER ===
-def load_data(table):
+def load_data(table, columns=None):
+    # Typed frame of the table (see schema.py); pass columns to read only those. students includes full_name.
     try:
-        conn = sqlite3.connect(DATABASE)
-        df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+        conn = read_connect()
+        df = schema.load_frame(conn, table, columns)
         conn.close()
-        if table == 'students':
-            # Add computed full name for display
-            df['full_name'] = df['first_name'] + ' ' + df['middle_name'].fillna('') + ' ' + df['surname']
         return df
     except: return pd.DataFrame()
 def generate_id(table):
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = connect()
         cursor = conn.cursor()
         cursor.execute(f"SELECT MAX(id) FROM {table}")
         max_id = cursor.fetchone()[0]
         conn.close()
         return (max_id or 0) + 1
     except: return 1
+# === LAZY TABS ===
+def lazy_tabs(labels, key):
+    # st.tabs runs every tab body (and its load_data calls) on each rerun; this renders a tab strip but
+    # returns only the selected label so the page can run just that section. The container's st-key-lazy_tabs_*
+    # class is what the tab-strip CSS in main() matches, so other radios keep the default look
+    with st.container(key=f"lazy_tabs_{key}"):
+        return st.radio("Section", labels, horizontal=True, key=key, label_visibility="collapsed")
 # === AUTH ===
 def authenticate(username, password):
     if not username or not password: return None
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = connect()
         cursor = conn.cursor()
         cursor.execute("SELECT role FROM users WHERE username = ? AND password = ?", (username, password))
         result = cursor.fetchone()
@@ -111,7 +203,7 @@ def authenticate(username, password):
     except: return None
 # === SEARCH PROFILES ===
 def search_profiles(search_query):
-    students = load_data('students')
+    students = load_data('students', ['id', 'full_name', 'class', 'dob', 'gender', 'residence'])
     teachers = load_data('teachers')
    
     student_results = pd.DataFrame()
@@ -130,29 +222,40 @@ def search_profiles(search_query):
             teacher_results = teachers[teachers['name'].str.contains(search_query, case=False, na=False)][['id', 'name', 'subject', 'email', 'phone']]
    
     return student_results, teacher_results
-# === TIMETABLE UTILITIES ===
-def get_available_teachers_for_subject(subject, class_name):
-    teachers = load_data('teachers')
-    assignments = load_data('subject_assignments')
-   
-    if not teachers.empty:
-        available_teachers = teachers[teachers['subject'] == subject]
-        if not assignments.empty:
-            assigned = assignments[(assignments['class'] == class_name) & (assignments['subject'] == subject)]['teacher_id'].tolist()
-            available_teachers = available_teachers[~available_teachers['id'].isin(assigned)]
-        return available_teachers[['id', 'name']].to_dict('records')
-    return []
-def check_conflict(class_name, day, period, teacher_id):
-    timetable = load_data('timetables')
-    if not timetable.empty and teacher_id:
-        conflicts = timetable[
-            (timetable['day'] == day) &
-            (timetable['period'] == period) &
-            (timetable['teacher_id'] == teacher_id) &
-            (timetable['class'] != class_name)
-        ]
-        return not conflicts.empty
-    return False
+@st.fragment
+def dashboard_search():
+    # Runs as its own fragment: searching reruns only this block, not the dashboard tiles or the rest of the app
+    st.markdown('<div class="search-bar-container">', unsafe_allow_html=True)
+    with st.form("dashboard_search_form"):
+        search_query = st.text_input("Search Student or Teacher (ID or Name)", key="dashboard_search")
+        submitted = st.form_submit_button("Search", key="dashboard_search_btn")
+    if submitted:
+        if search_query:
+            student_results, teacher_results = search_profiles(search_query)
+            if not student_results.empty:
+                st.markdown("<h3 style='color:#ffd700;'>Student Profiles</h3>", unsafe_allow_html=True)
+                st.dataframe(student_results)
+            if not teacher_results.empty:
+                st.markdown("<h3 style='color:#ffd700;'>Teacher Profiles</h3>", unsafe_allow_html=True)
+                st.dataframe(teacher_results)
+            if student_results.empty and teacher_results.empty:
+                st.warning("No matching profiles found")
+        else:
+            st.error("Please enter a search query")
+    st.markdown('</div>', unsafe_allow_html=True)
+# === SERVICE CALLS ===
+def run_service(func, *args, **kwargs):
+    # Runs a services.* function on a fresh connection; rule violations are shown to the user and return None
+    conn = connect()
+    try:
+        return func(conn, *args, **kwargs)
+    except services.ServiceError as e:
+        st.error(str(e))
+    finally:
+        conn.close()
+def ui_client():
+    # Client ID stamped on marks made in the app, so sync conflict reports show who made them
+    return f"ui:{st.session_state.get('username') or 'anonymous'}"
 # === VIEW TIMETABLE ===
 def view_timetable():
     timetable = load_data('timetables')
@@ -162,77 +265,95 @@ def view_timetable():
     else:
         st.info("No timetable records available")
 # === ACTIVITIES FUNCTIONS ===
+REPEAT_LABELS = {None: "Does not repeat", 'weekly': "Weekly", 'fortnightly': "Fortnightly", 'monthly': "Monthly"}
+@st.cache_data(max_entries=8)
+def upcoming_activities(tenant_key, week, generation):
+    # This week and next; `generation` (bumped by triggers on every activities write) makes any change a cache miss
+    conn = connect(tenant_key)
+    try:
+        return activities.occurrences(conn, week, week + timedelta(days=13))
+    finally:
+        conn.close()
+@st.cache_data(max_entries=2)
+def activities_ics(tenant_key, generation):
+    conn = connect(tenant_key)
+    try:
+        return activities.to_ics(conn)
+    finally:
+        conn.close()
+def activities_generation():
+    conn = connect()
+    try:
+        return services.table_generations(conn, ['activities']).get('activities', 0)
+    finally:
+        conn.close()
 def display_activities(role='view'):
-    activities = load_data('activities')
-    if not activities.empty:
-        activities['date'] = pd.to_datetime(activities['date']).dt.date
-        st.markdown("<h4 style='color:#ffd700;'>Weekly Activities</h4>", unsafe_allow_html=True)
-        st.dataframe(activities.sort_values('date', ascending=False))
+    upcoming = upcoming_activities(current_tenant().key, activities.week_start(), activities_generation())
+    if not upcoming.empty:
+        st.markdown("<h4 style='color:#ffd700;'>This Week and Next</h4>", unsafe_allow_html=True)
+        st.dataframe(upcoming.drop(columns='until').assign(repeat=upcoming['repeat'].map(REPEAT_LABELS)), hide_index=True)
         if role == 'headteacher':
-            return activities
+            return upcoming
     else:
-        st.info("No activities scheduled yet")
+        st.info("No activities in the next two weeks")
         return pd.DataFrame()
+def activity_form(prefix, current=None):
+    # Shared fields of the add/update forms -> (name, date, description, repeat, until)
+    current = current or {}
+    name = st.text_input("Activity Name", value=current.get('activity', ""), key=f"{prefix}_activity_name")
+    date = st.date_input("Date", value=pd.to_datetime(current['date']).date() if current.get('date') else "today", key=f"{prefix}_activity_date")
+    description = st.text_area("Description", value=current.get('description') or "", key=f"{prefix}_activity_desc")
+    repeat = st.selectbox("Repeats", list(REPEAT_LABELS), index=list(REPEAT_LABELS).index(current.get('repeat')),
+                          format_func=REPEAT_LABELS.get, key=f"{prefix}_activity_repeat")
+    until = st.date_input("Repeat until (optional)", value=pd.to_datetime(current['until']).date() if current.get('until') else None,
+                          key=f"{prefix}_activity_until")
+    return name, date, description, repeat, until
 def headteacher_manage_activities():
-    tab1, tab2, tab3 = st.tabs(["Add Activity", "Update Activity", "View Activities"])
+    section = lazy_tabs(["Add Activity", "Update Activity", "View Activities"], "activities_section")
    
-    with tab1:
+    if section == "Add Activity":
         st.markdown("<h3 style='color:#ffd700;'>Add Weekly Activity</h3>", unsafe_allow_html=True)
-        activity = st.text_input("Activity Name", key="add_activity_name")
-        date = st.date_input("Date", key="add_activity_date")
-        description = st.text_area("Description", key="add_activity_desc")
-        if st.button("Add Activity", key="add_activity_btn"):
-            if not is_valid_activity(activity):
-                st.error("Invalid activity name")
-            else:
-                conn = sqlite3.connect(DATABASE)
-                cursor = conn.cursor()
-                new_id = generate_id('activities')
-                try:
-                    cursor.execute("INSERT INTO activities VALUES (?, ?, ?, ?)",
-                                 (new_id, activity.strip(), date, description.strip() if description else None))
-                    conn.commit()
-                    st.success("Activity added")
-                except sqlite3.IntegrityError:
-                    st.error("Activity for this date already exists")
-                conn.close()
+        with st.form("add_activity_form"):
+            fields = activity_form("add")
+            submitted = st.form_submit_button("Add Activity", key="add_activity_btn")
+        if submitted and run_service(activities.add_activity, *fields) is not None:
+            st.success("Activity added")
    
-    with tab2:
+    elif section == "Update Activity":
         st.markdown("<h3 style='color:#ffd700;'>Update Activity</h3>", unsafe_allow_html=True)
-        activities = load_data('activities')
-        if not activities.empty:
-            activity_id = st.number_input("Activity ID", min_value=1, step=1, key="update_activity_id")
-            if activity_id in activities['id'].values:
-                act = activities[activities['id'] == activity_id].iloc[0]
-                new_activity = st.text_input("Activity Name", value=act['activity'], key="update_activity_name")
-                new_date = st.date_input("Date", value=pd.to_datetime(act['date']).date(), key="update_activity_date")
-                new_desc = st.text_area("Description", value=act['description'] if pd.notna(act['description']) else "", key="update_activity_desc")
-                if st.button("Update Activity", key="update_activity_btn"):
-                    if not is_valid_activity(new_activity):
-                        st.error("Invalid activity name")
-                    else:
-                        conn = sqlite3.connect(DATABASE)
-                        cursor = conn.cursor()
-                        cursor.execute("UPDATE activities SET activity=?, date=?, description=? WHERE id=?",
-                                     (new_activity.strip(), new_date, new_desc.strip() if new_desc else None, activity_id))
-                        conn.commit()
-                        conn.close()
-                        st.success("Activity updated")
-            else:
-                st.warning("Activity ID not found")
+        activity_id = st.number_input("Activity ID", min_value=1, step=1, key="update_activity_id")
+        current = run_service(activities.get_activity, activity_id)
+        if current:
+            with st.form("update_activity_form"):
+                fields = activity_form("update", current)
+                submitted = st.form_submit_button("Update Activity", key="update_activity_btn")
+            if submitted and run_service(activities.update_activity, activity_id, *fields) is not None:
+                st.success("Activity updated")
         else:
-            st.info("No activities to update")
+            st.warning("Activity ID not found")
    
-    with tab3:
+    elif section == "View Activities":
         display_activities('headteacher')
+        st.markdown("<h4 style='color:#ffd700;'>Calendar</h4>", unsafe_allow_html=True)
+        week = activities.week_start()
+        start, end = st.columns(2)
+        start = start.date_input("From", week, key="activities_from")
+        end = end.date_input("To", week + timedelta(days=27), key="activities_to")
+        listed = run_service(activities.occurrences, start, end)
+        if listed is not None:
+            st.dataframe(listed, hide_index=True) if not listed.empty else st.info("No activities in this period")
+        st.download_button("Download Calendar (.ics)", activities_ics(current_tenant().key, activities_generation()), "school_activities.ics", "text/calendar", key="download_activities_ics")
 # === MAIN ===
 def main():
-    init_db()
+    state = warm_up()
+    if "health" in st.query_params:
+        st.json(state.status())
+        return
     if 'dark_mode' not in st.session_state:
         st.session_state.dark_mode = True
     def toggle_dark_mode():
         st.session_state.dark_mode = not st.session_state.dark_mode
-    photo1_base64 = get_base64_image(os.path.join(IMAGE_PATH, "photo1.jpeg"))
+    photo1_base64 = get_base64_image(os.path.join(current_tenant().image_path, "photo1.jpeg"))
     dark_mode = st.session_state.dark_mode
     bg_gradient = "linear-gradient(135deg, #1a1a1a, #2b1a00, #331c00)" if dark_mode else "linear-gradient(135deg, #f5e6c8, #e6d7a8, #d4c28a)"
     text_color = "#f5e6c8" if dark_mode else "#1a1a1a"
@@ -341,6 +462,23 @@ def main():
                 border-bottom: none;
                 box-shadow: 0 -2px 10px rgba(255,215,0,0.3);
             }}
+            [class*="st-key-lazy_tabs_"] [role="radiogroup"] {{
+                gap: 6px;
+                border-bottom: 1px solid rgba(255,215,0,0.3);
+            }}
+            [class*="st-key-lazy_tabs_"] [role="radiogroup"] label {{
+                background: rgba(255, 215, 0, 0.15);
+                color: {text_color};
+                border-radius: 12px 12px 0 0;
+                padding: 0.4rem 0.9rem;
+                font-weight: 600;
+                border: 1px solid rgba(255,215,0,0.3);
+            }}
+            [class*="st-key-lazy_tabs_"] [role="radiogroup"] label:has(input:checked) {{
+                background: rgba(255, 215, 0, 0.35);
+                color: white;
+                box-shadow: 0 -2px 10px rgba(255,215,0,0.3);
+            }}
             .css-1d391kg {{
                 background: rgba(20, 20, 20, 0.95);
                 backdrop-filter: blur(12px);
@@ -447,9 +585,17 @@ def main():
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             st.markdown("<h2 style='text-align:center; color:#ffd700;'>Login</h2>", unsafe_allow_html=True)
-            username = st.text_input("Username", key="login_username")
-            password = st.text_input("Password", type="password", key="login_password")
-            if st.button("Login", use_container_width=True, key="login_button"):
+            with st.form("login_form"):
+                schools = tenant_registry().tenants
+                school = st.selectbox("School", list(schools), format_func=lambda k: schools[k].name, key="login_tenant",
+                                      disabled=len(schools) == 1)
+                username = st.text_input("Username", key="login_username")
+                password = st.text_input("Password", type="password", key="login_password")
+                submitted = st.form_submit_button("Login", use_container_width=True, key="login_button")
+            if submitted:
+                # Users are per school, so the school is chosen before the credentials are checked
+                st.session_state.tenant = school
+                ensure_db(school)
                 role = authenticate(username, password)
                 if role:
                     st.session_state.logged_in = True
@@ -459,36 +605,26 @@ def main():
                 else:
                     st.error("Invalid credentials")
     else:
-        st.sidebar.image(os.path.join(IMAGE_PATH, "logo.jpeg"), use_container_width=True, caption="D.O Buadu")
+        tenant = current_tenant()
+        ensure_db(tenant.key)
+        st.sidebar.image(os.path.join(tenant.image_path, "logo.jpeg"), use_container_width=True, caption=tenant.name)
         st.sidebar.markdown("---")
         st.sidebar.markdown("<h3 style='color:#ffd700; text-align:center;'>Navigation</h3>", unsafe_allow_html=True)
         def dashboard_page(title, icon, content_func):
             st.markdown('<div class="glass-card">', unsafe_allow_html=True)
             st.markdown(f'<h2 class="section-header"><i class="fas fa-{icon}"></i> {title}</h2>', unsafe_allow_html=True)
-            content_func()
+            # Widgets inside a page rerun only the page fragment; the CSS, header and sidebar above are left alone
+            st.fragment(content_func)()
             st.markdown('</div>', unsafe_allow_html=True)
         def show_magic_box_stats():
-            students = load_data('students')
-            teachers = load_data('teachers')
-            fees = load_data('fees')
-            collected = fees['paid_amount'].sum() if 'paid_amount' in fees.columns and not fees.empty else 0
-            arrears = (fees['fee_amount'] - fees['paid_amount']).sum() if 'fee_amount' in fees.columns and 'paid_amount' in fees.columns and not fees.empty else 0
-            st.markdown('<div class="search-bar-container">', unsafe_allow_html=True)
-            search_query = st.text_input("Search Student or Teacher (ID or Name)", key="dashboard_search")
-            if st.button("Search", key="dashboard_search_btn"):
-                if search_query:
-                    student_results, teacher_results = search_profiles(search_query)
-                    if not student_results.empty:
-                        st.markdown("<h3 style='color:#ffd700;'>Student Profiles</h3>", unsafe_allow_html=True)
-                        st.dataframe(student_results)
-                    if not teacher_results.empty:
-                        st.markdown("<h3 style='color:#ffd700;'>Teacher Profiles</h3>", unsafe_allow_html=True)
-                        st.dataframe(teacher_results)
-                    if student_results.empty and teacher_results.empty:
-                        st.warning("No matching profiles found")
-                else:
-                    st.error("Please enter a search query")
-            st.markdown('</div>', unsafe_allow_html=True)
+            students = load_data('students', ['class'])
+            students = students[students['class'] != rollover.ALUMNI_CLASS]
+            teachers = load_data('teachers', ['id'])
+            conn = read_connect()
+            billed, collected = fee_analytics.totals(conn)
+            conn.close()
+            arrears = billed - collected
+            dashboard_search()
             st.markdown('<div class="magic-box-grid">', unsafe_allow_html=True)
             st.markdown(f'''
                 <div class="magic-box-tile">
@@ -517,13 +653,15 @@ def main():
             display_activities(st.session_state.role)
         # === USER ACCOUNT MANAGEMENT ===
         def admin_user_accounts():
-            tab1, tab2 = st.tabs(["Add User", "Delete User"])
-            with tab1:
+            section = lazy_tabs(["Add User", "Delete User"], "user_accounts_section")
+            if section == "Add User":
                 st.markdown("<h3 style='color:#ffd700;'>Add User Account</h3>", unsafe_allow_html=True)
-                username = st.text_input("Username", key="add_user_username")
-                password = st.text_input("Password", type="password", key="add_user_password")
-                role = st.selectbox("Role", ["admin", "headteacher", "teacher"], key="add_user_role")
-                if st.button("Add User", key="add_user_button"):
+                with st.form("add_user_form"):
+                    username = st.text_input("Username", key="add_user_username")
+                    password = st.text_input("Password", type="password", key="add_user_password")
+                    role = st.selectbox("Role", ["admin", "headteacher", "teacher"], key="add_user_role")
+                    submitted = st.form_submit_button("Add User", key="add_user_button")
+                if submitted:
                     if not is_valid_username(username):
                         st.error("Username must be at least 3 characters and alphanumeric")
                     elif not is_valid_password(password):
@@ -531,7 +669,7 @@ def main():
                     elif not is_valid_role(role):
                         st.error("Invalid role")
                     else:
-                        conn = sqlite3.connect(DATABASE)
+                        conn = connect()
                         cursor = conn.cursor()
                         try:
                             cursor.execute("INSERT INTO users VALUES (?, ?, ?)", (username.strip(), password.strip(), role))
@@ -540,17 +678,19 @@ def main():
                         except sqlite3.IntegrityError:
                             st.error("Username already exists")
                         conn.close()
-            with tab2:
+            elif section == "Delete User":
                 st.markdown("<h3 style='color:#ffd700;'>Delete User Account</h3>", unsafe_allow_html=True)
-                username = st.text_input("Username", key="delete_user_username")
-                if st.button("Delete User", key="delete_user_button"):
-                    users = load_data('users')
+                with st.form("delete_user_form"):
+                    username = st.text_input("Username", key="delete_user_username")
+                    submitted = st.form_submit_button("Delete User", key="delete_user_button")
+                if submitted:
+                    users = load_data('users', ['username'])
                     if username not in users['username'].values:
                         st.error("Username not found")
                     elif username == st.session_state.get('username', ''): # Prevent self-deletion
                         st.error("Cannot delete your own account")
                     else:
-                        conn = sqlite3.connect(DATABASE)
+                        conn = connect()
                         cursor = conn.cursor()
                         cursor.execute("DELETE FROM users WHERE username = ?", (username,))
                         conn.commit()
@@ -558,54 +698,34 @@ def main():
                         st.success(f"User {username} deleted")
         # === TIMETABLE MANAGEMENT ===
         def headteacher_timetable_management():
-            tab1, tab2, tab3, tab4 = st.tabs([
+            section = lazy_tabs([
                 "Prepare Timetable", "Assign Subject Teacher",
                 "Update Timetable", "Update Assigned Teacher"
-            ])
-            with tab1:
+            ], "timetable_section")
+            if section == "Prepare Timetable":
                 st.markdown("<h3 style='color:#ffd700;'>Prepare Timetable</h3>", unsafe_allow_html=True)
                 class_name = st.text_input("Class", key="timetable_class")
                 day = st.selectbox("Day", ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"], key="timetable_day")
                 period = st.number_input("Period (1-8)", min_value=1, max_value=8, step=1, key="timetable_period")
                 subject = st.text_input("Subject", key="timetable_subject")
-                teachers = load_data('teachers')
+                teachers = load_data('teachers', ['id', 'name'])
                 teacher_options = [(t['id'], t['name']) for t in teachers.to_dict('records')] if not teachers.empty else []
                 teacher_id = st.selectbox("Teacher (Optional)", ["None"] + [f"{t[1]} (ID: {t[0]})" for t in teacher_options], key="timetable_teacher")
                 teacher_id = None if teacher_id == "None" else int(teacher_id.split("ID: ")[1][:-1]) if teacher_id else None
                
                 if st.button("Add Slot", key="add_timetable_slot"):
-                    if not is_valid_class(class_name):
-                        st.error("Invalid class name")
-                    elif not is_valid_day(day):
-                        st.error("Invalid day")
-                    elif not is_valid_period(period):
-                        st.error("Period must be between 1 and 8")
-                    elif not is_valid_subject(subject):
-                        st.error("Invalid subject")
-                    elif teacher_id and check_conflict(class_name, day, period, teacher_id):
-                        st.error("Teacher is already assigned to another class at this time")
-                    else:
-                        conn = sqlite3.connect(DATABASE)
-                        cursor = conn.cursor()
-                        new_id = generate_id('timetables')
-                        try:
-                            cursor.execute("INSERT INTO timetables VALUES (?, ?, ?, ?, ?, ?)",
-                                         (new_id, class_name.strip(), day, period, subject.strip(), teacher_id))
-                            conn.commit()
-                            st.success("Timetable slot added")
-                        except sqlite3.IntegrityError:
-                            st.error("This class already has a subject scheduled for this day and period")
-                        conn.close()
+                    if run_service(services.add_timetable_slot, class_name, day, period, subject, teacher_id):
+                        st.success("Timetable slot added")
                
                 timetable = load_data('timetables')
                 if not timetable.empty:
                     st.markdown("<h4 style='color:#ffd700;'>Current Timetable</h4>", unsafe_allow_html=True)
                     st.dataframe(timetable)
-            with tab2:
+            elif section == "Assign Subject Teacher":
                 st.markdown("<h3 style='color:#ffd700;'>Assign Subject Teacher</h3>", unsafe_allow_html=True)
                 class_name = st.text_input("Class", key="assign_class")
                 subject = st.text_input("Subject", key="assign_subject")
-                teachers = load_data('teachers')
+                teachers = load_data('teachers', ['id', 'name'])
                 teacher_options = [(t['id'], t['name']) for t in teachers.to_dict('records')] if not teachers.empty else []
                 teacher_id = st.selectbox("Teacher", [f"{t[1]} (ID: {t[0]})" for t in teacher_options], key="assign_teacher")
                 teacher_id = int(teacher_id.split("ID: ")[1][:-1]) if teacher_id else None
@@ -618,7 +738,7 @@ def main():
                     elif not teacher_id:
                         st.error("Please select a teacher")
                     else:
-                        conn = sqlite3.connect(DATABASE)
+                        conn = connect()
                         cursor = conn.cursor()
                         new_id = generate_id('subject_assignments')
                         try:
@@ -634,7 +754,7 @@ def main():
                 if not assignments.empty:
                     st.markdown("<h4 style='color:#ffd700;'>Current Assignments</h4>", unsafe_allow_html=True)
                     st.dataframe(assignments)
-            with tab3:
+            elif section == "Update Timetable":
                 st.markdown("<h3 style='color:#ffd700;'>Update Timetable</h3>", unsafe_allow_html=True)
                 timetable = load_data('timetables')
                 slot_id = st.number_input("Timetable Slot ID", min_value=1, step=1, key="update_timetable_id")
@@ -646,7 +766,7 @@ def main():
                                       key="update_timetable_day")
                     period = st.number_input("Period (1-8)", min_value=1, max_value=8, step=1, value=slot['period'], key="update_timetable_period")
                     subject = st.text_input("Subject", value=slot['subject'], key="update_timetable_subject")
-                    teachers = load_data('teachers')
+                    teachers = load_data('teachers', ['id', 'name'])
                     teacher_options = [(t['id'], t['name']) for t in teachers.to_dict('records')] if not teachers.empty else []
                     current_teacher = f"{teachers[teachers['id'] == slot['teacher_id']]['name'].values[0]} (ID: {slot['teacher_id']})" if pd.notna(slot['teacher_id']) and not teachers[teachers['id'] == slot['teacher_id']].empty else "None"
                     teacher_id = st.selectbox("Teacher (Optional)", ["None"] + [f"{t[1]} (ID: {t[0]})" for t in teacher_options],
@@ -655,34 +775,15 @@ def main():
                     teacher_id = None if teacher_id == "None" else int(teacher_id.split("ID: ")[1][:-1]) if teacher_id else None
                    
                     if st.button("Update Slot", key="update_timetable_slot"):
-                        if not is_valid_class(class_name):
-                            st.error("Invalid class name")
-                        elif not is_valid_day(day):
-                            st.error("Invalid day")
-                        elif not is_valid_period(period):
-                            st.error("Period must be between 1 and 8")
-                        elif not is_valid_subject(subject):
-                            st.error("Invalid subject")
-                        elif teacher_id and check_conflict(class_name, day, period, teacher_id):
-                            st.error("Teacher is already assigned to another class at this time")
-                        else:
-                            conn = sqlite3.connect(DATABASE)
-                            cursor = conn.cursor()
-                            try:
-                                cursor.execute("UPDATE timetables SET class=?, day=?, period=?, subject=?, teacher_id=? WHERE id=?",
-                                             (class_name.strip(), day, period, subject.strip(), teacher_id, slot_id))
-                                conn.commit()
-                                st.success("Timetable slot updated")
-                            except sqlite3.IntegrityError:
-                                st.error("This class already has a subject scheduled for this day and period")
-                            conn.close()
+                        if run_service(services.update_timetable_slot, slot_id, class_name, day, period, subject, teacher_id):
+                            st.success("Timetable slot updated")
                 else:
                     st.warning("Slot ID not found")
                
                 if not timetable.empty:
                     st.markdown("<h4 style='color:#ffd700;'>Current Timetable</h4>", unsafe_allow_html=True)
                     st.dataframe(timetable)
-            with tab4:
+            elif section == "Update Assigned Teacher":
                 st.markdown("<h3 style='color:#ffd700;'>Update Assigned Teacher</h3>", unsafe_allow_html=True)
                 assignments = load_data('subject_assignments')
                 assignment_id = st.number_input("Assignment ID", min_value=1, step=1, key="update_assignment_id")
@@ -690,7 +791,7 @@ def main():
                     assignment = assignments[assignments['id'] == assignment_id].iloc[0]
                     class_name = st.text_input("Class", value=assignment['class'], key="update_assignment_class")
                     subject = st.text_input("Subject", value=assignment['subject'], key="update_assignment_subject")
-                    teachers = load_data('teachers')
+                    teachers = load_data('teachers', ['id', 'name'])
                     teacher_options = [(t['id'], t['name']) for t in teachers.to_dict('records')] if not teachers.empty else []
                     current_teacher = f"{teachers[teachers['id'] == assignment['teacher_id']]['name'].values[0]} (ID: {assignment['teacher_id']})"
                     teacher_id = st.selectbox("Teacher", [f"{t[1]} (ID: {t[0]})" for t in teacher_options],
@@ -706,7 +807,7 @@ def main():
                         elif not teacher_id:
                             st.error("Please select a teacher")
                         else:
-                            conn = sqlite3.connect(DATABASE)
+                            conn = connect()
                             cursor = conn.cursor()
                             try:
                                 cursor.execute("UPDATE subject_assignments SET class=?, subject=?, teacher_id=? WHERE id=?",
@@ -733,22 +834,27 @@ def main():
             elif page == "View Timetable": dashboard_page("View Timetable", "calendar-alt", view_timetable)
         elif st.session_state.role == 'headteacher':
             page = st.sidebar.selectbox("Menu", [
-                "Dashboard", "View Student Profiles", "Check Student Attendance", "Check Student Results",
-                "View Teacher Profiles", "Check Teacher Attendance", "Check Registers Marked", "Check Reports",
-                "View Fees Records", "Print Fees Report", "Fee Payment", "Add Class",
+                "Dashboard", "View Student Profiles", "Student 360", "Check Student Attendance", "Check Student Results", "Results Analytics",
+                "View Teacher Profiles", "Check Teacher Attendance", "Workload & Cover", "Check Registers Marked", "Check Reports",
+                "Parent Notifications", "View Fees Records", "Fee Analytics", "Print Fees Report", "Fee Payment", "Add Class",
                 "Assign Class Teacher", "Mark Teacher Attendance", "Bulk Teacher Attendance",
                 "Bulk Student Attendance", "Bulk Student Attendance by Class", "Reports",
                 "Timetable Management", "Manage Weekly Activities"
             ], key="headteacher_menu")
             if page == "Dashboard": dashboard_page("Headteacher Overview", "school", show_magic_box_stats)
             elif page == "View Student Profiles": dashboard_page("Student Profiles", "user-graduate", lambda: st.dataframe(load_data('students')))
+            elif page == "Student 360": dashboard_page("Student 360", "id-badge", lambda: student_360("ht"))
             elif page == "Check Student Attendance": dashboard_page("Student Attendance", "calendar-check", headteacher_attendance)
             elif page == "Check Student Results": dashboard_page("Student Results", "clipboard-list", headteacher_results)
+            elif page == "Results Analytics": dashboard_page("Results Analytics", "chart-line", headteacher_results_analytics)
             elif page == "View Teacher Profiles": dashboard_page("Teacher Profiles", "chalkboard-teacher", lambda: st.dataframe(load_data('teachers')))
             elif page == "Check Teacher Attendance": dashboard_page("Teacher Attendance", "user-clock", headteacher_teacher_attendance)
+            elif page == "Workload & Cover": dashboard_page("Workload & Cover", "people-arrows", headteacher_workload)
             elif page == "Check Registers Marked": dashboard_page("Registers Marked", "book", headteacher_registers)
             elif page == "Check Reports": dashboard_page("Teacher Reports", "file-alt", headteacher_reports_tab)
+            elif page == "Parent Notifications": dashboard_page("Parent Notifications", "sms", headteacher_notifications)
             elif page == "View Fees Records": dashboard_page("Fees Records", "receipt", headteacher_fees_records)
+            elif page == "Fee Analytics": dashboard_page("Fee Analytics", "chart-pie", fee_analytics_view)
             elif page == "Print Fees Report": dashboard_page("Print Fees Report", "print", headteacher_print_fees)
             elif page == "Fee Payment": dashboard_page("Fee Payment", "money-check-alt", headteacher_fee_payment)
             elif page == "Add Class": dashboard_page("Add Class", "plus-circle", headteacher_add_class)
@@ -771,34 +877,29 @@ def main():
             st.rerun()
 # === ADMIN: STUDENTS ===
 def admin_students():
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-        "Add Student", "Delete Student", "Update Profile",
-        "Check Attendance", "Check Results", "Print Report Card"
-    ])
-    with tab1:
+    section = lazy_tabs([
+        "Add Student", "Delete Student", "Update Profile", "Student 360",
+        "Check Attendance", "Check Results", "Print Report Card", "ID Cards", "Bulk Admission", "Year Rollover"
+    ], "students_section")
+    if section == "Add Student":
         st.markdown("<h3 style='color:#ffd700;'>Add Student</h3>", unsafe_allow_html=True)
-        first_name = st.text_input("First Name", key="add_first_name")
-        middle_name = st.text_input("Middle Name (Optional)", key="add_middle_name")
-        surname = st.text_input("Surname", key="add_surname")
-        class_ = st.text_input("Class", key="add_student_class")
-        dob = st.date_input("Date of Birth", key="add_student_dob")
-        gender = st.selectbox("Gender", ["Male", "Female", "Other"], key="add_student_gender")
-        residence = st.text_area("Residence", key="add_residence")
-        guardian_name = st.text_input("Guardian Name", key="add_guardian_name")
-        guardian_phone = st.text_input("Guardian Phone", key="add_guardian_phone")
-        insurance_number = st.text_input("Insurance Number", key="add_insurance")
-        has_medical = st.checkbox("Has Medical Condition?", key="add_has_medical")
-        medical_details = st.text_area("Medical Details", key="add_medical_details") if has_medical else ""
-        uploaded_file = st.file_uploader("Upload Passport Picture (JPG/PNG)", type=['jpg', 'jpeg', 'png'], key="add_photo")
-        photo_path = None
-        if uploaded_file is not None:
-            new_id = generate_id('students')
-            photo_filename = f"{new_id}.{uploaded_file.name.split('.')[-1]}"
-            photo_path = os.path.join(PHOTO_FOLDER, photo_filename)
-            with open(photo_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            st.success(f"Photo uploaded: {photo_filename}")
-        if st.button("Add Student", key="add_student_button"):
+        # A form only reruns on submit, so typing into the fields costs nothing until "Add Student"
+        with st.form("add_student_form"):
+            first_name = st.text_input("First Name", key="add_first_name")
+            middle_name = st.text_input("Middle Name (Optional)", key="add_middle_name")
+            surname = st.text_input("Surname", key="add_surname")
+            class_ = st.text_input("Class", key="add_student_class")
+            dob = st.date_input("Date of Birth", key="add_student_dob")
+            gender = st.selectbox("Gender", ["Male", "Female", "Other"], key="add_student_gender")
+            residence = st.text_area("Residence", key="add_residence")
+            guardian_name = st.text_input("Guardian Name", key="add_guardian_name")
+            guardian_phone = st.text_input("Guardian Phone", key="add_guardian_phone")
+            insurance_number = st.text_input("Insurance Number", key="add_insurance")
+            has_medical = st.checkbox("Has Medical Condition?", key="add_has_medical")
+            medical_details = st.text_area("Medical Details (if any)", key="add_medical_details")
+            uploaded_file = st.file_uploader("Upload Passport Picture (JPG/PNG)", type=['jpg', 'jpeg', 'png'], key="add_photo")
+            submitted = st.form_submit_button("Add Student", key="add_student_button")
+        if submitted:
             if not is_valid_name_part(first_name): st.error("Invalid first name")
             elif not is_valid_name_part(surname): st.error("Invalid surname")
             elif not is_valid_class(class_): st.error("Invalid class")
@@ -809,10 +910,15 @@ def admin_students():
             elif insurance_number and not is_valid_insurance_number(insurance_number): st.error("Invalid insurance number")
             elif has_medical and not medical_details.strip(): st.error("Medical details required if condition exists")
             else:
-                conn = sqlite3.connect(DATABASE)
+                conn = connect()
                 cursor = conn.cursor()
                 new_id = generate_id('students')
                 reg_date = datetime.now().date()
+                photo_path = None
+                if uploaded_file is not None:
+                    photo_path = os.path.join(current_tenant().photo_folder, f"{new_id}.{uploaded_file.name.split('.')[-1]}")
+                    with open(photo_path, "wb") as f:
+                        f.write(uploaded_file.getbuffer())
                 cursor.execute("""
                     INSERT INTO students
                     (id, first_name, middle_name, surname, class, dob, gender, residence, guardian_name, guardian_phone,
@@ -823,61 +929,56 @@ def admin_students():
                       guardian_phone.strip() if guardian_phone else None, insurance_number.strip() if insurance_number else None,
                       reg_date, 1 if has_medical else 0, medical_details.strip() if has_medical else None, photo_path))
                 # Auto-create fee row
-                class_fee_data = load_data('fees')
-                class_fee_row = class_fee_data[class_fee_data['class'] == class_]
-                fee_amount = class_fee_row['fee_amount'].values[0] if not class_fee_row.empty else 0.0
-                cursor.execute("INSERT INTO fees (class, fee_amount, student_id, paid_amount) VALUES (?, ?, ?, ?)",
-                               (class_.strip(), fee_amount, new_id, 0.0))
+                services.insert_student_fees(conn, new_id, new_id)
                 conn.commit()
                 conn.close()
                 st.success(f"Student {first_name} {surname} added with ID {new_id}")
-    with tab2:
-        student_id = st.number_input("Student ID", min_value=1, step=1, key="delete_student_id")
-        if st.button("Delete", key="delete_student_button"):
-            students = load_data('students')
-            if student_id not in students['id'].values:
+    elif section == "Delete Student":
+        with st.form("delete_student_form"):
+            student_id = st.number_input("Student ID", min_value=1, step=1, key="delete_student_id")
+            submitted = st.form_submit_button("Delete", key="delete_student_button")
+        if submitted:
+            conn = connect()
+            cursor = conn.cursor()
+            row = cursor.execute("SELECT passport_picture_path FROM students WHERE id = ?", (student_id,)).fetchone()
+            if row is None:
                 st.error("Student not found")
             else:
                 # Delete photo if exists
-                student = students[students['id'] == student_id].iloc[0]
-                if student['passport_picture_path'] and os.path.exists(student['passport_picture_path']):
-                    os.remove(student['passport_picture_path'])
-                conn = sqlite3.connect(DATABASE)
-                cursor = conn.cursor()
+                if row[0] and os.path.exists(row[0]):
+                    os.remove(row[0])
                 cursor.execute("DELETE FROM students WHERE id = ?", (student_id,))
                 conn.commit()
-                conn.close()
                 st.success("Student deleted")
-    with tab3:
+            conn.close()
+    elif section == "Update Profile":
         st.markdown("<h3 style='color:#ffd700;'>Update Student Profile</h3>", unsafe_allow_html=True)
         student_id = st.number_input("Student ID", min_value=1, step=1, key="update_student_id")
-        students = load_data('students')
-        if student_id in students['id'].values:
-            s = students[students['id'] == student_id].iloc[0]
-            first_name = st.text_input("First Name", value=s['first_name'], key="update_first_name")
-            middle_name = st.text_input("Middle Name", value=s['middle_name'] if pd.notna(s['middle_name']) else "", key="update_middle_name")
-            surname = st.text_input("Surname", value=s['surname'], key="update_surname")
-            class_ = st.text_input("Class", value=s['class'], key="update_class")
-            dob = st.date_input("DOB", value=pd.to_datetime(s['dob']).date(), key="update_dob")
-            gender = st.selectbox("Gender", ["Male", "Female", "Other"], index=["Male", "Female", "Other"].index(s['gender']), key="update_gender")
-            residence = st.text_area("Residence", value=s['residence'], key="update_residence")
-            guardian_name = st.text_input("Guardian Name", value=s['guardian_name'] if pd.notna(s['guardian_name']) else "", key="update_guardian_name")
-            guardian_phone = st.text_input("Guardian Phone", value=s['guardian_phone'] if pd.notna(s['guardian_phone']) else "", key="update_guardian_phone")
-            insurance_number = st.text_input("Insurance Number", value=s['insurance_number'] if pd.notna(s['insurance_number']) else "", key="update_insurance")
-            has_medical = st.checkbox("Has Medical Condition?", value=bool(s['has_medical_condition']), key="update_has_medical")
-            medical_details = st.text_area("Medical Details", value=s['medical_details'] if pd.notna(s['medical_details']) else "", key="update_medical_details") if has_medical else ""
+        conn = connect()
+        students = pd.read_sql_query("SELECT * FROM students WHERE id = ?", conn, params=(student_id,))
+        conn.close()
+        if not students.empty:
+            s = students.iloc[0]
             # Photo update
             current_photo = s['passport_picture_path'] if pd.notna(s['passport_picture_path']) else None
             if current_photo:
                 st.image(current_photo, caption="Current Photo", width=100)
-            uploaded_file = st.file_uploader("Update Passport Picture (JPG/PNG)", type=['jpg', 'jpeg', 'png'], key="update_photo")
-            new_photo_path = current_photo
-            if uploaded_file is not None:
-                new_photo_path = os.path.join(PHOTO_FOLDER, f"{student_id}.{uploaded_file.name.split('.')[-1]}")
-                with open(new_photo_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                st.success("Photo updated")
-            if st.button("Update", key="update_student_button"):
+            with st.form("update_student_form"):
+                first_name = st.text_input("First Name", value=s['first_name'], key="update_first_name")
+                middle_name = st.text_input("Middle Name", value=s['middle_name'] if pd.notna(s['middle_name']) else "", key="update_middle_name")
+                surname = st.text_input("Surname", value=s['surname'], key="update_surname")
+                class_ = st.text_input("Class", value=s['class'], key="update_class")
+                dob = st.date_input("DOB", value=pd.to_datetime(s['dob']).date(), key="update_dob")
+                gender = st.selectbox("Gender", ["Male", "Female", "Other"], index=["Male", "Female", "Other"].index(s['gender']), key="update_gender")
+                residence = st.text_area("Residence", value=s['residence'], key="update_residence")
+                guardian_name = st.text_input("Guardian Name", value=s['guardian_name'] if pd.notna(s['guardian_name']) else "", key="update_guardian_name")
+                guardian_phone = st.text_input("Guardian Phone", value=s['guardian_phone'] if pd.notna(s['guardian_phone']) else "", key="update_guardian_phone")
+                insurance_number = st.text_input("Insurance Number", value=s['insurance_number'] if pd.notna(s['insurance_number']) else "", key="update_insurance")
+                has_medical = st.checkbox("Has Medical Condition?", value=bool(s['has_medical_condition']), key="update_has_medical")
+                medical_details = st.text_area("Medical Details (if any)", value=s['medical_details'] if pd.notna(s['medical_details']) else "", key="update_medical_details")
+                uploaded_file = st.file_uploader("Update Passport Picture (JPG/PNG)", type=['jpg', 'jpeg', 'png'], key="update_photo")
+                submitted = st.form_submit_button("Update", key="update_student_button")
+            if submitted:
                 if not is_valid_name_part(first_name): st.error("Invalid first name")
                 elif not is_valid_name_part(surname): st.error("Invalid surname")
                 elif not is_valid_class(class_): st.error("Invalid class")
@@ -888,7 +989,12 @@ def admin_students():
                 elif insurance_number and not is_valid_insurance_number(insurance_number): st.error("Invalid insurance number")
                 elif has_medical and not medical_details.strip(): st.error("Medical details required")
                 else:
-                    conn = sqlite3.connect(DATABASE)
+                    new_photo_path = current_photo
+                    if uploaded_file is not None:
+                        new_photo_path = os.path.join(current_tenant().photo_folder, f"{student_id}.{uploaded_file.name.split('.')[-1]}")
+                        with open(new_photo_path, "wb") as f:
+                            f.write(uploaded_file.getbuffer())
+                    conn = connect()
                     cursor = conn.cursor()
                     cursor.execute("""
                         UPDATE students SET first_name=?, middle_name=?, surname=?, class=?, dob=?, gender=?,
@@ -907,50 +1013,257 @@ def admin_students():
                     st.success("Student updated")
         else:
             st.warning("Student ID not found")
-    with tab4:
-        student_id = st.number_input("Student ID", min_value=1, step=1, key="check_attendance_id")
-        if st.button("Check", key="check_attendance_button"):
+    elif section == "Check Attendance":
+        with st.form("check_attendance_form"):
+            student_id = st.number_input("Student ID", min_value=1, step=1, key="check_attendance_id")
+            submitted = st.form_submit_button("Check", key="check_attendance_button")
+        if submitted:
             att = load_data('attendance')
             filtered = att[att['student_id'] == student_id]
             st.dataframe(filtered) if not filtered.empty else st.info("No records")
-    with tab5:
-        student_id = st.number_input("Student ID", min_value=1, step=1, key="check_results_id")
-        if st.button("Check", key="check_results_button"):
+    elif section == "Check Results":
+        with st.form("check_results_form"):
+            student_id = st.number_input("Student ID", min_value=1, step=1, key="check_results_id")
+            submitted = st.form_submit_button("Check", key="check_results_button")
+        if submitted:
             res = load_data('results')
             filtered = res[res['student_id'] == student_id]
             st.dataframe(filtered) if not filtered.empty else st.info("No results")
-    with tab6:
-        student_id = st.number_input("Student ID", min_value=1, step=1, key="report_card_id")
-        if st.button("Generate", key="generate_report_button"):
-            results = load_data('results')
-            attendance = load_data('attendance')
-            student = load_data('students')
-            if student_id in student['id'].values:
-                s = student[student['id'] == student_id].iloc[0]
-                report = f"Report Card for {s['full_name']}\nClass: {s['class']}\nGuardian: {s['guardian_name']}\nInsurance: {s['insurance_number']}\nMedical: {s['has_medical_condition']} - {s['medical_details']}\n\nResults:\n"
-                res = results[results['student_id'] == student_id]
-                report += res.to_string(index=False) + "\n\nAttendance:\n"
-                att = attendance[attendance['student_id'] == student_id]
-                report += att.to_string(index=False)
-                st.download_button("Download", report, f"report_{student_id}.txt", key="download_report")
+    elif section == "Print Report Card":
+        with st.form("report_card_form"):
+            student_id = st.number_input("Student ID", min_value=1, step=1, key="report_card_id")
+            submitted = st.form_submit_button("Generate", key="generate_report_button")
+        if submitted:
+            report = run_service(services.student_report, student_id)
+            if report:
+                st.download_button("Download", services.report_card_text(report), f"report_{student_id}.txt", key="download_report")
+    elif section == "Student 360":
+        student_360("admin")
+    elif section == "ID Cards":
+        student_id_cards()
+    elif section == "Bulk Admission":
+        bulk_admission()
+    elif section == "Year Rollover":
+        year_rollover()
+# === STUDENT 360 ===
+@st.cache_data(max_entries=512)
+def cached_profile(tenant_key, student_id, versions, on):
+    # versions = (student, class) generations from profiles.py triggers; any write touching the pupil is a cache miss
+    conn = read_connect(tenant_key)
+    try:
+        return profiles.student_profile(conn, student_id, on)
+    finally:
+        conn.close()
+def student_360(prefix):
+    student_id = st.number_input("Student ID", min_value=1, step=1, key=f"{prefix}_profile_id")
+    conn = read_connect()
+    versions = profiles.versions(conn, student_id)
+    conn.close()
+    if versions is None:
+        st.info("No student with this ID")
+        return
+    p = cached_profile(current_tenant().key, int(student_id), versions, datetime.now().date())
+    s = p['student']
+    left, right = st.columns([1, 3])
+    if p['photo']:
+        left.image(p['photo'], width=160)
+    else:
+        left.caption("No photo")
+    name = " ".join(part for part in (s['first_name'], s['middle_name'], s['surname']) if part)
+    right.markdown(f"<h3 style='color:#ffd700;'>{name}</h3>", unsafe_allow_html=True)
+    right.write(f"**Class:** {s['class']} | **Gender:** {s['gender']} | **DOB:** {s['dob']} | **Admitted:** {s['registration_date']}")
+    right.write(f"**Guardian:** {s['guardian_name'] or '-'} ({s['guardian_phone'] or '-'}) | **Residence:** {s['residence']}")
+    if s['has_medical_condition']:
+        right.warning(f"Medical: {s['medical_details']}")
+    att, overall = p['attendance'], p['overall']
+    cols = st.columns(4)
+    cols[0].metric("Attendance This Term", f"{att['rate']:.0%}" if att['rate'] is not None else "-",
+                   f"{att['present']} of {att['days']} days since {att['since']}", delta_color="off")
+    cols[1].metric("Average Score", f"{p['average']:.1f}" if p['average'] is not None else "-")
+    cols[2].metric("Class Position", f"{overall['position']} of {overall['out_of']}" if overall else "-")
+    cols[3].metric("Fee Balance", f"GH₵ {p['balance']:,.2f}")
+    st.markdown("<h4 style='color:#ffd700;'>Results</h4>", unsafe_allow_html=True)
+    st.dataframe(p['results'], hide_index=True) if not p['results'].empty else st.info("No results")
+    st.markdown("<h4 style='color:#ffd700;'>Fees</h4>", unsafe_allow_html=True)
+    st.dataframe(p['fees'], hide_index=True) if not p['fees'].empty else st.info("No fee records")
+    st.dataframe(p['payments'], hide_index=True) if not p['payments'].empty else st.caption("No payments recorded")
+    st.markdown("<h4 style='color:#ffd700;'>Teachers</h4>", unsafe_allow_html=True)
+    st.dataframe(p['teachers'], hide_index=True) if not p['teachers'].empty else st.info("No teachers assigned to this class")
+# === ID CARDS ===
+def student_id_cards():
+    st.markdown("<h3 style='color:#ffd700;'>Student ID Cards</h3>", unsafe_allow_html=True)
+    students = load_data('students', ['id', 'full_name', 'class'])
+    students = students[students['class'] != rollover.ALUMNI_CLASS]
+    if students.empty:
+        st.info("No students registered yet")
+        return
+    scope = st.radio("Print for", ["Whole class", "Selected students"], horizontal=True, key="id_card_scope")
+    if scope == "Whole class":
+        class_ = st.selectbox("Class", sorted(students['class'].unique()), key="id_card_class")
+        ids = None
+    else:
+        labels = {f"{i} - {name} ({c})": i
+                  for i, name, c in zip(students['id'], students['full_name'], students['class'])}
+        class_ = None
+        ids = [labels[label] for label in st.multiselect("Students", list(labels), key="id_card_students")]
+    if st.button("Generate ID Cards", key="id_cards_btn"):
+        conn = connect()
+        cards = idcards.students_for_cards(conn, class_, ids)
+        conn.close()
+        if not cards:
+            st.error("No students selected")
+            return
+        tenant = current_tenant()
+        bar = st.progress(0.0, text="Rendering cards...")
+        pdf, stats = idcards.generate(cards, tenant.name, os.path.join(tenant.image_path, "logo.jpeg"),
+                                      os.path.join(tenant.photo_folder, "id_cards"),
+                                      progress=lambda done, total: bar.progress(done / total, text=f"{done} of {total} cards"))
+        st.success(f"{stats['cards']} cards on {stats['sheets']} sheet(s) ({stats['cached']} unchanged cards reused)")
+        st.download_button("Download ID Cards (PDF)", pdf, f"id_cards_{class_ or 'selected'}.pdf", "application/pdf",
+                           key="download_id_cards")
+# === BULK ADMISSION ===
+ADMISSION_COLUMNS = ['first_name', 'middle_name', 'surname', 'class', 'dob', 'gender', 'residence', 'guardian_name',
+                     'guardian_phone', 'insurance_number', 'has_medical_condition', 'medical_details', 'photo']
+def validate_admissions(df, max_years=18):
+    fields = pd.DataFrame({c: text(df[c]) if c in df.columns else '' for c in ADMISSION_COLUMNS}, index=df.index)
+    dob = parse_dates(fields['dob'])
+    has_medical = fields['has_medical_condition'].str.lower().isin(['1', 'y', 'yes', 'true'])
+    gender = fields['gender'].str.capitalize()
+    masks = pd.DataFrame({
+        "invalid first name": invalid_name_part(fields['first_name']),
+        "invalid middle name": invalid_name_part(fields['middle_name'], optional=True),
+        "invalid surname": invalid_name_part(fields['surname']),
+        "class required": invalid_required(fields['class']),
+        f"invalid DOB (must be under {max_years} years)": invalid_date(dob, max_years),
+        "gender must be Male, Female or Other": invalid_choice(gender, GENDERS),
+        "residence required": invalid_required(fields['residence']),
+        "invalid guardian name": invalid_name_part(fields['guardian_name'], optional=True),
+        "invalid guardian phone": invalid_phone(fields['guardian_phone'], optional=True),
+        "invalid insurance number": invalid_insurance_number(fields['insurance_number'], optional=True),
+        "medical details required if condition exists": has_medical & (fields['medical_details'] == ''),
+        "duplicate pupil in file": pd.DataFrame({'f': fields['first_name'].str.lower(), 's': fields['surname'].str.lower(), 'd': dob}).duplicated(keep=False),
+    })
+    out = fields.astype(object).replace('', None)
+    out['dob'] = dob
+    out['gender'] = gender
+    out['has_medical_condition'] = has_medical.astype(int)
+    out.loc[~has_medical, 'medical_details'] = None
+    out.insert(0, 'row', range(1, len(out) + 1))
+    out['error'] = error_messages(masks)
+    return out
+def read_photo_zip(uploaded_zip):
+    photos = {}
+    with zipfile.ZipFile(uploaded_zip) as zf:
+        for info in zf.infolist():
+            name = os.path.basename(info.filename)
+            stem, _, ext = name.rpartition('.')
+            if info.is_dir() or ext.lower() not in ('jpg', 'jpeg', 'png'):
+                continue
+            data = zf.read(info)
+            photos[name] = photos[stem] = (ext.lower(), data)
+    return photos
+def bulk_admission():
+    st.markdown("<h3 style='color:#ffd700;'>Bulk Admission</h3>", unsafe_allow_html=True)
+    st.caption("Columns: " + ", ".join(ADMISSION_COLUMNS) + ". Photos in the ZIP are matched by the photo column or by row number (e.g. 1.jpg for the first pupil).")
+    st.download_button("Download Template", pd.DataFrame(columns=ADMISSION_COLUMNS).to_csv(index=False), "admission_template.csv", key="admission_template_download")
+    uploaded_file = st.file_uploader("Admission file (CSV/XLSX)", type=['csv', 'xlsx'], key="admission_file")
+    uploaded_zip = st.file_uploader("Passport pictures (ZIP, optional)", type=['zip'], key="admission_photos")
+    if st.button("Admit", key="admission_button"):
+        if uploaded_file is None:
+            st.error("Upload an admission file")
+            return
+        try:
+            batch = read_upload(uploaded_file, as_text=True)
+            photos = read_photo_zip(uploaded_zip) if uploaded_zip is not None else {}
+        except ImportError:
+            st.error("Reading .xlsx files requires the openpyxl package; upload a CSV instead")
+            return
+        except Exception as e:
+            st.error(f"Could not read upload: {str(e)}")
+            return
+        batch.columns = [str(c).strip().lower() for c in batch.columns]
+        missing = {'first_name', 'surname', 'class', 'dob', 'gender', 'residence'} - set(batch.columns)
+        if missing:
+            st.error(f"Missing columns: {', '.join(sorted(missing))}")
+            return
+        checked = validate_admissions(batch)
+        rejected = checked[checked['error'] != '']
+        valid = checked[checked['error'] == '']
+        if not valid.empty:
+            conn = connect()
+            try:
+                first_id, admitted = services.admit_students(conn, valid, current_tenant().photo_folder, photos)
+            finally:
+                conn.close()
+            st.success(f"Admitted {admitted} students (IDs {first_id}-{first_id + admitted - 1})")
+        if not rejected.empty:
+            st.warning(f"{len(rejected)} rows rejected")
+            st.dataframe(rejected[['row', 'first_name', 'surname', 'class', 'error']], hide_index=True)
+            st.download_button("Download Rejects", rejected.to_csv(index=False), "admission_rejects.csv", key="admission_rejects_download")
+# === YEAR ROLLOVER ===
+def show_rollover_report(report):
+    cols = st.columns(4)
+    cols[0].metric("Promoted", report['promoted'])
+    cols[1].metric("Graduated", report['graduated'])
+    cols[2].metric("New Fee Rows", report['fee_rows'])
+    cols[3].metric("Billed", f"{report['billed']:,.2f}")
+    st.dataframe(report['moves'], hide_index=True)
+    if not report['unmapped'].empty:
+        st.warning("These classes have no progression and will stay where they are")
+        st.dataframe(report['unmapped'], hide_index=True)
+    if not report['assignment_changes'].empty:
+        st.markdown("**Teacher assignments** (an empty new class means the assignment lapses)")
+        st.dataframe(report['assignment_changes'], hide_index=True)
+def year_rollover():
+    st.markdown("<h3 style='color:#ffd700;'>End-of-Year Rollover</h3>", unsafe_allow_html=True)
+    st.caption("Set the class each class moves up to; leave the next class empty for final-year classes, whose pupils "
+               f"graduate to '{rollover.ALUMNI_CLASS}'. Suggested rows are not saved until you save them.")
+    plan = run_service(rollover.progression)
+    edited = st.data_editor(plan, num_rows="dynamic", hide_index=True, disabled=['saved'], key="progression_editor")
+    if st.button("Save Progression", key="save_progression_btn"):
+        rows = edited.dropna(subset=['class'])
+        saved = run_service(rollover.save_progression, dict(zip(rows['class'], rows['next_class'])))
+        if saved is not None:
+            st.success(f"{saved} classes saved")
+    this_year = datetime.now().year
+    year = st.text_input("Academic Year Ending", f"{this_year - 1}/{this_year}", key="rollover_year")
+    follow = st.checkbox("Teachers move up with their classes", value=True, key="rollover_follow")
+    if not follow:
+        st.warning("Class-teacher and subject assignments will stay on the old class names, so each teacher takes the "
+                   "pupils moving into their class")
+    cols = st.columns(2)
+    if cols[0].button("Preview (dry run)", key="rollover_preview_btn"):
+        report = run_service(rollover.rollover, year, follow, True)
+        if report is not None:
+            st.info("Preview only; nothing has been changed")
+            show_rollover_report(report)
+    if cols[1].button("Run Rollover", key="rollover_run_btn"):
+        report = run_service(rollover.rollover, year, follow, False)
+        if report is not None:
+            st.success(f"{year} rolled over")
+            show_rollover_report(report)
+    st.markdown("<h4 style='color:#ffd700;'>History</h4>", unsafe_allow_html=True)
+    st.dataframe(run_service(rollover.history), hide_index=True)
 # === ADMIN: STAFF ===
 def admin_staff():
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-        "Add Teacher", "Update Profile", "Salary Payment",
+    section = lazy_tabs([
+        "Add Teacher", "Update Profile", "Payroll",
         "Check Attendance", "Check Register", "Check Reports"
-    ])
-    with tab1:
-        name = st.text_input("Name", key="add_teacher_name")
-        subject = st.text_input("Subject", key="add_teacher_subject")
-        email = st.text_input("Email", key="add_teacher_email")
-        phone = st.text_input("Phone", key="add_teacher_phone")
-        if st.button("Add", key="add_teacher_button"):
-            conn = sqlite3.connect(DATABASE)
+    ], "staff_section")
+    if section == "Add Teacher":
+        with st.form("add_teacher_form"):
+            name = st.text_input("Name", key="add_teacher_name")
+            subject = st.text_input("Subject", key="add_teacher_subject")
+            email = st.text_input("Email", key="add_teacher_email")
+            phone = st.text_input("Phone", key="add_teacher_phone")
+            submitted = st.form_submit_button("Add", key="add_teacher_button")
+        if submitted:
             if not is_valid_name(name): st.error("Invalid name")
             elif not is_valid_subject(subject): st.error("Invalid subject")
             elif not is_valid_email(email): st.error("Invalid email")
             elif not is_valid_phone(phone): st.error("Invalid phone")
             else:
+                conn = connect()
                 cursor = conn.cursor()
                 new_id = generate_id('teachers')
                 cursor.execute("INSERT INTO teachers VALUES (?, ?, ?, ?, ?)",
@@ -960,138 +1273,389 @@ def admin_staff():
                 conn.commit()
                 conn.close()
                 st.success(f"Added. Login: {username}/default123")
-    with tab2:
+    elif section == "Update Profile":
         teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="update_teacher_id")
         teachers = load_data('teachers')
         if teacher_id in teachers['id'].values:
             t = teachers[teachers['id'] == teacher_id].iloc[0]
-            name = st.text_input("Name", value=t['name'], key="edit_teacher_name")
-            subject = st.text_input("Subject", value=t['subject'], key="edit_teacher_subject")
-            email = st.text_input("Email", value=t['email'], key="edit_teacher_email")
-            phone = st.text_input("Phone", value=t['phone'], key="edit_teacher_phone")
-            if st.button("Update", key="update_teacher_button"):
-                conn = sqlite3.connect(DATABASE)
+            with st.form("update_teacher_form"):
+                name = st.text_input("Name", value=t['name'], key="edit_teacher_name")
+                subject = st.text_input("Subject", value=t['subject'], key="edit_teacher_subject")
+                email = st.text_input("Email", value=t['email'], key="edit_teacher_email")
+                phone = st.text_input("Phone", value=t['phone'], key="edit_teacher_phone")
+                submitted = st.form_submit_button("Update", key="update_teacher_button")
+            if submitted:
+                conn = connect()
                 cursor = conn.cursor()
                 cursor.execute("UPDATE teachers SET name=?, subject=?, email=?, phone=? WHERE id=?",
                              (name.strip(), subject.strip(), email.strip(), phone.strip(), teacher_id))
                 conn.commit()
                 conn.close()
                 st.success("Updated")
-    with tab3:
-        teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="salary_teacher_id")
-        month = st.text_input("Month (YYYY-MM)", key="salary_month")
-        amount = st.number_input("Amount", min_value=0.0, step=0.01, key="salary_amount")
-        if st.button("Pay", key="pay_salary_button"):
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO salary VALUES (?, ?, ?, ?)", (teacher_id, month, amount, True))
-            conn.commit()
-            conn.close()
-            st.success("Salary recorded")
-    with tab4:
+    elif section == "Payroll":
+        staff_payroll()
+    elif section == "Check Attendance":
         st.markdown("<h3 style='color:#ffd700;'>Login Tracking</h3>", unsafe_allow_html=True)
         logs = load_data('login_logs')
         if not logs.empty:
             st.dataframe(logs.sort_values('login_time', ascending=False))
         else:
             st.info("No login logs yet")
-    with tab5:
-        teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="check_register_id")
-        if st.button("Check", key="check_register_button"):
+    elif section == "Check Register":
+        with st.form("check_register_form"):
+            teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="check_register_id")
+            submitted = st.form_submit_button("Check", key="check_register_button")
+        if submitted:
             reg = load_data('register')
             filtered = reg[reg['teacher_id'] == teacher_id]
             st.dataframe(filtered) if not filtered.empty else st.info("No records")
-    with tab6:
-        teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="check_reports_id")
-        if st.button("Check", key="check_reports_button"):
+    elif section == "Check Reports":
+        with st.form("check_reports_form"):
+            teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="check_reports_id")
+            submitted = st.form_submit_button("Check", key="check_reports_button")
+        if submitted:
             rep = load_data('reports')
             filtered = rep[rep['teacher_id'] == teacher_id]
             st.dataframe(filtered) if not filtered.empty else st.info("No reports")
+def staff_payroll():
+    part = lazy_tabs(["Run", "Pay Scales", "Grades"], "payroll_section")
+    if part == "Run":
+        today = datetime.now().date().replace(day=1)
+        months = [f"{(today.year * 12 + today.month - 1 - i) // 12}-{(today.month - 1 - i) % 12 + 1:02d}" for i in range(-1, 12)]
+        month = st.selectbox("Month", months, index=1, key="payroll_month")
+        if 'payroll_flash' in st.session_state:
+            st.success(st.session_state.pop('payroll_flash'))
+        if st.button("Generate Payroll", key="generate_payroll_btn"):
+            result = run_service(payroll.generate, month)
+            if result is not None:
+                st.success(f"{result['created']} salaries drafted, {result['kept']} approved/paid kept")
+                if result['ungraded']:
+                    st.warning(f"{result['ungraded']} staff have no grade and were left out; assign them under Grades")
+        rows = run_service(payroll.payroll, month)
+        if rows is None or rows.empty:
+            st.info("No payroll for this month yet")
+            return
+        st.dataframe(run_service(payroll.summary, month), hide_index=True)
+        event = st.dataframe(rows, hide_index=True, on_select="rerun", selection_mode="multi-row", key="payroll_table")
+        selected = event.selection.rows if event else []
+        staff = [tuple(r) for r in rows.iloc[selected][['staff_type', 'staff_id']].itertuples(index=False)] if selected else None
+        st.caption(f"Actions apply to the {len(selected)} selected rows" if selected else "Actions apply to every eligible row")
+        cols = st.columns(3)
+        for col, (action, label) in zip(cols, [('approve', "Approve"), ('unapprove', "Return to Draft"), ('pay', "Mark Paid")]):
+            if col.button(label, key=f"payroll_{action}_btn"):
+                moved = run_service(payroll.transition, month, action, staff)
+                if moved is not None:
+                    st.session_state.payroll_flash = f"{moved} rows updated"
+                    st.rerun()
+        st.download_button("Download Payslips (.zip)", payroll.payslips_zip(rows, current_tenant().name),
+                           f"payslips_{month}.zip", "application/zip", key="download_payslips")
+    elif part == "Pay Scales":
+        scales = run_service(payroll.pay_scales)
+        edited = st.data_editor(scales, num_rows="dynamic", hide_index=True, key="pay_scales_editor")
+        if st.button("Save Pay Scales", key="save_pay_scales_btn"):
+            saved = run_service(payroll.save_pay_scales, edited.dropna(how='all').itertuples(index=False))
+            if saved is not None:
+                st.success(f"{saved} grades saved")
+    elif part == "Grades":
+        graded = run_service(payroll.staff_grades)
+        st.dataframe(graded, hide_index=True)
+        grades = run_service(payroll.pay_scales)['grade'].tolist()
+        if not grades:
+            st.info("Add pay scales first")
+            return
+        staff_type = st.selectbox("Staff", list(payroll.STAFF), format_func=lambda k: k.replace('_', '-').title(), key="grade_staff_type")
+        with st.form("assign_grade_form"):
+            ungraded = st.checkbox("Everyone of this type without a grade", key="grade_ungraded")
+            ids = st.multiselect("Or pick staff", graded['staff_id'][graded['staff_type'] == staff_type].tolist(), key="grade_staff_ids")
+            grade = st.selectbox("Grade", grades, key="grade_value")
+            submitted = st.form_submit_button("Assign", key="assign_grade_btn")
+        if submitted:
+            if ungraded:
+                ids = graded['staff_id'][(graded['staff_type'] == staff_type) & graded['grade'].isna()].tolist()
+            if not ids:
+                st.error("No staff selected")
+            elif run_service(payroll.assign_grade, staff_type, ids, grade) is not None:
+                st.success(f"{len(ids)} staff assigned grade {grade}")
 # === ADMIN: FEES ===
 def admin_fees():
-    tab1, tab2, tab3, tab4 = st.tabs(["Payment", "Setup", "Records", "Report"])
-    with tab1:
-        student_id = st.number_input("Student ID", min_value=1, step=1, key="fees_student_id")
-        amount = st.number_input("Amount", min_value=0.0, step=0.01, key="fees_amount")
-        collected_by = st.text_input("Collected By", key="fees_collected_by")
-        if st.button("Record", key="record_payment_button"):
-            students = load_data('students')
-            if student_id not in students['id'].values:
-                st.error("Student not found")
-            else:
-                class_ = students[students['id'] == student_id]['class'].values[0]
-                fees_data = load_data('fees')
-                fee_row = fees_data[(fees_data['class'] == class_) & (fees_data['student_id'] == student_id)]
-                conn = sqlite3.connect(DATABASE)
-                cursor = conn.cursor()
-                if fee_row.empty:
-                    # Create row if not exists
-                    class_fee = fees_data[(fees_data['class'] == class_) & fees_data['student_id'].isna()]
-                    fee_amount = class_fee['fee_amount'].values[0] if not class_fee.empty else 0
-                    cursor.execute("INSERT INTO fees (class, fee_amount, student_id, paid_amount, date_paid, collected_by) VALUES (?, ?, ?, ?, ?, ?)",
-                                   (class_, fee_amount, student_id, amount, datetime.now().date(), collected_by))
-                else:
-                    current_paid = fee_row['paid_amount'].values[0]
-                    cursor.execute("UPDATE fees SET paid_amount = paid_amount + ?, date_paid = ?, collected_by = ? WHERE student_id = ? AND class = ?",
-                                   (amount, datetime.now().date(), collected_by, student_id, class_))
-                conn.commit()
-                conn.close()
-                st.success("Payment recorded")
-    with tab2:
-        class_ = st.text_input("Class", key="setup_class")
-        fee = st.number_input("Fee Amount", min_value=0.0, step=0.01, key="setup_fee")
-        if st.button("Set", key="set_fee_button"):
-            conn = sqlite3.connect(DATABASE)
+    section = lazy_tabs(["Payment", "Setup", "Records", "Analytics", "Report"], "fees_section")
+    if section == "Payment":
+        with st.form("record_payment_form"):
+            student_id = st.number_input("Student ID", min_value=1, step=1, key="fees_student_id")
+            amount = st.number_input("Amount", min_value=0.0, step=0.01, key="fees_amount")
+            collected_by = st.text_input("Collected By", key="fees_collected_by")
+            submitted = st.form_submit_button("Record", key="record_payment_button")
+        if submitted and run_service(services.record_payment, student_id, amount, collected_by) is not None:
+            st.success("Payment recorded")
+    elif section == "Setup":
+        with st.form("set_fee_form"):
+            class_ = st.text_input("Class", key="setup_class")
+            fee = st.number_input("Fee Amount", min_value=0.0, step=0.01, key="setup_fee")
+            submitted = st.form_submit_button("Set", key="set_fee_button")
+        if submitted:
+            conn = connect()
             cursor = conn.cursor()
             cursor.execute("INSERT OR REPLACE INTO fees (class, fee_amount, student_id) VALUES (?, ?, NULL)", (class_, fee))
             conn.commit()
             conn.close()
             st.success("Fee set")
-    with tab3:
+    elif section == "Records":
         fees = load_data('fees')
         if not fees.empty:
             fees['arrears'] = fees['fee_amount'] - fees['paid_amount'].fillna(0)
             st.dataframe(fees[['student_id', 'paid_amount', 'arrears']])
-    with tab4:
+    elif section == "Analytics":
+        fee_analytics_view()
+    elif section == "Report":
         if st.button("Generate", key="generate_fees_report"):
             fees = load_data('fees')
             if not fees.empty:
                 fees['arrears'] = fees['fee_amount'] - fees['paid_amount'].fillna(0)
                 st.download_button("Download", fees.to_csv(index=False), "fees_report.csv", key="download_fees_report")
+def fee_analytics_view():
+    # Shared by admin Fees > Analytics and the headteacher menu; reads the trigger-maintained tables in fee_analytics.py
+    conn = read_connect()
+    try:
+        billed, collected = fee_analytics.totals(conn)
+        outlook = fee_analytics.forecast(conn)
+        cols = st.columns(4)
+        cols[0].metric("Billed", f"GH₵ {billed:,.2f}")
+        cols[1].metric("Collected", f"GH₵ {collected:,.2f}", f"{collected / billed:.0%}" if billed else None)
+        cols[2].metric("Arrears", f"GH₵ {billed - collected:,.2f}")
+        cols[3].metric("Expected Next 30 Days", f"GH₵ {outlook['expected']:,.2f}",
+                       f"{outlook['days_to_clear']} days to clear" if outlook['days_to_clear'] else None, delta_color="off")
+        st.markdown("<h4 style='color:#ffd700;'>Arrears Aging</h4>", unsafe_allow_html=True)
+        st.caption("Days since the last payment, or since the account was opened if nothing has been paid")
+        by_class = st.checkbox("By class", key="fee_aging_by_class")
+        aging = fee_analytics.aging(conn, by_class=by_class)
+        st.dataframe(aging, hide_index=True) if not aging.empty else st.info("No arrears")
+        st.markdown("<h4 style='color:#ffd700;'>Collection by Class</h4>", unsafe_allow_html=True)
+        st.dataframe(fee_analytics.class_collection(conn), hide_index=True)
+        st.markdown("<h4 style='color:#ffd700;'>Daily Cashier Totals</h4>", unsafe_allow_html=True)
+        today = datetime.now().date()
+        start, end = st.columns(2)
+        start = start.date_input("From", today - timedelta(days=30), key="fee_daily_from")
+        end = end.date_input("To", today, key="fee_daily_to")
+        daily = fee_analytics.daily_totals(conn, start, end)
+        st.dataframe(daily, hide_index=True) if not daily.empty else st.info("No payments in this period")
+        st.markdown("<h4 style='color:#ffd700;'>Payment History</h4>", unsafe_allow_html=True)
+        student_id = st.number_input("Student ID", min_value=1, step=1, key="fee_history_student")
+        history = fee_analytics.payment_history(conn, student_id)
+        st.dataframe(history, hide_index=True) if not history.empty else st.info("No payments")
+    finally:
+        conn.close()
 # === ADMIN: DATABASE ===
 def admin_database():
-    tab1, tab2, tab3 = st.tabs(["Students", "Teachers", "Non-Teaching"])
-    with tab1: st.dataframe(load_data('students'))
-    with tab2: st.dataframe(load_data('teachers'))
-    with tab3: st.dataframe(load_data('non_teaching'))
+    section = lazy_tabs(["Students", "Teachers", "Non-Teaching", "Maintenance", "Analytics Export"], "database_section")
+    if section == "Students": st.dataframe(load_data('students'))
+    elif section == "Teachers": st.dataframe(load_data('teachers'))
+    elif section == "Non-Teaching": st.dataframe(load_data('non_teaching'))
+    elif section == "Maintenance": database_maintenance()
+    elif section == "Analytics Export": database_export()
+def database_maintenance():
+    st.markdown("<h3 style='color:#ffd700;'>Maintenance</h3>", unsafe_allow_html=True)
+    tenant = current_tenant()
+    st.caption(f"Runs nightly at {maintenance.MAINTENANCE_AT}: statistics refresh, WAL checkpoint, VACUUM when fragmented, "
+               f"and a verified backup into '{tenant.backup_dir}' (last {maintenance.BACKUP_KEEP} kept)")
+    if st.button("Run Maintenance Now", key="run_maintenance_btn"):
+        with st.spinner("Running maintenance..."):
+            ok, report = maintenance.run_maintenance(tenant.database, tenant.backup_dir)
+        if ok:
+            st.success(f"Maintenance complete, backup saved to {report['backup']['result']}")
+        else:
+            st.error("Maintenance finished with errors: " + "; ".join(f"{k}: {v['error']}" for k, v in report.items() if 'error' in v))
+    runs = maintenance.last_runs(tenant.database)
+    if runs:
+        st.dataframe(pd.DataFrame(runs, columns=['started_at', 'finished_at', 'ok', 'report']), hide_index=True)
+    backups = maintenance.list_backups(tenant.database, tenant.backup_dir)
+    if backups:
+        st.dataframe(pd.DataFrame({'backup': backups, 'size_mb': [round(os.path.getsize(b) / 2 ** 20, 2) for b in backups]}), hide_index=True)
+    else:
+        st.info("No backups yet")
+def database_export():
+    st.markdown("<h3 style='color:#ffd700;'>Analytics Export</h3>", unsafe_allow_html=True)
+    tenant = current_tenant()
+    folder = export_dir(tenant)
+    every = f"every {export.EXPORT_INTERVAL / 60:g} minutes" if export.EXPORT_INTERVAL > 0 else "only when run here"
+    st.caption(f"Parquet copies of {', '.join(export.TABLES)} in '{folder}', updated {every}; "
+               "each run only writes rows added or changed since the last")
+    if st.button("Export Now", key="run_export_btn"):
+        with st.spinner("Exporting..."):
+            report = export.run_export(tenant.database, folder)
+        st.success(f"{sum(r['rows_written'] for r in report.values())} rows written")
+    st.dataframe(export.export_state(tenant.database), hide_index=True)
+    # Multi-year attendance straight from the export: only two columns of the chosen years are read
+    st.markdown("<h4 style='color:#ffd700;'>Attendance Rate by Month</h4>", unsafe_allow_html=True)
+    this_year = datetime.now().year
+    first, last = st.slider("Years", this_year - 10, this_year, (this_year - 2, this_year), key="export_attendance_years")
+    try:
+        att = export.read(folder, 'attendance', columns=['date', 'present'], start=datetime(first, 1, 1).date(),
+                          end=datetime(last, 12, 31).date())
+    except FileNotFoundError:
+        st.info("Nothing exported yet")
+        return
+    if att.empty:
+        st.info("No attendance in these years")
+    else:
+        rate = att.groupby(att['date'].dt.to_period('M').astype(str))['present'].mean().mul(100).round(1)
+        st.line_chart(rate.rename("present %"))
 # === HEADTEACHER FUNCTIONS ===
 def headteacher_attendance():
-    student_id = st.number_input("Student ID", min_value=1, step=1, key="ht_check_att_id")
-    if st.button("Check", key="ht_check_att_btn"):
+    with st.form("ht_check_att_form"):
+        student_id = st.number_input("Student ID", min_value=1, step=1, key="ht_check_att_id")
+        submitted = st.form_submit_button("Check", key="ht_check_att_btn")
+    if submitted:
         att = load_data('attendance')
         filtered = att[att['student_id'] == student_id]
         st.dataframe(filtered) if not filtered.empty else st.info("No records")
 def headteacher_results():
-    student_id = st.number_input("Student ID", min_value=1, step=1, key="ht_check_res_id")
-    if st.button("Check", key="ht_check_res_btn"):
+    with st.form("ht_check_res_form"):
+        student_id = st.number_input("Student ID", min_value=1, step=1, key="ht_check_res_id")
+        submitted = st.form_submit_button("Check", key="ht_check_res_btn")
+    if submitted:
         res = load_data('results')
         filtered = res[res['student_id'] == student_id]
         st.dataframe(filtered) if not filtered.empty else st.info("No results")
+def headteacher_results_analytics():
+    # Reads the materialized tables in analytics.py; only classes/subjects whose scores changed get recomputed
+    conn = connect()
+    try:
+        stats = analytics.class_subject_stats(conn)
+        if stats.empty:
+            st.info("No results recorded yet")
+            return
+        class_ = st.selectbox("Class", sorted(stats['class'].unique()), key="analytics_class")
+        class_stats = stats[stats['class'] == class_]
+        subject = st.selectbox("Subject", ["All Subjects"] + sorted(class_stats['subject']), key="analytics_subject")
+        if subject == "All Subjects":
+            st.dataframe(class_stats.drop(columns='class'), hide_index=True)
+            st.markdown("<h4 style='color:#ffd700;'>Class Positions</h4>", unsafe_allow_html=True)
+            st.dataframe(analytics.class_ranking(conn, class_), hide_index=True)
+        else:
+            row = class_stats[class_stats['subject'] == subject].iloc[0]
+            cols = st.columns(4)
+            cols[0].metric("Students", int(row['students']))
+            cols[1].metric("Mean", f"{row['mean']:.1f}")
+            cols[2].metric("Median", f"{row['median']:.1f}")
+            cols[3].metric(f"Pass Rate (>= {analytics.PASS_MARK})", f"{row['pass_rate']:.0%}")
+            st.bar_chart(analytics.distribution(conn, class_, subject).set_index('bucket'))
+            st.dataframe(analytics.subject_ranking(conn, class_, subject), hide_index=True)
+        st.markdown("<h4 style='color:#ffd700;'>Teacher Performance</h4>", unsafe_allow_html=True)
+        teachers = analytics.teacher_stats(conn)
+        st.dataframe(teachers, hide_index=True) if not teachers.empty else st.info("No subject assignments with results")
+    finally:
+        conn.close()
 def headteacher_teacher_attendance():
-    teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_teacher_att_id")
-    if st.button("Check", key="ht_teacher_att_btn"):
+    with st.form("ht_teacher_att_form"):
+        teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_teacher_att_id")
+        submitted = st.form_submit_button("Check", key="ht_teacher_att_btn")
+    if submitted:
         att = load_data('teacher_attendance')
         filtered = att[att['teacher_id'] == teacher_id]
         st.dataframe(filtered) if not filtered.empty else st.info("No records")
+def headteacher_workload():
+    conn = read_connect()
+    try:
+        on = st.date_input("Date", datetime.now().date(), key="cover_date")
+        st.markdown("<h4 style='color:#ffd700;'>Cover Needed</h4>", unsafe_allow_html=True)
+        if workload.weekday(on) is None:
+            st.info("No lessons at weekends")
+        else:
+            plan = workload.cover_plan(conn, on)
+            if plan.empty:
+                absent = workload.absent_teachers(conn, on)
+                st.success(f"All periods covered ({len(absent)} teacher(s) marked absent)")
+            else:
+                st.dataframe(plan.drop(columns='teacher_id'), hide_index=True)
+                slot = st.selectbox("Other options for", plan.index, key="cover_slot",
+                                    format_func=lambda i: f"Period {plan.at[i, 'period']}: {plan.at[i, 'class']} {plan.at[i, 'subject']}")
+                options = workload.substitutes(conn, on, plan.at[slot, 'period'], plan.at[slot, 'subject'])
+                st.dataframe(options, hide_index=True) if not options.empty else st.info("No free teacher in this period")
+        st.markdown("<h4 style='color:#ffd700;'>Teacher Workload</h4>", unsafe_allow_html=True)
+        load = workload.teacher_load(conn)
+        st.dataframe(load, hide_index=True) if not load.empty else st.info("No teachers")
+    finally:
+        conn.close()
 def headteacher_registers():
-    teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_register_id")
-    if st.button("Check", key="ht_register_btn"):
-        reg = load_data('register')
-        filtered = reg[reg['teacher_id'] == teacher_id]
-        st.dataframe(filtered) if not filtered.empty else st.info("No records")
+    conn = read_connect()
+    try:
+        on = st.date_input("Date", datetime.now().date(), key="register_compliance_date")
+        start = activities.week_start(on)
+        today, week = compliance.missing(conn, on), compliance.missing(conn, start, on)
+        cols = st.columns(2)
+        cols[0].metric("Registers Missing Today", len(today))
+        cols[1].metric("Missing This Week", len(week))
+        st.markdown("<h4 style='color:#ffd700;'>Not Marked</h4>", unsafe_allow_html=True)
+        period = st.radio("Show", ["Today", "This week"], horizontal=True, key="register_missing_period")
+        shown = today if period == "Today" else week
+        st.dataframe(shown, hide_index=True) if not shown.empty else st.success("Every expected register is marked")
+        st.markdown("<h4 style='color:#ffd700;'>Class Teachers</h4>", unsafe_allow_html=True)
+        weeks = st.slider("Compliance over the last (weeks)", 1, 12, 4, key="register_compliance_weeks")
+        rates = compliance.compliance(conn, start - timedelta(weeks=weeks - 1), on, on)
+        st.dataframe(rates, hide_index=True) if not rates.empty else st.info("No class teachers assigned")
+        with st.form("ht_register_form"):
+            teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_register_id")
+            submitted = st.form_submit_button("Check", key="ht_register_btn")
+        if submitted:
+            filtered = compliance.teacher_registers(conn, teacher_id)
+            st.dataframe(filtered) if not filtered.empty else st.info("No records")
+    finally:
+        conn.close()
+def headteacher_notifications():
+    # Messages are sent by the background worker; "Send now" wakes it for a pass without waiting for the next
+    if st.button("Send now", key="notifications_send_btn"):
+        with st.spinner("Sending..."):
+            result = notification_worker(current_tenant().key).send_now()
+        if result is None:
+            st.info("The worker is still sending; the counts below catch up on the next refresh")
+        elif 'error' in result:
+            st.error(f"Sending failed: {result['error']}")
+        else:
+            st.success(f"{result['sent']} sent, {result['failed']} failed"
+                       + (" (per-minute limit reached; the rest follow as it allows)" if result['limited'] else ""))
+    conn = read_connect()
+    try:
+        classes = [r[0] for r in conn.execute("SELECT DISTINCT class FROM students WHERE class != ? ORDER BY class",
+                                              (rollover.ALUMNI_CLASS,)).fetchall()]
+    finally:
+        conn.close()
+    # Scores reach guardians only when published; publishing again after corrections sends just the changed ones
+    with st.form("publish_results_form"):
+        selected = st.multiselect("Publish results for", classes, default=classes, key="publish_results_classes")
+        submitted = st.form_submit_button("Publish Results", key="publish_results_btn")
+    if submitted and not selected:
+        st.error("Choose at least one class")
+    elif submitted:
+        queued = run_service(notifications.publish_results, selected)
+        if queued is not None:
+            st.success(f"{queued} results queued for guardians")
+    conn = read_connect()
+    try:
+        counts = notifications.summary(conn)
+        cols = st.columns(4)
+        cols[0].metric("Items Waiting", counts['pending_items'])
+        cols[1].metric("Messages Queued", counts['queued'])
+        cols[2].metric("Sent Today", counts['sent_today'])
+        cols[3].metric("Failed Today", counts['failed_today'])
+        st.markdown("<h4 style='color:#ffd700;'>Waiting to Be Sent</h4>", unsafe_allow_html=True)
+        pending = pd.read_sql_query("""
+            SELECT o.created_at, o.kind, o.student_id, s.first_name || ' ' || s.surname AS student, s.guardian_phone, o.detail
+            FROM notification_outbox o LEFT JOIN students s ON s.id = o.student_id
+            WHERE o.status = 'pending' ORDER BY o.created_at DESC LIMIT 200
+        """, conn)
+        st.dataframe(pending, hide_index=True) if not pending.empty else st.info("Nothing waiting")
+        st.markdown("<h4 style='color:#ffd700;'>Recent Messages</h4>", unsafe_allow_html=True)
+        sent = pd.read_sql_query("""
+            SELECT created_at, phone, body, items, status, attempts, sent_at, error FROM notifications ORDER BY id DESC LIMIT 200
+        """, conn)
+        st.dataframe(sent, hide_index=True) if not sent.empty else st.info("No messages yet")
+    finally:
+        conn.close()
 def headteacher_reports_tab():
-    teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_reports_id")
-    if st.button("Check", key="ht_reports_btn"):
+    with st.form("ht_reports_form"):
+        teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_reports_id")
+        submitted = st.form_submit_button("Check", key="ht_reports_btn")
+    if submitted:
         rep = load_data('reports')
         filtered = rep[rep['teacher_id'] == teacher_id]
         st.dataframe(filtered) if not filtered.empty else st.info("No reports")
@@ -1109,47 +1673,32 @@ def headteacher_print_fees():
             fees['arrears'] = fees['fee_amount'] - fees['paid_amount'].fillna(0)
             st.download_button("Download", fees.to_csv(index=False), "fees_report_ht.csv", key="ht_download_fees")
 def headteacher_fee_payment():
-    student_id = st.number_input("Student ID", min_value=1, step=1, key="ht_fee_student_id")
-    amount = st.number_input("Amount", min_value=0.0, step=0.01, key="ht_fee_amount")
-    collected_by = st.text_input("Collected By", key="ht_fee_collected")
-    if st.button("Record", key="ht_fee_record_btn"):
-        students = load_data('students')
-        if student_id not in students['id'].values:
-            st.error("Student not found")
-            return
-        class_ = students[students['id'] == student_id]['class'].values[0]
-        fees_data = load_data('fees')
-        fee_row = fees_data[(fees_data['class'] == class_) & (fees_data['student_id'] == student_id)]
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        if fee_row.empty:
-            # Create if not exists
-            class_fee = fees_data[(fees_data['class'] == class_) & fees_data['student_id'].isna()]
-            fee_amount = class_fee['fee_amount'].values[0] if not class_fee.empty else 0
-            cursor.execute("INSERT INTO fees (class, fee_amount, student_id, paid_amount, date_paid, collected_by) VALUES (?, ?, ?, ?, ?, ?)",
-                           (class_, fee_amount, student_id, amount, datetime.now().date(), collected_by))
-        else:
-            current_paid = fee_row['paid_amount'].values[0]
-            cursor.execute("UPDATE fees SET paid_amount = ?, date_paid = ?, collected_by = ? WHERE class = ? AND student_id = ?",
-                           (current_paid + amount, datetime.now().date(), collected_by, class_, student_id))
-        conn.commit()
-        conn.close()
+    with st.form("ht_fee_record_form"):
+        student_id = st.number_input("Student ID", min_value=1, step=1, key="ht_fee_student_id")
+        amount = st.number_input("Amount", min_value=0.0, step=0.01, key="ht_fee_amount")
+        collected_by = st.text_input("Collected By", key="ht_fee_collected")
+        submitted = st.form_submit_button("Record", key="ht_fee_record_btn")
+    if submitted and run_service(services.record_payment, student_id, amount, collected_by) is not None:
         st.success("Payment recorded")
 def headteacher_add_class():
-    class_ = st.text_input("Class", key="ht_add_class")
-    fee = st.number_input("Fee", min_value=0.0, step=0.01, key="ht_add_fee")
-    if st.button("Add", key="ht_add_class_btn"):
-        conn = sqlite3.connect(DATABASE)
+    with st.form("ht_add_class_form"):
+        class_ = st.text_input("Class", key="ht_add_class")
+        fee = st.number_input("Fee", min_value=0.0, step=0.01, key="ht_add_fee")
+        submitted = st.form_submit_button("Add", key="ht_add_class_btn")
+    if submitted:
+        conn = connect()
         cursor = conn.cursor()
         cursor.execute("INSERT OR REPLACE INTO fees (class, fee_amount, student_id) VALUES (?, ?, NULL)", (class_, fee))
         conn.commit()
         conn.close()
         st.success("Class fee added")
 def headteacher_assign_class():
-    class_ = st.text_input("Class", key="ht_assign_class")
-    teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_assign_teacher")
-    if st.button("Assign", key="ht_assign_btn"):
-        conn = sqlite3.connect(DATABASE)
+    with st.form("ht_assign_form"):
+        class_ = st.text_input("Class", key="ht_assign_class")
+        teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_assign_teacher")
+        submitted = st.form_submit_button("Assign", key="ht_assign_btn")
+    if submitted:
+        conn = connect()
         cursor = conn.cursor()
         try:
             cursor.execute("INSERT INTO class_teachers VALUES (?, ?)", (class_, teacher_id))
@@ -1159,104 +1708,160 @@ def headteacher_assign_class():
             st.error("Assignment already exists")
         conn.close()
 def headteacher_mark_teacher_attendance():
-    teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_mark_teacher_id")
-    present = st.checkbox("Present", key="ht_mark_present")
-    if st.button("Mark", key="ht_mark_btn"):
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        date = datetime.now().date()
-        cursor.execute("INSERT OR IGNORE INTO teacher_attendance VALUES (?, ?, ?)", (date, teacher_id, present))
-        conn.commit()
-        conn.close()
+    with st.form("ht_mark_form"):
+        teacher_id = st.number_input("Teacher ID", min_value=1, step=1, key="ht_mark_teacher_id")
+        present = st.checkbox("Present", key="ht_mark_present")
+        submitted = st.form_submit_button("Mark", key="ht_mark_btn")
+    if submitted and run_service(services.mark_teacher_attendance, [teacher_id], present, client_id=ui_client()) is not None:
         st.success("Marked")
 def headteacher_bulk_teacher_attendance():
-    teachers = load_data('teachers')
+    teachers = load_data('teachers', ['id', 'name'])
     if not teachers.empty:
         teacher_options = [f"{row['name']} (ID: {row['id']})" for _, row in teachers.iterrows()]
-        selected = st.multiselect("Select Teachers", teacher_options, key="ht_bulk_teacher_select")
-        present = st.checkbox("Present", key="ht_bulk_teacher_present")
-        if st.button("Mark All", key="ht_bulk_teacher_btn"):
+        with st.form("ht_bulk_teacher_form"):
+            selected = st.multiselect("Select Teachers", teacher_options, key="ht_bulk_teacher_select")
+            present = st.checkbox("Present", key="ht_bulk_teacher_present")
+            submitted = st.form_submit_button("Mark All", key="ht_bulk_teacher_btn")
+        if submitted:
             if selected:
                 selected_ids = [int(s.split("ID: ")[1][:-1]) for s in selected]
-                conn = sqlite3.connect(DATABASE)
-                cursor = conn.cursor()
-                date = datetime.now().date()
-                for tid in selected_ids:
-                    cursor.execute("INSERT OR IGNORE INTO teacher_attendance VALUES (?, ?, ?)", (date, tid, present))
-                conn.commit()
-                conn.close()
+                run_service(services.mark_teacher_attendance, selected_ids, present, client_id=ui_client())
                 st.success(f"Marked {len(selected_ids)} teachers")
             else:
                 st.error("Select at least one teacher")
 def headteacher_bulk_student_attendance():
-    students = load_data('students')
+    students = load_data('students', ['id', 'full_name'])
     if not students.empty:
         student_options = [f"{row['full_name']} (ID: {row['id']})" for _, row in students.iterrows()]
-        selected = st.multiselect("Select Students", student_options, key="ht_bulk_student_select")
-        present = st.checkbox("Present", key="ht_bulk_student_present")
-        if st.button("Mark All", key="ht_bulk_student_btn"):
+        with st.form("ht_bulk_student_form"):
+            selected = st.multiselect("Select Students", student_options, key="ht_bulk_student_select")
+            present = st.checkbox("Present", key="ht_bulk_student_present")
+            submitted = st.form_submit_button("Mark All", key="ht_bulk_student_btn")
+        if submitted:
             if selected:
                 selected_ids = [int(s.split("ID: ")[1][:-1]) for s in selected]
-                conn = sqlite3.connect(DATABASE)
-                cursor = conn.cursor()
-                date = datetime.now().date()
-                for sid in selected_ids:
-                    cursor.execute("INSERT OR IGNORE INTO attendance VALUES (?, ?, ?)", (date, sid, present))
-                conn.commit()
-                conn.close()
+                run_service(services.mark_attendance_bulk, selected_ids, present, client_id=ui_client())
                 st.success(f"Marked {len(selected_ids)} students")
             else:
                 st.error("Select at least one student")
 def headteacher_bulk_class_attendance():
-    class_ = st.text_input("Class", key="ht_bulk_class_input")
-    present = st.checkbox("Present", key="ht_bulk_class_present")
-    if st.button("Mark Class", key="ht_bulk_class_btn"):
-        students = load_data('students')
-        class_students = students[students['class'] == class_]['id'].tolist()
-        if class_students:
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            date = datetime.now().date()
-            for sid in class_students:
-                cursor.execute("INSERT OR IGNORE INTO attendance VALUES (?, ?, ?)", (date, sid, present))
-            conn.commit()
-            conn.close()
-            st.success(f"Marked {len(class_students)} students in {class_}")
-        else:
-            st.error("No students found in class or invalid class")
+    with st.form("ht_bulk_class_form"):
+        class_ = st.text_input("Class", key="ht_bulk_class_input")
+        present = st.checkbox("Present", key="ht_bulk_class_present")
+        submitted = st.form_submit_button("Mark Class", key="ht_bulk_class_btn")
+    if submitted:
+        marked = run_service(services.mark_class_attendance, class_, present, client_id=ui_client())
+        if marked:
+            st.success(f"Marked {marked} students in {class_}")
 def headteacher_summary_reports():
     st.markdown("<h3 style='color:#ffd700;'>Attendance Summary</h3>", unsafe_allow_html=True)
     attendance = load_data('attendance')
-    students = load_data('students')
+    students = load_data('students', ['id'])
     if not attendance.empty and not students.empty:
-        today = datetime.now().date()
+        today = pd.Timestamp(datetime.now().date())
         today_att = attendance[attendance['date'] == today]
-        present_count = today_att[today_att['present'] == 1].shape[0] # BOOLEAN as 1/0
+        present_count = int(today_att['present'].sum())
         total_students = len(students)
         st.metric("Present Students Today", present_count, delta=present_count - total_students)
         st.dataframe(today_att)
     else:
         st.info("No attendance data available")
+# === BULK RESULTS ===
+def read_upload(uploaded_file, as_text=False):
+    # as_text keeps every cell as typed: phone and insurance numbers lose leading zeros and '+' when read as numbers
+    options = {'dtype': str, 'keep_default_na': False} if as_text else {}
+    if uploaded_file.name.lower().endswith('.xlsx'):
+        return pd.read_excel(uploaded_file, **options)  # needs openpyxl
+    return pd.read_csv(uploaded_file, **options)
+def load_class_results(class_, subject):
+    conn = connect()
+    df = pd.read_sql_query("""
+        SELECT s.id AS student_id, s.first_name || ' ' || COALESCE(s.middle_name, '') || ' ' || s.surname AS full_name, r.score
+        FROM students s LEFT JOIN results r ON r.student_id = s.id AND r.subject = ?
+        WHERE s.class = ? ORDER BY s.id
+    """, conn, params=(subject, class_))
+    conn.close()
+    return df
+def bulk_results_entry():
+    st.markdown("<h3 style='color:#ffd700;'>Bulk Results Entry</h3>", unsafe_allow_html=True)
+    conn = connect()
+    classes = [r[0] for r in conn.execute("SELECT DISTINCT class FROM students WHERE class != ? ORDER BY class",
+                                          (rollover.ALUMNI_CLASS,)).fetchall()]
+    conn.close()
+    if not classes:
+        st.info("No students registered yet")
+        return
+    subjects = run_service(services.known_subjects)
+    class_ = st.selectbox("Class", classes, key="bulk_results_class")
+    if subjects:
+        subject = st.selectbox("Subject", subjects, key="bulk_results_subject")
+    else:
+        subject = st.text_input("Subject", key="bulk_results_subject_text").strip()
+    source = st.radio("Source", ["Grid", "Upload CSV/XLSX"], horizontal=True, key="bulk_results_source")
+    batch = None
+    if source == "Grid":
+        grid = st.data_editor(
+            load_class_results(class_, subject), key="bulk_results_grid", hide_index=True,
+            disabled=['student_id', 'full_name'],
+            column_config={'score': st.column_config.NumberColumn("Score", min_value=0, max_value=100, step=1)})
+        batch = grid[grid['score'].notna()][['student_id', 'score']].assign(subject=subject)
+    else:
+        st.caption("Columns: student_id, score and optionally subject (defaults to the selected subject)")
+        uploaded_file = st.file_uploader("Results file", type=['csv', 'xlsx'], key="bulk_results_file")
+        if uploaded_file is not None:
+            try:
+                batch = read_upload(uploaded_file)
+            except ImportError:
+                st.error("Reading .xlsx files requires the openpyxl package; upload a CSV instead")
+            except Exception as e:
+                st.error(f"Could not read file: {str(e)}")
+            if batch is not None:
+                batch.columns = [str(c).strip().lower() for c in batch.columns]
+                missing = {'student_id', 'score'} - set(batch.columns)
+                if missing:
+                    st.error(f"Missing columns: {', '.join(sorted(missing))}")
+                    batch = None
+                elif 'subject' not in batch.columns:
+                    batch['subject'] = subject
+                else:
+                    batch['subject'] = batch['subject'].fillna(subject)
+    if st.button("Save Results", key="bulk_results_save_btn"):
+        if batch is None or batch.empty:
+            st.error("No results to save")
+            return
+        conn = connect()
+        class_ids = [r[0] for r in conn.execute("SELECT id FROM students WHERE class = ?", (class_,)).fetchall()]
+        conn.close()
+        checked = validate_results(batch[['student_id', 'subject', 'score']], class_ids, subjects)
+        rejected = checked[checked['error'] != '']
+        valid = checked[checked['error'] == '']
+        saved = run_service(services.upsert_results, valid) if not valid.empty else None
+        if saved:
+            st.success(f"Saved {saved} results")
+        elif valid.empty:
+            st.error("Nothing saved: every row was rejected")
+        if not rejected.empty:
+            st.warning(f"{len(rejected)} rows rejected")
+            st.dataframe(rejected, hide_index=True)
+            st.download_button("Download Error Report", rejected.to_csv(index=False), "results_errors.csv", key="bulk_results_errors_download")
 # === TEACHER UI ===
 def teacher_ui():
-    tab1, tab2, tab3, tab4 = st.tabs(["Mark Register", "Submit Report", "Mark Attendance", "Add Results"])
-    with tab1:
-        teacher_id = st.number_input("Your ID", min_value=1, step=1, key="teacher_register_id")
-        class_ = st.text_input("Class", key="teacher_register_class")
-        if st.button("Mark", key="teacher_mark_register_btn"):
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            date = datetime.now().date()
-            cursor.execute("INSERT OR IGNORE INTO register VALUES (?, ?, ?, ?)", (teacher_id, class_, date, True))
-            conn.commit()
-            conn.close()
+    section = lazy_tabs(["Mark Register", "Submit Report", "Mark Attendance", "Add Results"], "teacher_section")
+    if section == "Mark Register":
+        with st.form("teacher_mark_register_form"):
+            teacher_id = st.number_input("Your ID", min_value=1, step=1, key="teacher_register_id")
+            class_ = st.text_input("Class", key="teacher_register_class")
+            submitted = st.form_submit_button("Mark", key="teacher_mark_register_btn")
+        if submitted and run_service(services.mark_register, teacher_id, class_, client_id=ui_client()) is not None:
             st.success("Register marked")
-    with tab2:
-        teacher_id = st.number_input("Your ID", min_value=1, step=1, key="teacher_report_id")
-        report = st.text_area("Report", key="teacher_report_content")
-        if st.button("Submit", key="teacher_submit_report_btn"):
+    elif section == "Submit Report":
+        with st.form("teacher_submit_report_form"):
+            teacher_id = st.number_input("Your ID", min_value=1, step=1, key="teacher_report_id")
+            report = st.text_area("Report", key="teacher_report_content")
+            submitted = st.form_submit_button("Submit", key="teacher_submit_report_btn")
+        if submitted:
             if report.strip():
-                conn = sqlite3.connect(DATABASE)
+                conn = connect()
                 cursor = conn.cursor()
                 date = datetime.now().date()
                 cursor.execute("INSERT INTO reports VALUES (?, ?, ?)", (teacher_id, report.strip(), date))
@@ -1265,24 +1870,22 @@ def teacher_ui():
                 st.success("Report submitted")
             else:
                 st.error("Report content required")
-    with tab3:
-        student_id = st.number_input("Student ID", min_value=1, step=1, key="teacher_att_student_id")
-        present = st.checkbox("Present", key="teacher_att_present")
-        if st.button("Mark", key="teacher_mark_att_btn"):
-            conn = sqlite3.connect(DATABASE)
-            cursor = conn.cursor()
-            date = datetime.now().date()
-            cursor.execute("INSERT OR IGNORE INTO attendance VALUES (?, ?, ?)", (date, student_id, present))
-            conn.commit()
-            conn.close()
+    elif section == "Mark Attendance":
+        with st.form("teacher_mark_att_form"):
+            student_id = st.number_input("Student ID", min_value=1, step=1, key="teacher_att_student_id")
+            present = st.checkbox("Present", key="teacher_att_present")
+            submitted = st.form_submit_button("Mark", key="teacher_mark_att_btn")
+        if submitted and run_service(services.mark_attendance_bulk, [student_id], present, client_id=ui_client()) is not None:
             st.success("Attendance marked")
-    with tab4:
-        student_id = st.number_input("Student ID", min_value=1, step=1, key="teacher_result_student_id")
-        subject = st.text_input("Subject", key="teacher_result_subject")
-        score = st.number_input("Score", min_value=0, max_value=100, step=1, key="teacher_result_score")
-        if st.button("Add", key="teacher_add_result_btn"):
+    elif section == "Add Results":
+        with st.form("teacher_add_result_form"):
+            student_id = st.number_input("Student ID", min_value=1, step=1, key="teacher_result_student_id")
+            subject = st.text_input("Subject", key="teacher_result_subject")
+            score = st.number_input("Score", min_value=0, max_value=100, step=1, key="teacher_result_score")
+            submitted = st.form_submit_button("Add", key="teacher_add_result_btn")
+        if submitted:
             if is_valid_subject(subject):
-                conn = sqlite3.connect(DATABASE)
+                conn = connect()
                 cursor = conn.cursor()
                 cursor.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (student_id, subject.strip(), score))
                 conn.commit()
@@ -1290,5 +1893,6 @@ def teacher_ui():
                 st.success("Result added")
             else:
                 st.error("Invalid subject")
+        bulk_results_entry()
 if __name__ == "__main__":
     main()
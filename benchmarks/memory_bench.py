@@ -0,0 +1,45 @@
+# Memory of loaded tables: default read_sql_query frames (as load_data returned them before schema.py) vs the typed
+# frames load_data returns now, in bytes per 10k rows (memory_usage(deep=True), so object strings count in full).
+# Run from the repository root: python -m benchmarks.memory_bench [--students 5000 --years 1]
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import pandas as pd
+from benchmarks.synth import generate_school
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLES = ['students', 'attendance', 'results', 'fees', 'timetables', 'register', 'teachers', 'login_logs']
+def untyped(conn, table):
+    df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+    if table == 'students':
+        df['full_name'] = df['first_name'] + ' ' + df['middle_name'].fillna('') + ' ' + df['surname']
+    return df
+def measure(load):
+    start = time.perf_counter()
+    df = load()
+    return df, time.perf_counter() - start, int(df.memory_usage(deep=True).sum())
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory of untyped and typed table frames")
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--teachers', type=int, default=120)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--db', help="reuse an existing synthetic database instead of generating one")
+    args = parser.parse_args()
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='memory_bench_'), 'school.db')
+    if not args.db:
+        print(f"generated {path}: {generate_school(path, args.students, args.teachers, args.years)}", file=sys.stderr)
+    sys.path.insert(0, ROOT)
+    import schema
+    conn = sqlite3.connect(path)
+    print(f"{'table':<14}{'rows':>10}{'before/10k':>14}{'after/10k':>14}{'saved':>8}{'load before':>13}{'load after':>12}")
+    for table in TABLES:
+        before, before_s, before_bytes = measure(lambda: untyped(conn, table))
+        after, after_s, after_bytes = measure(lambda: schema.load_frame(conn, table))
+        rows = max(len(before), 1)
+        print(f"{table:<14}{len(before):>10}{before_bytes * 10000 / rows / 1e6:>12.2f}MB{after_bytes * 10000 / rows / 1e6:>12.2f}MB"
+              f"{1 - after_bytes / max(before_bytes, 1):>8.0%}{before_s * 1000:>11.0f}ms{after_s * 1000:>10.0f}ms")
+    conn.close()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+# Times the app's data functions and page handlers against a synthetic school and writes a JSON/CSV report.
+# Run from the repository root:
+#   python -m benchmarks.school_bench --students 5000 --years 5 --out bench.json
+#   python -m benchmarks.school_bench --out new.json --compare old.json
+import argparse
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from benchmarks.synth import generate_school, SUBJECTS
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+def timed(name, kind, func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {'name': name, 'kind': kind, 'repeat': repeat, 'min_ms': min(samples) * 1000,
+            'median_ms': statistics.median(samples) * 1000, 'mean_ms': statistics.fmean(samples) * 1000}
+def bench_functions(app, sizes, repeat):
+    results = []
+    for table in ['students', 'teachers', 'attendance', 'results', 'fees', 'timetables', 'register', 'login_logs']:
+        results.append(timed(f"load_data[{table}]", 'function', lambda: app.load_data(table), repeat))
+    results.append(timed("search_profiles[name]", 'function', lambda: app.search_profiles("Mensah"), repeat))
+    results.append(timed("search_profiles[id]", 'function', lambda: app.search_profiles(str(sizes['students'] // 2)), repeat))
+    return results
+def bench_services(path, sizes, repeat):
+    # The service layer on one explicit connection, no Streamlit involved
+    import services
+    conn = services.connect(path)
+    ids = iter(range(1, sizes['students'] + 1))
+    classes = iter(f"Bench{n}" for n in range(repeat))
+    results = [
+        timed("services.check_conflict", 'service', lambda: services.check_conflict(conn, "P3", "Wednesday", 4, 1), repeat),
+        timed("services.available_teachers", 'service', lambda: services.available_teachers(conn, SUBJECTS[0], "P3"), repeat),
+        timed("services.student_report", 'service', lambda: services.student_report(conn, next(ids)), repeat),
+        timed("services.record_payment", 'service', lambda: services.record_payment(conn, next(ids), 10.0, 'Bursar'), repeat),
+        timed("services.mark_class_attendance", 'service', lambda: services.mark_class_attendance(conn, "P3", True), repeat),
+        # A fresh class per sample so the inserts never clash with the generated timetable
+        timed("services.add_timetable_slot", 'service',
+              lambda: services.add_timetable_slot(conn, next(classes), "Monday", 1, SUBJECTS[0]), repeat),
+    ]
+    # A tablet batch of 500 marks, each sample a new school day so every mark is applied
+    import sync
+    days = iter(range(1, repeat + 1))
+    def push():
+        day = f"2030-01-{next(days):02d}"
+        sync.merge_events(conn, [sync.new_event('bench', 'attendance', True, date=day, student_id=(i % sizes['students']) + 1)
+                                 for i in range(500)])
+    results.append(timed("sync.merge_events (500 marks)", 'service', push, repeat))
+    conn.close()
+    return results
+def bench_api(path, repeat):
+    # The HTTP API on a loopback port, one keep-alive connection; the 304 case skips the query entirely
+    import asyncio
+    import http.client
+    import threading
+    import api
+    api.DATABASE = path
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(api.handle, '127.0.0.1', 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    client = http.client.HTTPConnection('127.0.0.1', server.sockets[0].getsockname()[1])
+    def get(target, headers=None):
+        client.request('GET', target, headers=headers or {})
+        response = client.getresponse()
+        response.read()
+        return response
+    target = '/attendance?class=P3&limit=500'
+    etag = get(target).getheader('ETag')
+    results = [
+        timed("api GET /attendance (500 rows)", 'api', lambda: get(target), repeat),
+        timed("api GET /attendance (304)", 'api', lambda: get(target, {'If-None-Match': etag}), repeat),
+        timed("api GET /students/<id>", 'api', lambda: get('/students/1'), repeat),
+    ]
+    client.close()
+    async def shutdown():
+        # The closed client lets the connection handler finish before the loop stops
+        server.close()
+        await asyncio.gather(*(t for t in asyncio.all_tasks() if t is not asyncio.current_task()))
+        loop.stop()
+    asyncio.run_coroutine_threadsafe(shutdown(), loop)
+    return results
+def page_runner(role, menu_key, page, section=None):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=600)
+    at.session_state['logged_in'] = True
+    at.session_state['role'] = role
+    at.session_state['username'] = role
+    at.run()
+    at.sidebar.selectbox(key=menu_key).set_value(page).run()
+    if section:
+        at.radio(key=section[0]).set_value(section[1]).run()
+    if at.exception:
+        raise RuntimeError(f"{page}: {at.exception[0].value}")
+    return at
+def bench_pages(sizes, repeat):
+    # Each sample is one full script rerun of the page, as a browser interaction would trigger
+    pages = [
+        ('admin', 'admin_menu', 'Dashboard', None),
+        ('admin', 'admin_menu', 'Students', ('students_section', 'Update Profile')),
+        ('admin', 'admin_menu', 'Fees', ('fees_section', 'Records')),
+        ('admin', 'admin_menu', 'Database', None),
+        ('admin', 'admin_menu', 'View Timetable', None),
+        ('headteacher', 'headteacher_menu', 'View Fees Records', None),
+        ('headteacher', 'headteacher_menu', 'Reports', None),
+        ('headteacher', 'headteacher_menu', 'Timetable Management', None),
+        ('headteacher', 'headteacher_menu', 'Bulk Student Attendance', None),
+        ('teacher', 'teacher_menu', 'Teacher Panel', None),
+    ]
+    results = []
+    for role, menu_key, page, section in pages:
+        at = page_runner(role, menu_key, page, section)
+        label = f"page[{role}:{page}{':' + section[1] if section else ''}]"
+        results.append(timed(label, 'page', at.run, repeat))
+    # Writes go through the page handlers' forms, the same path a click takes
+    at = page_runner('admin', 'admin_menu', 'Fees', ('fees_section', 'Payment'))
+    student_ids = iter(range(1, sizes['students'] + 1))
+    def pay():
+        at.number_input(key='fees_student_id').set_value(next(student_ids))
+        at.number_input(key='fees_amount').set_value(10.0)
+        at.text_input(key='fees_collected_by').set_value('Bursar')
+        at.button(key='record_payment_button').click().run()
+    results.append(timed("write[fee payment form]", 'write', pay, repeat))
+    at = page_runner('teacher', 'teacher_menu', 'Teacher Panel', ('teacher_section', 'Mark Attendance'))
+    def mark():
+        at.number_input(key='teacher_att_student_id').set_value(next(student_ids))
+        at.checkbox(key='teacher_att_present').check()
+        at.button(key='teacher_mark_att_btn').click().run()
+    results.append(timed("write[attendance form]", 'write', mark, repeat))
+    at = page_runner('headteacher', 'headteacher_menu', 'Bulk Student Attendance by Class')
+    def mark_class():
+        at.text_input(key='ht_bulk_class_input').set_value('P3')
+        at.button(key='ht_bulk_class_btn').click().run()
+    results.append(timed("write[class attendance form]", 'write', mark_class, repeat))
+    return results
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+def write_report(report, path):
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['name', 'kind', 'repeat', 'min_ms', 'median_ms', 'mean_ms'])
+            writer.writeheader()
+            writer.writerows(report['results'])
+    else:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+def read_report(path):
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            return {'results': [dict(r, median_ms=float(r['median_ms'])) for r in csv.DictReader(f)]}
+    with open(path) as f:
+        return json.load(f)
+def print_report(report, baseline=None):
+    before = {r['name']: r['median_ms'] for r in baseline['results']} if baseline else {}
+    print(f"{'benchmark':<52}{'median ms':>12}" + (f"{'baseline':>12}{'change':>10}" if baseline else ""))
+    for r in report['results']:
+        line = f"{r['name']:<52}{r['median_ms']:>12.2f}"
+        if r['name'] in before:
+            line += f"{before[r['name']]:>12.2f}{r['median_ms'] / before[r['name']]:>9.2f}x"
+        print(line)
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the school app against a synthetic database")
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--teachers', type=int, default=30)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', help="reuse an existing synthetic database instead of generating one")
+    parser.add_argument('--skip-pages', action='store_true', help="only time the data functions")
+    parser.add_argument('--out', help="report path (.json or .csv)")
+    parser.add_argument('--compare', help="earlier report to compare against")
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix='school_bench_')
+    path = args.db or os.path.join(workdir, 'school.db')
+    sizes = {'students': args.students, 'teachers': args.teachers, 'years': args.years, 'seed': args.seed}
+    if not args.db:
+        start = time.perf_counter()
+        sizes = generate_school(path, args.students, args.teachers, args.years, args.seed)
+        print(f"generated {path} in {time.perf_counter() - start:.1f}s: {sizes}", file=sys.stderr)
+    # Read when the app first loads its school registry, in this process and in every AppTest page run
+    os.environ['SCHOOL_DB'] = path
+    os.environ['SCHOOL_IMAGE_PATH'] = ROOT
+    os.environ['SCHOOL_PHOTO_FOLDER'] = os.path.join(workdir, 'student_photos')
+    sys.path.insert(0, ROOT)
+    import app
+    results = bench_functions(app, sizes, args.repeat) + bench_services(path, sizes, args.repeat) + bench_api(path, args.repeat)
+    if not args.skip_pages:
+        results += bench_pages(sizes, args.repeat)
+    report = {'created': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+              'python': platform.python_version(), 'sizes': sizes, 'results': results}
+    print_report(report, read_report(args.compare) if args.compare else None)
+    if args.out:
+        write_report(report, args.out)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# Deterministic synthetic school for benchmarks: same arguments -> same rows, written into a throwaway SQLite file.
+# python -m benchmarks.synth out.db --students 5000 --teachers 120 --years 5
+import argparse
+import random
+import sqlite3
+from datetime import date, datetime, timedelta
+CLASSES = ["KG1", "KG2", "P1", "P2", "P3", "P4", "P5", "P6", "JHS1", "JHS2", "JHS3"]
+SUBJECTS = ["Mathematics", "English", "Science", "Social Studies", "ICT", "French", "Twi", "RME", "Creative Arts", "PE"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+FIRST = ["Kofi", "Ama", "Kwame", "Esi", "Yaw", "Akosua", "Kojo", "Abena", "Kwabena", "Adwoa", "Kwaku", "Afua", "Fiifi", "Efua"]
+SURNAMES = ["Mensah", "Asare", "Boateng", "Owusu", "Badu", "Osei", "Agyeman", "Darko", "Appiah", "Addo", "Frimpong", "Amoah"]
+TOWNS = ["Accra", "Kumasi", "Tema", "Kasoa", "Madina", "Ashaiman", "Nkawkaw"]
+COLLECTORS = ["Bursar", "Accountant", "Headteacher"]
+END_DATE = date(2025, 7, 25)
+def school_days(years, end=END_DATE):
+    day = end - timedelta(days=365 * years)
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+def create_schema(path):
+    # Reuse the app's own schema so benchmarks always run against what init_db() builds
+    import app
+    app.init_db(path)
+def generate_school(path, students=500, teachers=30, years=1, seed=0, end=END_DATE):
+    rnd = random.Random(seed)
+    create_schema(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    days = list(school_days(years, end))
+    teacher_rows = [(i, f"{rnd.choice(FIRST)} {rnd.choice(SURNAMES)}", SUBJECTS[(i - 1) % len(SUBJECTS)],
+                     f"teacher{i}@doboadu.edu.gh", f"024{i:07d}") for i in range(1, teachers + 1)]
+    conn.executemany("INSERT INTO teachers VALUES (?, ?, ?, ?, ?)", teacher_rows)
+    conn.executemany("INSERT INTO non_teaching VALUES (?, ?, ?, ?, ?)", [
+        (i, f"{rnd.choice(FIRST)} {rnd.choice(SURNAMES)}", rnd.choice(["Cleaner", "Cook", "Security", "Driver"]),
+         f"staff{i}@doboadu.edu.gh", f"020{i:07d}") for i in range(1, max(2, teachers // 4) + 1)])
+    student_rows = []
+    for i in range(1, students + 1):
+        class_ = CLASSES[(i - 1) % len(CLASSES)]
+        age = 4 + CLASSES.index(class_)
+        dob = end - timedelta(days=365 * age + rnd.randrange(365))
+        student_rows.append((i, rnd.choice(FIRST), rnd.choice(FIRST + [None, None]), rnd.choice(SURNAMES), class_, dob,
+                             rnd.choice(["Male", "Female"]), rnd.choice(TOWNS), f"{rnd.choice(FIRST)} {rnd.choice(SURNAMES)}",
+                             f"02{rnd.randrange(10 ** 8):08d}", f"NHIS{rnd.randrange(10 ** 6):06d}", days[0],
+                             int(rnd.random() < 0.05), None, None))
+    conn.executemany("INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", student_rows)
+    # Subject teachers: the n-th teacher of a subject covers every n-th class, timetable slots follow the assignments
+    by_subject = {s: [t[0] for t in teacher_rows if t[2] == s] for s in SUBJECTS}
+    assignments, busy, slots = [], set(), []
+    for c_index, class_ in enumerate(CLASSES):
+        for subject in SUBJECTS:
+            pool = by_subject[subject]
+            if pool:
+                assignments.append((len(assignments) + 1, class_, subject, pool[c_index % len(pool)]))
+        for d_index, day in enumerate(DAYS):
+            for period in range(1, 9):
+                subject = SUBJECTS[(c_index + d_index * 8 + period) % len(SUBJECTS)]
+                pool = by_subject[subject]
+                start = c_index % len(pool) if pool else 0
+                teacher = next((t for t in pool[start:] + pool[:start] if (t, day, period) not in busy), None)
+                if teacher is not None:
+                    busy.add((teacher, day, period))
+                slots.append((len(slots) + 1, class_, day, period, subject, teacher))
+    conn.executemany("INSERT INTO subject_assignments VALUES (?, ?, ?, ?)", assignments)
+    conn.executemany("INSERT INTO timetables VALUES (?, ?, ?, ?, ?, ?)", slots)
+    class_teachers = [(class_, (i % teachers) + 1) for i, class_ in enumerate(CLASSES)] if teachers else []
+    conn.executemany("INSERT INTO class_teachers VALUES (?, ?)", class_teachers)
+    conn.executemany("INSERT INTO attendance VALUES (?, ?, ?)",
+                     ((day, sid, int(rnd.random() < 0.93)) for day in days for sid in range(1, students + 1)))
+    conn.executemany("INSERT INTO teacher_attendance VALUES (?, ?, ?)",
+                     ((day, tid, int(rnd.random() < 0.96)) for day in days for tid in range(1, teachers + 1)))
+    conn.executemany("INSERT INTO register VALUES (?, ?, ?, ?)",
+                     ((tid, class_, day, 1) for day in days for class_, tid in class_teachers if rnd.random() < 0.9))
+    conn.executemany("INSERT INTO results VALUES (?, ?, ?)",
+                     ((sid, subject, min(100, max(0, int(rnd.gauss(62, 15)))))
+                      for sid in range(1, students + 1) for subject in SUBJECTS))
+    class_fees = {class_: 400.0 + 50 * i for i, class_ in enumerate(CLASSES)}
+    conn.executemany("INSERT INTO fees (class, fee_amount, student_id) VALUES (?, ?, NULL)", class_fees.items())
+    fee_rows = []
+    for sid, _, _, _, class_, *_ in student_rows:
+        paid = round(class_fees[class_] * rnd.choice([0, 0.25, 0.5, 0.75, 1, 1]), 2)
+        fee_rows.append((class_, class_fees[class_], sid, paid, rnd.choice(days) if paid else None,
+                         rnd.choice(COLLECTORS) if paid else None))
+    conn.executemany("INSERT INTO fees VALUES (?, ?, ?, ?, ?, ?)", fee_rows)
+    conn.executemany("INSERT INTO reports VALUES (?, ?, ?)",
+                     ((tid, "Weekly lesson notes submitted", day) for day in days[::5] for tid in range(1, teachers + 1)))
+    conn.executemany("INSERT INTO salary VALUES (?, ?, ?, ?)",
+                     ((tid, f"{y}-{m:02d}", 2500.0, 1) for tid in range(1, teachers + 1)
+                      for y in range(end.year - years, end.year + 1) for m in range(1, 13)))
+    logins = [(i + 1, rnd.choice(["admin", "headteacher", "teacher1"]),
+               datetime.combine(day, datetime.min.time()) + timedelta(hours=7, minutes=rnd.randrange(120)), None)
+              for i, day in enumerate(d for d in days for _ in range(3))]
+    conn.executemany("INSERT INTO login_logs VALUES (?, ?, ?, ?)", logins)
+    conn.executemany("INSERT INTO activities VALUES (?, ?, ?, ?)",
+                     ((i + 1, f"Assembly {i + 1}", day, "Whole school") for i, day in enumerate(days[::5])))
+    conn.commit()
+    conn.close()
+    return {'students': students, 'teachers': teachers, 'years': years, 'seed': seed, 'school_days': len(days),
+            'attendance_rows': len(days) * students}
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic school database")
+    parser.add_argument('path')
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--teachers', type=int, default=30)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(generate_school(args.path, args.students, args.teachers, args.years, args.seed))
+if __name__ == '__main__':
+    main()
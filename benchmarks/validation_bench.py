@@ -0,0 +1,80 @@
+# Micro-benchmark for validation.py: per-record checks (legacy re.match, precompiled scalar) vs pandas Series checks.
+# Run from the repository root: python -m benchmarks.validation_bench [--rows 100000]
+import argparse
+import random
+import re
+import time
+from datetime import date, timedelta
+import pandas as pd
+import validation
+def make_records(rows, seed=42):
+    # Mostly distinct values (random phones, suffixed names and emails) so per-value caching cannot flatter the numbers
+    rnd = random.Random(seed)
+    first = ["Kofi", "Ama", "Kwame", "Esi", "Yaw", "Akosúa", "Kojo", "Ọlá", "K0fi", "Jean-Paul", ""]
+    start = date.today() - timedelta(days=20 * 365)
+    def phone():
+        return rnd.choice(["0", "+233", ""]) + "".join(rnd.choice("0123456789") for _ in range(rnd.choice([6, 9, 10, 12])))
+    def email(i):
+        return rnd.choice([f"user{i}@school.edu.gh", f"user{i}.mail.com", f"user{i}@"])
+    def name(i):
+        base = rnd.choice(first)
+        return base + " " + "".join(chr(97 + int(d)) for d in str(i)) if base else base
+    return pd.DataFrame({
+        'first_name': [name(i) for i in range(rows)],
+        'guardian_phone': [phone() for _ in range(rows)],
+        'email': [email(i) for i in range(rows)],
+        'dob': [(start + timedelta(days=rnd.randrange(20 * 365))).isoformat() for _ in range(rows)],
+        'insurance_number': [rnd.choice(["NHIS", "NHIS-"]) + str(rnd.randrange(10 ** rnd.randrange(1, 8))) for _ in range(rows)],
+    })
+# The validators as they were in app.py before validation.py (regex looked up through re.match on every call)
+def legacy_row(r):
+    return (
+        bool(r['first_name'].strip() and all(c.isalpha() or c.isspace() for c in r['first_name'].strip())),
+        bool(re.match(r'^\+?\d{10,15}$', r['guardian_phone'])) if r['guardian_phone'] else False,
+        bool(re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', r['email'])) if r['email'] else False,
+        validation.is_valid_date(date.fromisoformat(r['dob'])),
+        bool(r['insurance_number'].strip() and len(r['insurance_number'].strip()) >= 5),
+    )
+def legacy_iterrows(df):
+    return [legacy_row(r) for _, r in df.iterrows()]
+def scalar_row(r):
+    return (
+        validation.is_valid_name_part(r['first_name']),
+        validation.is_valid_phone(r['guardian_phone']),
+        validation.is_valid_email(r['email']),
+        validation.is_valid_date(date.fromisoformat(r['dob'])),
+        validation.is_valid_insurance_number(r['insurance_number']),
+    )
+def vectorized(df):
+    return pd.DataFrame({
+        'first_name': validation.invalid_name_part(df['first_name']),
+        'guardian_phone': validation.invalid_phone(df['guardian_phone']),
+        'email': validation.invalid_email(df['email']),
+        'dob': validation.invalid_date(validation.parse_dates(df['dob'])),
+        'insurance_number': validation.invalid_insurance_number(df['insurance_number']),
+    })
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    df = make_records(args.rows)
+    records = df.to_dict('records')
+    iterrows_t, _ = timed(legacy_iterrows, df, repeat=1)
+    legacy_t, legacy = timed(lambda: [legacy_row(r) for r in records], repeat=args.repeat)
+    scalar_t, scalar = timed(lambda: [scalar_row(r) for r in records], repeat=args.repeat)
+    vector_t, masks = timed(vectorized, df, repeat=args.repeat)
+    # All three must agree before the timings mean anything
+    assert [not all(x) for x in legacy] == [not all(x) for x in scalar] == masks.any(axis=1).tolist()
+    print(f"{args.rows:,} records, best of {args.repeat}")
+    for label, seconds in [("legacy df.iterrows", iterrows_t), ("legacy per-record", legacy_t), ("precompiled per-record", scalar_t), ("vectorized Series", vector_t)]:
+        print(f"  {label:<24}{seconds * 1000:>10.1f} ms{args.rows / seconds:>14,.0f} rows/s")
+if __name__ == '__main__':
+    main()
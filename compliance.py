@@ -0,0 +1,96 @@
+# Register compliance: which classes have no register marked on a school day, and each teacher's record.
+# A class teacher's class is expected to be registered on every weekday it is timetabled (every weekday if the
+# class has no timetable yet); "missing" is an anti-join from class_teachers x days to register through
+# (class, date) indexes, so it costs one probe per class and day rather than loading the register table.
+# register_streaks keeps, per teacher, the days marked and the current and best runs of consecutive school days.
+# Triggers on register recompute only the marking teacher's row, from that teacher's own register rows.
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Optional
+import pandas as pd
+from validation import DAYS
+EPOCH = date(1900, 1, 1)  # a Monday
+# School-day number of a weekday date: consecutive school days differ by 1, Friday to Monday included
+_SCHOOL_DAY = "(CAST(julianday({0}) - julianday('1900-01-01') AS INTEGER) / 7 * 5 + CAST(julianday({0}) - julianday('1900-01-01') AS INTEGER) % 7)"
+def _refresh_sql(teacher: Optional[str]) -> str:
+    # Rebuilds register_streaks for one teacher (an SQL expression such as NEW.teacher_id) or, with None, for all.
+    # Consecutive marked days share n + row number (descending), so each group is one run; no WITH: not allowed in triggers.
+    only = f"AND teacher_id = {teacher}" if teacher else ""
+    return f"""
+        DELETE FROM register_streaks WHERE 1 {only};
+        INSERT INTO register_streaks (teacher_id, first_marked, last_marked, days_marked, streak, best_streak)
+        SELECT teacher_id, MIN(run_start), MAX(run_end), SUM(length), MAX(latest), MAX(length) FROM (
+            SELECT teacher_id, run_start, run_end, length,
+                   FIRST_VALUE(length) OVER (PARTITION BY teacher_id ORDER BY run_end DESC) AS latest
+            FROM (SELECT teacher_id, MIN(date) AS run_start, MAX(date) AS run_end, COUNT(*) AS length FROM (
+                      SELECT teacher_id, date,
+                             {_SCHOOL_DAY.format('date')} + ROW_NUMBER() OVER (PARTITION BY teacher_id ORDER BY date DESC) AS run
+                      FROM (SELECT DISTINCT teacher_id, date FROM register
+                            WHERE marked AND strftime('%w', date) NOT IN ('0', '6') {only}))
+                  GROUP BY teacher_id, run))
+        GROUP BY teacher_id;
+    """
+def ensure_compliance(conn: sqlite3.Connection) -> None:
+    created = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'register_streaks'").fetchone() is None
+    conn.executescript(f"""
+        CREATE INDEX IF NOT EXISTS idx_register_class_date ON register (class, date, marked);
+        CREATE TABLE IF NOT EXISTS register_streaks (teacher_id INTEGER PRIMARY KEY, first_marked DATE NOT NULL,
+            last_marked DATE NOT NULL, days_marked INTEGER NOT NULL, streak INTEGER NOT NULL, best_streak INTEGER NOT NULL);
+        CREATE TRIGGER IF NOT EXISTS register_streaks_insert AFTER INSERT ON register
+        BEGIN {_refresh_sql('NEW.teacher_id')} END;
+        CREATE TRIGGER IF NOT EXISTS register_streaks_update AFTER UPDATE ON register
+        BEGIN {_refresh_sql('OLD.teacher_id')} {_refresh_sql('NEW.teacher_id')} END;
+        CREATE TRIGGER IF NOT EXISTS register_streaks_delete AFTER DELETE ON register
+        BEGIN {_refresh_sql('OLD.teacher_id')} END;
+    """)
+    if created:
+        with conn:
+            conn.executescript(_refresh_sql(None))
+def school_days(start: date, end: date) -> list:
+    # (date, timetable day) for each weekday in [start, end]
+    days = (start + timedelta(days=i) for i in range((end - start).days + 1))
+    return [(d.isoformat(), DAYS[d.weekday()]) for d in days if d.weekday() < len(DAYS)]
+def _school_day(on: date) -> int:
+    # As _SCHOOL_DAY; a weekend day numbers as the Monday after it
+    days = (on - EPOCH).days
+    return days // 7 * 5 + min(days % 7, 5)
+def _expected(start, end):
+    # -> (FROM clause of expected (date, class, teacher) rows, params); empty when the range has no school days
+    days = school_days(start, end)
+    values = ", ".join(["(?, ?)"] * len(days)) or "(NULL, NULL)"
+    return f"""
+        FROM (SELECT column1 AS date, column2 AS day FROM (VALUES {values})) d
+        CROSS JOIN class_teachers ct LEFT JOIN teachers t ON t.id = ct.teacher_id
+        WHERE d.date IS NOT NULL
+          AND (EXISTS (SELECT 1 FROM timetables tt WHERE tt.class = ct.class AND tt.day = d.day)
+               OR NOT EXISTS (SELECT 1 FROM timetables tt WHERE tt.class = ct.class))
+    """, [v for row in days for v in row]
+def missing(conn: sqlite3.Connection, start: date, end: Optional[date] = None) -> pd.DataFrame:
+    # Expected registers in [start, end] with no marked register for the class that day, by anyone
+    sql, params = _expected(start, end or start)
+    return pd.read_sql_query(f"""
+        SELECT d.date, d.day, ct.class, ct.teacher_id, t.name AS class_teacher {sql}
+          AND NOT EXISTS (SELECT 1 FROM register r WHERE r.class = ct.class AND r.date = d.date AND r.marked)
+        ORDER BY d.date, ct.class
+    """, conn, params=params)
+def compliance(conn: sqlite3.Connection, start: date, end: date, today: Optional[date] = None) -> pd.DataFrame:
+    # Per class teacher over [start, end]: registers expected and marked, rate, and the running streaks.
+    # A streak still counts if the teacher marked on the last school day before today, as today's may be yet to come.
+    sql, params = _expected(start, end)
+    df = pd.read_sql_query(f"""
+        SELECT e.teacher_id, e.name, e.classes, e.expected, e.marked, ROUND(100.0 * e.marked / e.expected, 1) AS rate,
+               s.last_marked, COALESCE(s.streak, 0) AS streak, COALESCE(s.best_streak, 0) AS best_streak,
+               COALESCE(s.days_marked, 0) AS days_marked
+        FROM (SELECT ct.teacher_id, t.name, GROUP_CONCAT(DISTINCT ct.class) AS classes, COUNT(*) AS expected,
+                     SUM(EXISTS (SELECT 1 FROM register r WHERE r.class = ct.class AND r.date = d.date AND r.marked)) AS marked
+              {sql} GROUP BY ct.teacher_id) e
+        LEFT JOIN register_streaks s ON s.teacher_id = e.teacher_id
+        ORDER BY rate, e.teacher_id
+    """, conn, params=params)
+    now = _school_day(today or datetime.now().date())
+    lapsed = df['last_marked'].map(lambda d: not isinstance(d, str) or _school_day(date.fromisoformat(d)) < now - 1)
+    df.loc[lapsed, 'streak'] = 0
+    return df
+def teacher_registers(conn: sqlite3.Connection, teacher_id: int) -> pd.DataFrame:
+    return pd.read_sql_query("SELECT * FROM register WHERE teacher_id = ? ORDER BY date DESC, class", conn,
+                             params=(int(teacher_id),))
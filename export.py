@@ -0,0 +1,226 @@
+# Columnar analytics export: Parquet copies of the history tables, for multi-year analysis away from the live database.
+#   <folder>/<table>/month=YYYY-MM/part-<first rowid>.parquet   attendance, register, login_logs (by their date column)
+#   <folder>/<table>/snapshot=YYYY-MM-DD/part-0.parquet         results, fees (the whole table, as it stood that day)
+# Runs are incremental. The event tables keep a rowid high-water mark, and each run appends one part per month
+# holding only rows past it. Triggers mark a month dirty when one of its rows is updated, deleted or replaced;
+# that month is rewritten from the database in the next run instead of appended to. results and fees have no
+# event date and are small, so a run writes a new snapshot only if their table_versions generation moved.
+# A run holds the write lock only to claim dirty months and record watermarks. Rows are read in a read
+# transaction (WAL: writers carry on) and written to Parquet with no database lock held. A run that dies part way
+# is safe to repeat: parts are named by the first rowid they hold, and claimed months stay dirty until written.
+# read() is what pages and notebooks use: hive partitions are pruned and filters reach the row-group statistics.
+#   python export.py [database] [folder]
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import schema
+EXPORT_DIR = os.environ.get('SCHOOL_EXPORT_DIR', 'exports')
+EXPORT_INTERVAL = float(os.environ.get('SCHOOL_EXPORT_INTERVAL', 3600))  # seconds between scheduled runs; 0 = off
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+# table: (date column partitioned on, key columns that a replace collides on, Arrow schema)
+EVENTS = {
+    'attendance': ('date', ['date', 'student_id'],
+                   pa.schema([('date', pa.date32()), ('student_id', pa.int32()), ('present', pa.bool_())])),
+    'register': ('date', ['teacher_id', 'class', 'date'],
+                 pa.schema([('teacher_id', pa.int32()), ('class', _CATEGORY), ('date', pa.date32()), ('marked', pa.bool_())])),
+    'login_logs': ('login_time', ['id'],
+                   pa.schema([('id', pa.int64()), ('username', _CATEGORY), ('login_time', pa.timestamp('s')),
+                              ('ip_address', _CATEGORY)])),
+}
+SNAPSHOTS = {
+    'results': pa.schema([('student_id', pa.int32()), ('subject', _CATEGORY), ('score', pa.int16())]),
+    'fees': pa.schema([('class', _CATEGORY), ('fee_amount', pa.float64()), ('student_id', pa.int32()),
+                       ('paid_amount', pa.float64()), ('date_paid', pa.date32()), ('collected_by', _CATEGORY)]),
+}
+TABLES = list(EVENTS) + list(SNAPSHOTS)
+ROW_GROUP = 64 * 1024  # rows per row group: small enough for statistics to skip most of a year
+def _month(column, row='NEW'):
+    return f"COALESCE(substr({row}.{column}, 1, 7), 'unknown')"
+def ensure_export(conn: sqlite3.Connection) -> None:
+    # export_state: per table, the rowid (events) or generation (snapshots) already exported, and rows the last run wrote
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_state (name TEXT PRIMARY KEY, watermark INTEGER NOT NULL DEFAULT 0,
+        exported_at TEXT, rows INTEGER NOT NULL DEFAULT 0)
+    """)
+    # export_dirty: months to rewrite; claimed_by is the watermark of the run rewriting it, reset when marked again
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_dirty (name TEXT NOT NULL, month TEXT NOT NULL, claimed_by INTEGER,
+        PRIMARY KEY (name, month))
+    """)
+    for table, (column, keys, _) in EVENTS.items():
+        mark = "INSERT INTO export_dirty VALUES ('{0}', {1}, NULL) ON CONFLICT DO UPDATE SET claimed_by = NULL;"
+        same_key = " AND ".join(f"{k} = NEW.{k}" for k in keys)
+        conn.executescript(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_export_replace BEFORE INSERT ON {table}
+            WHEN EXISTS (SELECT 1 FROM {table} WHERE {same_key})
+            BEGIN {mark.format(table, _month(column))} END;
+            CREATE TRIGGER IF NOT EXISTS {table}_export_update AFTER UPDATE ON {table}
+            BEGIN {mark.format(table, _month(column, 'OLD'))} {mark.format(table, _month(column))} END;
+            CREATE TRIGGER IF NOT EXISTS {table}_export_delete AFTER DELETE ON {table}
+            BEGIN {mark.format(table, _month(column, 'OLD'))} END;
+        """)
+    conn.commit()
+# === WRITING ===
+def _arrow(df, table, schema_):
+    # Through schema.typed() so dates, flags and nullable IDs convert as they do for load_data()
+    return pa.Table.from_pandas(schema.typed(df, schema.TABLES[table]), schema=schema_, preserve_index=False)
+def _write(table, folder, name):
+    # Written under a temporary name and renamed, so a reader never opens half a file
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    temp = os.path.join(folder, f".{name}.{uuid.uuid4().hex}.tmp")
+    pq.write_table(table, temp, row_group_size=ROW_GROUP, compression='zstd')
+    os.replace(temp, path)
+    return path
+def _parts(folder):
+    return sorted(f for f in os.listdir(folder) if f.endswith('.parquet')) if os.path.isdir(folder) else []
+def _export_events(conn, root, table):
+    column, _, schema_ = EVENTS[table]
+    names = ", ".join(f'"{c}"' for c in schema_.names)
+    month = f"COALESCE(substr({column}, 1, 7), 'unknown')"
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        watermark = conn.execute("SELECT watermark FROM export_state WHERE name = ?", (table,)).fetchone()[0]
+        bound = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+        conn.execute("UPDATE export_dirty SET claimed_by = ? WHERE name = ?", (bound, table))
+        dirty = [r[0] for r in conn.execute("SELECT month FROM export_dirty WHERE name = ?", (table,))]
+    # Rows up to bound only: anything later is the next run's, whichever month it falls in
+    conn.execute("BEGIN")
+    try:
+        fresh = pd.read_sql_query(f"""
+            SELECT {month} AS month, {names} FROM {table} WHERE rowid > ? AND rowid <= ? ORDER BY month, {column}
+        """, conn, params=(watermark, bound))
+        fresh = fresh[~fresh['month'].isin(dirty)]
+        rewritten = {}
+        for m in dirty:
+            # Months never exported and still empty have nothing to rewrite; the range makes this an index scan
+            where = f"{column} >= ? AND {column} < ?" if m != 'unknown' else f"{column} IS NULL"
+            params = (m, m + '~') if m != 'unknown' else ()
+            rewritten[m] = pd.read_sql_query(f"SELECT {names} FROM {table} WHERE {where} AND rowid <= ? ORDER BY {column}",
+                                             conn, params=(*params, bound))
+    finally:
+        conn.rollback()
+    rows, name = 0, f"part-{watermark + 1:012d}.parquet"
+    for m, part in fresh.groupby('month', sort=True):
+        rows += len(part)
+        _write(_arrow(part.drop(columns='month'), table, schema_), os.path.join(root, table, f"month={m}"), name)
+    for m, part in rewritten.items():
+        folder = os.path.join(root, table, f"month={m}")
+        old = _parts(folder)
+        rows += len(part)
+        if len(part):
+            _write(_arrow(part, table, schema_), folder, name)
+        for other in old:
+            if other != name or not len(part):
+                os.remove(os.path.join(folder, other))
+    with conn:
+        conn.execute("UPDATE export_state SET watermark = ?, exported_at = ?, rows = ? WHERE name = ?",
+                     (bound, datetime.now().isoformat(timespec='seconds'), rows, table))
+        conn.execute("DELETE FROM export_dirty WHERE name = ? AND claimed_by = ?", (table, bound))
+    return {'appended': len(fresh), 'rewritten_months': sorted(rewritten), 'rows_written': rows}
+def _export_snapshot(conn, root, table, on):
+    schema_ = SNAPSHOTS[table]
+    names = ", ".join(f'"{c}"' for c in schema_.names)
+    conn.execute("BEGIN")
+    try:
+        watermark = conn.execute("SELECT watermark FROM export_state WHERE name = ?", (table,)).fetchone()[0]
+        generation = conn.execute("SELECT generation FROM table_versions WHERE name = ?", (table,)).fetchone()[0]
+        df = pd.read_sql_query(f"SELECT {names} FROM {table}", conn) if generation != watermark else None
+    finally:
+        conn.rollback()
+    if df is None:
+        return {'snapshot': None, 'rows_written': 0}
+    _write(_arrow(df, table, schema_), os.path.join(root, table, f"snapshot={on.isoformat()}"), "part-0.parquet")
+    with conn:
+        conn.execute("UPDATE export_state SET watermark = ?, exported_at = ?, rows = ? WHERE name = ?",
+                     (generation, datetime.now().isoformat(timespec='seconds'), len(df), table))
+    return {'snapshot': on.isoformat(), 'rows_written': len(df)}
+def run_export(database: str, folder: str = EXPORT_DIR, tables: Iterable[str] = TABLES, on: Optional[date] = None) -> dict:
+    # One incremental pass over tables; returns what each table wrote
+    on = on or datetime.now().date()
+    conn = sqlite3.connect(database, timeout=30, isolation_level=None, check_same_thread=False)
+    try:
+        ensure_export(conn)
+        conn.executemany("INSERT OR IGNORE INTO export_state (name) VALUES (?)", [(t,) for t in TABLES])
+        report = {}
+        for table in tables:
+            report[table] = _export_events(conn, folder, table) if table in EVENTS else _export_snapshot(conn, folder, table, on)
+        return report
+    finally:
+        conn.close()
+def export_state(database: str) -> pd.DataFrame:
+    conn = sqlite3.connect(database, timeout=30)
+    try:
+        ensure_export(conn)
+        return pd.read_sql_query("""
+            SELECT s.name AS table_name, s.watermark, s.exported_at, s.rows,
+                   (SELECT GROUP_CONCAT(month) FROM export_dirty d WHERE d.name = s.name) AS dirty_months
+            FROM export_state s ORDER BY s.name
+        """, conn)
+    finally:
+        conn.close()
+# === READING ===
+def dataset(folder: str, table: str) -> ds.Dataset:
+    schema_ = EVENTS[table][2] if table in EVENTS else SNAPSHOTS[table]
+    key = 'month' if table in EVENTS else 'snapshot'
+    partitioning = ds.partitioning(pa.schema([(key, pa.string())]), flavor='hive')
+    return ds.dataset(os.path.join(folder, table), schema=schema_.append(pa.field(key, pa.string())), format='parquet',
+                      partitioning=partitioning, exclude_invalid_files=False, ignore_prefixes=['.'])
+def _scalar(day, kind):
+    return pa.scalar(day if kind == pa.date32() else datetime.combine(day, datetime.min.time()), kind)
+def snapshots(folder: str, table: str) -> list:
+    path = os.path.join(folder, table)
+    days = [d.split('=', 1)[1] for d in os.listdir(path) if d.startswith('snapshot=')] if os.path.isdir(path) else []
+    return sorted(days)
+def read(folder: str, table: str, columns: Optional[list] = None, filter: Optional[ds.Expression] = None,
+         start: Optional[date] = None, end: Optional[date] = None, snapshot: Optional[str] = 'latest') -> pd.DataFrame:
+    # Columns and filter are applied in the scan (ds.field('present') == False, ...). For event tables start/end
+    # bound the date column and prune whole months; for snapshots pick a day (None reads them all, with 'snapshot')
+    if not os.path.isdir(os.path.join(folder, table)):
+        raise FileNotFoundError(f"No export of {table} in {folder}; run export.py first")
+    conditions = [filter] if filter is not None else []
+    if table in EVENTS:
+        column = EVENTS[table][0]
+        kind = EVENTS[table][2].field(column).type
+        if start:
+            conditions += [ds.field('month') >= start.isoformat()[:7], ds.field(column) >= _scalar(start, kind)]
+        if end:
+            conditions += [ds.field('month') <= end.isoformat()[:7], ds.field(column) < _scalar(end + timedelta(days=1), kind)]
+    elif snapshot == 'latest':
+        days = snapshots(folder, table)
+        conditions.append(ds.field('snapshot') == (days[-1] if days else ''))
+    elif snapshot:
+        conditions.append(ds.field('snapshot') == snapshot)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return dataset(folder, table).to_table(columns=columns, filter=expression).to_pandas(date_as_object=False)
+# === SCHEDULER ===
+def start_scheduler(database: str, folder: str = EXPORT_DIR, interval: float = EXPORT_INTERVAL) -> threading.Event:
+    # Daemon thread running run_export() every interval seconds; set the returned event to stop it
+    stop = threading.Event()
+    if interval <= 0:
+        return stop
+    def loop():
+        while not stop.wait(interval):
+            try:
+                run_export(database, folder)
+            except Exception:  # a locked database or a full disk: try again next time
+                pass
+    threading.Thread(target=loop, name='school-export', daemon=True).start()
+    return stop
+def main():
+    import json
+    import sys
+    database = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('SCHOOL_DB', 'school.db')
+    folder = sys.argv[2] if len(sys.argv) > 2 else EXPORT_DIR
+    print(json.dumps(run_export(database, folder), indent=2, default=str))
+if __name__ == '__main__':
+    main()
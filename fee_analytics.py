@@ -0,0 +1,135 @@
+# Fee analytics over a per-payment history.
+# fees keeps only the running paid_amount and the latest date_paid/collected_by, so triggers on fees write every
+# change of paid_amount to fee_payments and keep two running aggregates up to date:
+#   fee_class_totals  (class)                 -> accounts, billed, collected
+#   fee_daily_totals  (paid_on, collected_by) -> payments, amount
+# Reports read those small tables instead of re-summing fees. Aging depends on the as-of date, so it is one
+# grouped query over fees, using fee_billing (when each account was opened) for accounts never paid into.
+import sqlite3
+from datetime import date, datetime, timedelta
+from typing import Optional
+import pandas as pd
+# (label, first day, last day) of arrears age; None = open-ended
+AGING_BUCKETS = [('0-30 days', 0, 30), ('31-60 days', 31, 60), ('60+ days', 61, None)]
+def ensure_fee_analytics(conn: sqlite3.Connection) -> None:
+    created = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'fee_payments'").fetchone() is None
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS fee_payments (id INTEGER PRIMARY KEY, student_id INTEGER NOT NULL, class TEXT NOT NULL,
+            amount REAL NOT NULL, paid_on DATE, collected_by TEXT, recorded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            backfilled INTEGER NOT NULL DEFAULT 0);
+        CREATE INDEX IF NOT EXISTS idx_fee_payments_student ON fee_payments (student_id);
+        CREATE TABLE IF NOT EXISTS fee_billing (class TEXT NOT NULL, student_id INTEGER NOT NULL, billed_on DATE NOT NULL,
+            PRIMARY KEY (class, student_id));
+        CREATE TABLE IF NOT EXISTS fee_class_totals (class TEXT PRIMARY KEY, accounts INTEGER NOT NULL, billed REAL NOT NULL,
+            collected REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS fee_daily_totals (paid_on DATE NOT NULL, collected_by TEXT NOT NULL, payments INTEGER NOT NULL,
+            amount REAL NOT NULL, PRIMARY KEY (paid_on, collected_by));
+    """)
+    if created:
+        # Existing paid amounts become one backfilled payment each, dated by date_paid
+        with conn:
+            conn.execute("""
+                INSERT INTO fee_payments (student_id, class, amount, paid_on, collected_by, backfilled)
+                SELECT student_id, class, paid_amount, date_paid, collected_by, 1 FROM fees
+                WHERE student_id IS NOT NULL AND COALESCE(paid_amount, 0) != 0
+            """)
+            conn.execute("""
+                INSERT OR IGNORE INTO fee_billing
+                SELECT f.class, f.student_id, COALESCE(s.registration_date, DATE('now'))
+                FROM fees f LEFT JOIN students s ON s.id = f.student_id WHERE f.student_id IS NOT NULL
+            """)
+            conn.execute("""
+                INSERT INTO fee_class_totals
+                SELECT class, COUNT(*), SUM(fee_amount), SUM(COALESCE(paid_amount, 0)) FROM fees
+                WHERE student_id IS NOT NULL GROUP BY class
+            """)
+            conn.execute("""
+                INSERT INTO fee_daily_totals
+                SELECT COALESCE(paid_on, ''), COALESCE(collected_by, ''), COUNT(*), SUM(amount) FROM fee_payments
+                GROUP BY 1, 2
+            """)
+    # Created after the backfill so the rows above are not counted twice
+    conn.executescript("""
+        CREATE TRIGGER IF NOT EXISTS fee_payments_daily AFTER INSERT ON fee_payments BEGIN
+            INSERT INTO fee_daily_totals VALUES (COALESCE(NEW.paid_on, ''), COALESCE(NEW.collected_by, ''), 1, NEW.amount)
+            ON CONFLICT (paid_on, collected_by) DO UPDATE SET payments = payments + 1, amount = amount + excluded.amount;
+        END;
+        CREATE TRIGGER IF NOT EXISTS fees_analytics_insert AFTER INSERT ON fees WHEN NEW.student_id IS NOT NULL BEGIN
+            INSERT OR IGNORE INTO fee_billing VALUES (NEW.class, NEW.student_id, DATE('now'));
+            INSERT INTO fee_payments (student_id, class, amount, paid_on, collected_by)
+            SELECT NEW.student_id, NEW.class, NEW.paid_amount, NEW.date_paid, NEW.collected_by WHERE COALESCE(NEW.paid_amount, 0) != 0;
+            INSERT INTO fee_class_totals VALUES (NEW.class, 1, NEW.fee_amount, COALESCE(NEW.paid_amount, 0))
+            ON CONFLICT (class) DO UPDATE SET accounts = accounts + 1, billed = billed + excluded.billed,
+                collected = collected + excluded.collected;
+        END;
+        CREATE TRIGGER IF NOT EXISTS fees_analytics_update AFTER UPDATE ON fees
+        WHEN NEW.student_id IS NOT NULL OR OLD.student_id IS NOT NULL BEGIN
+            INSERT INTO fee_payments (student_id, class, amount, paid_on, collected_by)
+            SELECT NEW.student_id, NEW.class, COALESCE(NEW.paid_amount, 0) - COALESCE(OLD.paid_amount, 0), NEW.date_paid, NEW.collected_by
+            WHERE NEW.student_id IS NOT NULL AND COALESCE(NEW.paid_amount, 0) != COALESCE(OLD.paid_amount, 0);
+            UPDATE fee_class_totals SET accounts = accounts - 1, billed = billed - OLD.fee_amount,
+                collected = collected - COALESCE(OLD.paid_amount, 0)
+            WHERE class = OLD.class AND OLD.student_id IS NOT NULL;
+            INSERT INTO fee_class_totals SELECT NEW.class, 1, NEW.fee_amount, COALESCE(NEW.paid_amount, 0) WHERE NEW.student_id IS NOT NULL
+            ON CONFLICT (class) DO UPDATE SET accounts = accounts + 1, billed = billed + excluded.billed,
+                collected = collected + excluded.collected;
+        END;
+        CREATE TRIGGER IF NOT EXISTS fees_analytics_delete AFTER DELETE ON fees WHEN OLD.student_id IS NOT NULL BEGIN
+            UPDATE fee_class_totals SET accounts = accounts - 1, billed = billed - OLD.fee_amount,
+                collected = collected - COALESCE(OLD.paid_amount, 0)
+            WHERE class = OLD.class;
+            DELETE FROM fee_billing WHERE class = OLD.class AND student_id = OLD.student_id;
+        END;
+    """)
+def _as_of(as_of: Optional[date]) -> str:
+    return (as_of or datetime.now().date()).isoformat()
+# === READS ===
+def totals(conn: sqlite3.Connection) -> tuple:
+    # (billed, collected) across the school, for the dashboard tiles
+    billed, collected = conn.execute("SELECT COALESCE(SUM(billed), 0), COALESCE(SUM(collected), 0) FROM fee_class_totals").fetchone()
+    return billed, collected
+def class_collection(conn: sqlite3.Connection) -> pd.DataFrame:
+    return pd.read_sql_query("""
+        SELECT class, accounts, ROUND(billed, 2) AS billed, ROUND(collected, 2) AS collected,
+               ROUND(billed - collected, 2) AS arrears,
+               ROUND(CASE WHEN billed > 0 THEN collected / billed END, 4) AS collection_rate
+        FROM fee_class_totals WHERE accounts > 0 ORDER BY class
+    """, conn)
+def daily_totals(conn: sqlite3.Connection, start: Optional[date] = None, end: Optional[date] = None) -> pd.DataFrame:
+    end = end or datetime.now().date()
+    start = start or end - timedelta(days=30)
+    return pd.read_sql_query("""
+        SELECT paid_on, collected_by, payments, ROUND(amount, 2) AS amount FROM fee_daily_totals
+        WHERE paid_on BETWEEN ? AND ? ORDER BY paid_on DESC, collected_by
+    """, conn, params=(start.isoformat(), end.isoformat()))
+def aging(conn: sqlite3.Connection, as_of: Optional[date] = None, by_class: bool = False) -> pd.DataFrame:
+    # Outstanding accounts by days since the last payment, or since the account was opened if never paid into
+    bucket = "CASE " + " ".join(f"WHEN age <= {high} THEN '{label}'" for label, _, high in AGING_BUCKETS if high is not None)
+    bucket += f" ELSE '{AGING_BUCKETS[-1][0]}' END"
+    group = "class, bucket" if by_class else "bucket"
+    df = pd.read_sql_query(f"""
+        SELECT {group}, COUNT(*) AS accounts, ROUND(SUM(arrears), 2) AS arrears FROM (
+            SELECT f.class, f.fee_amount - COALESCE(f.paid_amount, 0) AS arrears,
+                   {bucket.replace('age', 'CAST(JULIANDAY(:as_of) - JULIANDAY(COALESCE(f.date_paid, b.billed_on, :as_of)) AS INTEGER)')} AS bucket
+            FROM fees f LEFT JOIN fee_billing b ON b.class = f.class AND b.student_id = f.student_id
+            WHERE f.student_id IS NOT NULL AND f.fee_amount - COALESCE(f.paid_amount, 0) > 0
+        ) GROUP BY {group}
+    """, conn, params={'as_of': _as_of(as_of)})
+    order = {label: i for i, (label, _, _) in enumerate(AGING_BUCKETS)}
+    return df.sort_values((['class'] if by_class else []) + ['bucket'], key=lambda s: s.map(order) if s.name == 'bucket' else s,
+                          ignore_index=True)
+def payment_history(conn: sqlite3.Connection, student_id: int) -> pd.DataFrame:
+    return pd.read_sql_query("""
+        SELECT paid_on, class, amount, collected_by, recorded_at, backfilled FROM fee_payments
+        WHERE student_id = ? ORDER BY id
+    """, conn, params=(student_id,))
+def forecast(conn: sqlite3.Connection, days: int = 30, lookback: int = 30, as_of: Optional[date] = None) -> dict:
+    # Straight-line projection: the average daily takings over the last `lookback` days, capped at what is still owed
+    end = as_of or datetime.now().date()
+    taken = conn.execute("SELECT COALESCE(SUM(amount), 0) FROM fee_daily_totals WHERE paid_on > ? AND paid_on <= ?",
+                         ((end - timedelta(days=lookback)).isoformat(), end.isoformat())).fetchone()[0]
+    billed, collected = totals(conn)
+    outstanding = max(billed - collected, 0)
+    daily = taken / lookback if lookback else 0
+    return {'daily_rate': round(daily, 2), 'expected': round(min(daily * days, outstanding), 2),
+            'outstanding': round(outstanding, 2), 'days_to_clear': round(outstanding / daily) if daily > 0 else None}
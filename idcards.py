@@ -0,0 +1,194 @@
+# Student ID cards: photo, school logo and name, pupil name, class and a Code 39 barcode of the student ID,
+# laid out ten to an A4 sheet and written as a print-ready PDF at 300 dpi.
+# Compositing is CPU-bound, so sheets are rendered in a process pool (spawned, not forked: the Streamlit server
+# runs threads) and reported back as each one finishes. Every card is cached on disk under a hash of everything
+# drawn on it, including the photo and logo files' size and mtime, so reprinting a class only redraws changed cards.
+# The cache keeps one card per student: drawing a new one deletes the student's earlier versions.
+import glob
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterable, Optional
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+DPI = 300
+CARD = (1011, 638)  # CR80, 85.6 x 54 mm
+SHEET = (2480, 3508)  # A4
+GRID = (2, 5)
+LAYOUT_VERSION = 1  # bump when the drawing changes, so cached cards are redrawn
+NAVY, GOLD, GREY = (20, 33, 61), (255, 215, 0), (90, 90, 90)
+# Code 39 bar/space widths (1 = wide), bars first; digits and the start/stop character are all an ID needs
+CODE39 = {'0': '000110100', '1': '100100001', '2': '001100001', '3': '101100000', '4': '000110001', '5': '100110000',
+          '6': '001110000', '7': '000100101', '8': '100100100', '9': '001100100', '*': '010010100'}
+def students_for_cards(conn: sqlite3.Connection, class_: Optional[str] = None, ids: Optional[Iterable[int]] = None) -> list:
+    # One dict per card, in class then ID order
+    query = """
+        SELECT id, TRIM(first_name || ' ' || COALESCE(NULLIF(middle_name, '') || ' ', '') || surname) AS name, class,
+               passport_picture_path AS photo
+        FROM students
+    """
+    if ids is not None:
+        ids = [int(i) for i in ids]
+        rows = conn.execute(query + f" WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY class, id", ids) if ids else []
+    else:
+        rows = conn.execute(query + " WHERE class = ? ORDER BY id", (class_,))
+    return [dict(zip(('id', 'name', 'class', 'photo'), r)) for r in rows]
+# === DRAWING ===
+def _signature(path):
+    # What the cache key sees of a file: missing files and unchanged files hash the same every time
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+def card_key(student: dict, school: str, logo: Optional[str]) -> str:
+    payload = [LAYOUT_VERSION, student['id'], student['name'], student['class'], school, _signature(student.get('photo')),
+               _signature(logo)]
+    return hashlib.sha256(json.dumps(payload).encode('utf-8')).hexdigest()
+def code39(draw: ImageDraw.ImageDraw, text: str, x: int, y: int, height: int, narrow: int = 3) -> int:
+    # Draws *text* with start/stop characters; returns the right edge
+    for char in f"*{text}*":
+        for i, wide in enumerate(CODE39[char]):
+            width = narrow * (3 if wide == '1' else 1)
+            if i % 2 == 0:
+                draw.rectangle([x, y, x + width - 1, y + height - 1], fill='black')
+            x += width
+        x += narrow  # gap between characters
+    return x - narrow
+def _open(path, size):
+    try:
+        with Image.open(path) as im:
+            return ImageOps.fit(ImageOps.exif_transpose(im).convert('RGB'), size)
+    except (OSError, ValueError, TypeError, AttributeError):
+        return None
+def _fit_text(draw, text, width, size):
+    # Largest font up to size that fits the width
+    while size > 16:
+        font = ImageFont.load_default(size=size)
+        if draw.textlength(text, font=font) <= width:
+            return font
+        size -= 2
+    return ImageFont.load_default(size=size)
+def render_card(student: dict, school: str, logo: Optional[str]) -> Image.Image:
+    card = Image.new('RGB', CARD, 'white')
+    draw = ImageDraw.Draw(card)
+    draw.rectangle([0, 0, CARD[0], 130], fill=NAVY)
+    left = 30
+    badge = _open(logo, (100, 100)) if logo else None
+    if badge is not None:
+        card.paste(badge, (30, 15))
+        left = 150
+    draw.text((left, 65), school.upper(), font=_fit_text(draw, school.upper(), CARD[0] - left - 30, 44), fill=GOLD, anchor='lm')
+    draw.text((CARD[0] - 30, 118), "STUDENT ID CARD", font=ImageFont.load_default(size=20), fill='white', anchor='rs')
+    photo = _open(student.get('photo'), (270, 330))
+    if photo is None:
+        draw.rectangle([30, 160, 299, 489], fill=(225, 225, 225))
+        draw.text((165, 325), "NO PHOTO", font=ImageFont.load_default(size=28), fill=GREY, anchor='mm')
+    else:
+        card.paste(photo, (30, 160))
+    draw.rectangle([30, 160, 299, 489], outline=NAVY, width=3)
+    x, width = 330, CARD[0] - 360
+    label = ImageFont.load_default(size=24)
+    for y, caption, value, size in ((165, "NAME", student['name'], 44), (275, "CLASS", student['class'], 40),
+                                    (375, "ID NO.", f"{student['id']:06d}", 40)):
+        draw.text((x, y), caption, font=label, fill=GREY)
+        draw.text((x, y + 32), str(value), font=_fit_text(draw, str(value), width, size), fill='black')
+    code = f"{student['id']:06d}"
+    right = code39(draw, code, x, 500, 90)
+    draw.rectangle([0, CARD[1] - 18, CARD[0], CARD[1]], fill=GOLD)
+    draw.text(((x + right) // 2, CARD[1] - 24), code, font=ImageFont.load_default(size=20), fill='black', anchor='ms')
+    return card
+def cached_card(student: dict, school: str, logo: Optional[str], cache_dir: Optional[str]) -> tuple:
+    # -> (card image, whether it came from the cache)
+    path = os.path.join(cache_dir, f"{student['id']}-{card_key(student, school, logo)}.jpg") if cache_dir else None
+    if path and os.path.exists(path):
+        try:
+            with Image.open(path) as im:
+                return im.convert('RGB'), True
+        except OSError:
+            pass  # damaged file: draw it again
+    card = render_card(student, school, logo)
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        card.save(temp, 'JPEG', quality=92, subsampling=0, dpi=(DPI, DPI))
+        os.replace(temp, path)  # concurrent workers never see a half-written card
+        for stale in glob.glob(os.path.join(glob.escape(cache_dir), f"{student['id']}-*.jpg")):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass  # another print removed it first
+    return card, False
+def render_sheet(students: list, school: str, logo: Optional[str], cache_dir: Optional[str]) -> tuple:
+    # -> (sheet as JPEG bytes, cards drawn, cards from cache); runs in a worker process
+    sheet = Image.new('RGB', SHEET, 'white')
+    draw = ImageDraw.Draw(sheet)
+    gap_x = (SHEET[0] - GRID[0] * CARD[0]) // (GRID[0] + 1)
+    gap_y = (SHEET[1] - GRID[1] * CARD[1]) // (GRID[1] + 1)
+    hits = 0
+    for i, student in enumerate(students):
+        card, hit = cached_card(student, school, logo, cache_dir)
+        hits += hit
+        x = gap_x + (i % GRID[0]) * (CARD[0] + gap_x)
+        y = gap_y + (i // GRID[0]) * (CARD[1] + gap_y)
+        sheet.paste(card, (x, y))
+        draw.rectangle([x - 1, y - 1, x + CARD[0], y + CARD[1]], outline=(200, 200, 200))  # cutting guide
+    buffer = io.BytesIO()
+    sheet.save(buffer, 'JPEG', quality=92, subsampling=0, dpi=(DPI, DPI))
+    return buffer.getvalue(), len(students) - hits, hits
+# === PDF ===
+def _pdf(sheets: list) -> bytes:
+    # Each sheet is a JPEG already, so pages embed it as-is (DCTDecode) instead of decoding and re-encoding
+    width, height = SHEET[0] * 72 / DPI, SHEET[1] * 72 / DPI
+    out = io.BytesIO()
+    offsets = []
+    def obj(body):
+        offsets.append(out.tell())
+        out.write(f"{len(offsets)} 0 obj\n".encode() + body + b"\nendobj\n")
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    pages = " ".join(f"{3 + 3 * i} 0 R" for i in range(len(sheets)))
+    obj(b"<< /Type /Catalog /Pages 2 0 R >>")
+    obj(f"<< /Type /Pages /Kids [{pages}] /Count {len(sheets)} >>".encode())
+    for i, jpeg in enumerate(sheets):
+        page = 3 + 3 * i
+        obj(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] /Contents {page + 1} 0 R "
+            f"/Resources << /XObject << /Card {page + 2} 0 R >> >> >>".encode())
+        content = zlib.compress(f"q {width:.2f} 0 0 {height:.2f} 0 0 cm /Card Do Q".encode())
+        obj(f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode() + content + b"\nendstream")
+        obj(f"<< /Type /XObject /Subtype /Image /Width {SHEET[0]} /Height {SHEET[1]} /ColorSpace /DeviceRGB "
+            f"/BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>\nstream\n".encode() + jpeg + b"\nendstream")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+    out.write("".join(f"{o:010d} 00000 n \n" for o in offsets).encode())
+    out.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+def generate(students: list, school: str, logo: Optional[str] = None, cache_dir: Optional[str] = None,
+             workers: Optional[int] = None, progress: Optional[Callable[[int, int], None]] = None) -> tuple:
+    # -> (PDF bytes, stats); progress(cards done, total) is called as each sheet finishes.
+    # A single sheet is drawn in-process: starting workers would cost more than it saves.
+    per_sheet = GRID[0] * GRID[1]
+    batches = [students[i:i + per_sheet] for i in range(0, len(students), per_sheet)]
+    logo = logo if logo and os.path.exists(logo) else None
+    sheets = [None] * len(batches)
+    drawn = cached = 0
+    workers = min(workers or os.cpu_count() or 1, len(batches))
+    if workers <= 1:
+        for i, batch in enumerate(batches):
+            sheets[i], d, c = render_sheet(batch, school, logo, cache_dir)
+            drawn, cached = drawn + d, cached + c
+            if progress:
+                progress(drawn + cached, len(students))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(render_sheet, batch, school, logo, cache_dir): i for i, batch in enumerate(batches)}
+            for future in as_completed(futures):
+                sheets[futures[future]], d, c = future.result()
+                drawn, cached = drawn + d, cached + c
+                if progress:
+                    progress(drawn + cached, len(students))
+    return _pdf(sheets), {'cards': len(students), 'sheets': len(sheets), 'drawn': drawn, 'cached': cached}
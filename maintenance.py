@@ -0,0 +1,129 @@
+# Database upkeep: pruning old sync events, planner statistics, WAL checkpoints, occasional VACUUM and rotated
+# online backups.
+# run_maintenance() does one full pass and is what both the nightly scheduler thread and the admin
+# Database > Maintenance button call. Backups use the sqlite3 backup API in small steps, so writers keep going.
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+import sync
+BACKUP_DIR = os.environ.get('SCHOOL_BACKUP_DIR', 'backups')
+BACKUP_KEEP = int(os.environ.get('SCHOOL_BACKUP_KEEP', 7))
+MAINTENANCE_AT = os.environ.get('SCHOOL_MAINTENANCE_AT', '02:00')  # local time, HH:MM
+VACUUM_FREE_RATIO = 0.2  # VACUUM only once a fifth of the file is free pages; it blocks writers while it runs
+class MaintenanceError(Exception):
+    pass
+def connect(database):
+    return sqlite3.connect(database, timeout=30, check_same_thread=False)
+def enable_wal(conn):
+    # Readers stop blocking the writer and the other way round; the setting is stored in the file
+    return conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+def ensure_maintenance_log(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS maintenance_log (started_at TEXT PRIMARY KEY, finished_at TEXT, ok INTEGER, report TEXT)")
+    conn.commit()
+def optimize(conn):
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+def checkpoint(conn):
+    # -> (busy, wal frames, frames checkpointed); TRUNCATE also shrinks the -wal file back to zero
+    return conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+def vacuum_if_fragmented(conn, ratio=VACUUM_FREE_RATIO):
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if pages and free / pages >= ratio:
+        conn.execute("VACUUM")
+        return True
+    return False
+def integrity_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [r[0] for r in conn.execute("PRAGMA integrity_check").fetchall()]
+    finally:
+        conn.close()
+def backup(database, folder=BACKUP_DIR, keep=BACKUP_KEEP, pages=256):
+    # Copies into a .tmp file, verifies it, then renames it into the rotation; returns the backup path
+    os.makedirs(folder, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(database))[0]
+    path = os.path.join(folder, f"{stem}-{datetime.now():%Y%m%d-%H%M%S}.db")
+    src, dst = connect(database), sqlite3.connect(path + '.tmp')
+    try:
+        src.backup(dst, pages=pages, sleep=0.005)
+    finally:
+        dst.close()
+        src.close()
+    problems = integrity_check(path + '.tmp')
+    if problems != ['ok']:
+        os.remove(path + '.tmp')
+        raise MaintenanceError(f"Backup failed integrity check: {'; '.join(problems[:5])}")
+    os.replace(path + '.tmp', path)
+    for old in list_backups(database, folder)[keep:]:
+        os.remove(old)
+    return path
+def list_backups(database, folder=BACKUP_DIR):
+    # Newest first
+    stem = os.path.splitext(os.path.basename(database))[0]
+    return sorted(glob.glob(os.path.join(folder, f"{stem}-*.db")), reverse=True)
+def run_maintenance(database, folder=BACKUP_DIR, keep=BACKUP_KEEP):
+    # One pass; every step is timed and logged to maintenance_log, and a failing step does not skip the rest
+    started = datetime.now().isoformat(timespec='seconds')
+    report, ok = {}, True
+    conn = connect(database)
+    try:
+        ensure_maintenance_log(conn)
+        steps = [
+            ('prune_sync_events', lambda: sync.prune_events(conn)),
+            ('optimize', lambda: optimize(conn)),
+            ('checkpoint', lambda: checkpoint(conn)),
+            ('vacuum', lambda: vacuum_if_fragmented(conn)),
+            ('backup', lambda: backup(database, folder, keep)),
+        ]
+        for name, step in steps:
+            t = time.perf_counter()
+            try:
+                report[name] = {'result': step(), 'seconds': round(time.perf_counter() - t, 3)}
+            except (sqlite3.Error, OSError, MaintenanceError) as e:
+                ok = False
+                report[name] = {'error': str(e), 'seconds': round(time.perf_counter() - t, 3)}
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO maintenance_log VALUES (?, ?, ?, ?)",
+                         (started, datetime.now().isoformat(timespec='seconds'), int(ok), json.dumps(report, default=str)))
+    finally:
+        conn.close()
+    return ok, report
+def last_runs(database, limit=10):
+    conn = connect(database)
+    try:
+        ensure_maintenance_log(conn)
+        return conn.execute("SELECT started_at, finished_at, ok, report FROM maintenance_log ORDER BY started_at DESC LIMIT ?",
+                            (limit,)).fetchall()
+    finally:
+        conn.close()
+# === SCHEDULER ===
+def next_run(at=MAINTENANCE_AT, now=None):
+    now = now or datetime.now()
+    hour, minute = (int(x) for x in at.split(':'))
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return run if run > now else run + timedelta(days=1)
+def start_scheduler(database, at=MAINTENANCE_AT, folder=BACKUP_DIR, keep=BACKUP_KEEP):
+    # Daemon thread running run_maintenance() daily at `at`; set the returned event to stop it
+    stop = threading.Event()
+    def loop():
+        while not stop.wait((next_run(at) - datetime.now()).total_seconds()):
+            try:
+                run_maintenance(database, folder, keep)
+            except Exception:  # never let one bad night end the schedule
+                pass
+    threading.Thread(target=loop, name='school-maintenance', daemon=True).start()
+    return stop
+def main():
+    # For cron or a manual run: python maintenance.py [database]
+    import sys
+    database = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('SCHOOL_DB', 'school.db')
+    ok, report = run_maintenance(database)
+    print(json.dumps(report, indent=2, default=str))
+    sys.exit(0 if ok else 1)
+if __name__ == '__main__':
+    main()
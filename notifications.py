@@ -0,0 +1,348 @@
+# Guardian notifications: absences, results and fee arrears sent to students.guardian_phone.
+# Nothing is sent while a page handles a click. Triggers on attendance, publish_results() and a daily arrears sweep
+# only add rows to notification_outbox, inside the transaction that made the change. A worker thread then turns them
+# into messages. Each guardian's pending items are merged into one message (siblings share a phone, so they share
+# the message), and a guardian is only sent to once their items have been quiet for COALESCE_SECONDS. Marking
+# absent then present inside that window cancels the absence. Sends go out in batches through a transport:
+#   file:<path>            append each message to a JSON-lines file (the default; for testing and audit)
+#   http(s)://<gateway>    POST each batch as JSON to an SMS gateway
+# Limits: SCHOOL_NOTIFY_PER_MINUTE across the school and SCHOOL_NOTIFY_DAILY_MAX per guardian per day.
+# A failed send is retried with backoff up to MAX_ATTEMPTS times.
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Callable, Optional
+from profiles import term_start
+TRANSPORT = os.environ.get('SCHOOL_NOTIFY_TRANSPORT', '')  # empty: file:<database stem>-notifications.jsonl
+NOTIFY_INTERVAL = float(os.environ.get('SCHOOL_NOTIFY_INTERVAL', 60))  # seconds between worker passes
+COALESCE_SECONDS = int(os.environ.get('SCHOOL_NOTIFY_COALESCE', 300))
+MAX_HOLD_SECONDS = 1800  # a guardian whose items keep arriving is still sent to once the oldest is this old
+PER_MINUTE = int(os.environ.get('SCHOOL_NOTIFY_PER_MINUTE', 60))
+DAILY_MAX = int(os.environ.get('SCHOOL_NOTIFY_DAILY_MAX', 3))
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+ARREARS_THRESHOLD = float(os.environ.get('SCHOOL_ARREARS_THRESHOLD', 1))  # smallest balance worth a reminder
+ARREARS_GRACE_DAYS = 21  # days into a term before unpaid fees count as arrears
+ABSENCE_MAX_AGE_DAYS = 3  # older absences (back-filled or synced late) are not news to a parent
+_NOW = "strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')"
+# (dedupe key, detail) of the items each trigger queues; a key is queued once, and again only if its detail changes
+_ABSENCE = ("'absence:' || NEW.student_id || ':' || NEW.date", "NEW.date")
+# Re-queues a cancelled item, or a sent one whose detail changed
+_REQUEUE = """
+    ON CONFLICT (dedupe_key) DO UPDATE SET detail = excluded.detail, created_at = excluded.created_at,
+        status = 'pending', message_id = NULL
+    WHERE notification_outbox.status = 'cancelled' OR notification_outbox.detail <> excluded.detail
+"""
+def _enqueue_sql(kind, key, detail, when='1'):
+    # Queues one item for a student with a guardian phone
+    return f"""
+        INSERT INTO notification_outbox (kind, student_id, dedupe_key, detail, created_at)
+        SELECT '{kind}', s.id, {key}, {detail}, {_NOW} FROM students s
+        WHERE s.id = NEW.student_id AND TRIM(COALESCE(s.guardian_phone, '')) <> '' AND {when}
+        {_REQUEUE};
+    """
+# Marked present after all: an absence not yet sent is dropped
+_CANCEL_ABSENCE = f"""
+    UPDATE notification_outbox SET status = 'cancelled' WHERE dedupe_key = {_ABSENCE[0]} AND status = 'pending' AND NEW.present;
+"""
+_RECENT = f"NEW.date >= date('now', 'localtime', '-{ABSENCE_MAX_AGE_DAYS} days')"
+def ensure_notifications(conn: sqlite3.Connection) -> None:
+    # notification_outbox: one row per thing a guardian should hear about; notifications: the messages sent for them
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS notification_outbox (id INTEGER PRIMARY KEY, kind TEXT NOT NULL,
+            student_id INTEGER NOT NULL, dedupe_key TEXT NOT NULL UNIQUE, detail TEXT NOT NULL, created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending', message_id INTEGER);
+        CREATE INDEX IF NOT EXISTS idx_notification_outbox_status ON notification_outbox (status, created_at);
+        CREATE TABLE IF NOT EXISTS notifications (id INTEGER PRIMARY KEY, phone TEXT NOT NULL, body TEXT NOT NULL,
+            items INTEGER NOT NULL, created_at TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt TEXT, sent_at TEXT, error TEXT);
+        CREATE INDEX IF NOT EXISTS idx_notifications_phone ON notifications (phone, created_at);
+        CREATE INDEX IF NOT EXISTS idx_notifications_status ON notifications (status, next_attempt);
+        CREATE TRIGGER IF NOT EXISTS notify_absence_insert AFTER INSERT ON attendance
+        BEGIN
+            {_enqueue_sql('absence', *_ABSENCE, when=f"NOT NEW.present AND {_RECENT}")}
+            {_CANCEL_ABSENCE}
+        END;
+        CREATE TRIGGER IF NOT EXISTS notify_absence_update AFTER UPDATE OF present ON attendance
+        BEGIN
+            {_enqueue_sql('absence', *_ABSENCE, when=f"NOT NEW.present AND {_RECENT}")}
+            {_CANCEL_ABSENCE}
+        END;
+        -- results used to be queued as scores were typed; they now wait for publish_results()
+        DROP TRIGGER IF EXISTS notify_result_insert;
+        DROP TRIGGER IF EXISTS notify_result_update;
+    """)
+    conn.commit()
+def publish_results(conn: sqlite3.Connection, classes: list) -> int:
+    # Queues the scores of these classes for their guardians. A score already sent with the same value is not
+    # queued again, so publishing after corrections sends only the corrected scores; returns the items queued
+    marks = ", ".join("?" * len(classes))
+    with conn:
+        cursor = conn.execute(f"""
+            INSERT INTO notification_outbox (kind, student_id, dedupe_key, detail, created_at)
+            SELECT 'result', s.id, 'result:' || r.student_id || ':' || r.subject, r.subject || ' ' || r.score, {_NOW}
+            FROM results r JOIN students s ON s.id = r.student_id
+            WHERE s.class IN ({marks}) AND r.score IS NOT NULL AND TRIM(COALESCE(s.guardian_phone, '')) <> ''
+            {_REQUEUE}
+        """, list(classes))
+    return cursor.rowcount
+def enqueue_arrears(conn: sqlite3.Connection, on: Optional[date] = None, threshold: float = ARREARS_THRESHOLD) -> int:
+    # Queues one reminder per student per term for a balance of at least threshold, once the term is
+    # ARREARS_GRACE_DAYS old. Arrears change with payments and billing rather than one row, so this is a sweep
+    on = on or datetime.now().date()
+    start = term_start(on)
+    if (on - start).days < ARREARS_GRACE_DAYS:
+        return 0
+    with conn:
+        cursor = conn.execute(f"""
+            INSERT INTO notification_outbox (kind, student_id, dedupe_key, detail, created_at)
+            SELECT 'arrears', s.id, 'arrears:' || s.id || ':' || ?, printf('%.2f', b.balance), {_NOW}
+            FROM (SELECT student_id, SUM(fee_amount - COALESCE(paid_amount, 0)) AS balance FROM fees
+                  WHERE student_id IS NOT NULL GROUP BY student_id) b
+            JOIN students s ON s.id = b.student_id
+            WHERE b.balance >= MAX(?, 0.01) AND TRIM(COALESCE(s.guardian_phone, '')) <> ''
+            ON CONFLICT (dedupe_key) DO NOTHING
+        """, (start.isoformat(), threshold))
+    return cursor.rowcount
+# === MESSAGES ===
+def _phone(raw):
+    return "".join(ch for ch in str(raw) if ch.isdigit() or ch == '+')
+def compose(sender: str, items: list) -> str:
+    # One message for a guardian's items: [(name, kind, detail)], grouped per child
+    by_child = defaultdict(lambda: defaultdict(list))
+    for name, kind, detail in items:
+        by_child[name][kind].append(detail)
+    parts = []
+    for name, kinds in by_child.items():
+        lines = []
+        if kinds.get('absence'):
+            lines.append("absent on " + ", ".join(sorted(kinds['absence'])))
+        if kinds.get('result'):
+            lines.append("new results: " + ", ".join(sorted(kinds['result'])))
+        if kinds.get('arrears'):
+            lines.append("fees outstanding: " + kinds['arrears'][-1])
+        parts.append(f"{name} - " + "; ".join(lines))
+    return f"{sender}: " + ". ".join(parts) + "."
+def _coalesce(conn, sender, now, limit):
+    # Merges due guardians' pending items into new 'queued' notifications, at most limit of them; returns how many
+    stamp = now.strftime('%Y-%m-%d %H:%M:%S')
+    quiet = (now - timedelta(seconds=COALESCE_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+    held = (now - timedelta(seconds=MAX_HOLD_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+    rows = conn.execute("""
+        SELECT o.id, s.guardian_phone, TRIM(s.first_name || ' ' || s.surname), o.kind, o.detail, o.created_at
+        FROM notification_outbox o LEFT JOIN students s ON s.id = o.student_id
+        WHERE o.status = 'pending' ORDER BY o.created_at, o.id
+    """).fetchall()
+    guardians, orphans = defaultdict(list), []
+    for row in rows:
+        phone = _phone(row[1] or '')
+        if phone:
+            guardians[phone].append(row)
+        else:
+            orphans.append((row[0],))  # student removed, or the phone taken off since
+    conn.executemany("UPDATE notification_outbox SET status = 'skipped' WHERE id = ?", orphans)
+    today = now.strftime('%Y-%m-%d')
+    sent_today = dict(conn.execute("""
+        SELECT phone, COUNT(*) FROM notifications WHERE created_at >= ? AND status <> 'failed' GROUP BY phone
+    """, (today,)).fetchall())
+    made = 0
+    for phone, items in guardians.items():
+        if made >= limit:
+            break
+        if max(i[5] for i in items) > quiet and min(i[5] for i in items) > held:
+            continue  # still arriving: wait for the rest
+        if sent_today.get(phone, 0) >= DAILY_MAX:
+            continue  # left pending for tomorrow's first message
+        body = compose(sender, [(i[2], i[3], i[4]) for i in items])
+        message_id = conn.execute("""
+            INSERT INTO notifications (phone, body, items, created_at, status, next_attempt) VALUES (?, ?, ?, ?, 'queued', ?)
+        """, (phone, body, len(items), stamp, stamp)).lastrowid
+        conn.executemany("UPDATE notification_outbox SET status = 'queued', message_id = ? WHERE id = ?",
+                         [(message_id, i[0]) for i in items])
+        made += 1
+    return made
+def dispatch(conn: sqlite3.Connection, transport: Callable[[list], list], sender: str = "School",
+             limit: int = BATCH_SIZE, now: Optional[datetime] = None) -> dict:
+    # One pass: coalesce due items, then send up to limit queued messages in one batch through transport.
+    # transport(messages) -> one error (None when delivered) per message; an exception fails the whole batch
+    now = now or datetime.now()
+    stamp = now.strftime('%Y-%m-%d %H:%M:%S')
+    conn.execute("BEGIN IMMEDIATE")  # two workers on one school never claim the same messages
+    try:
+        # A pass that died between claiming and recording leaves 'sending' rows; they go round again
+        conn.execute("UPDATE notifications SET status = 'queued' WHERE status = 'sending' AND next_attempt < ?",
+                     ((now - timedelta(minutes=10)).strftime('%Y-%m-%d %H:%M:%S'),))
+        coalesced = _coalesce(conn, sender, now, limit)
+        batch = conn.execute("""
+            SELECT id, phone, body, attempts FROM notifications WHERE status = 'queued' AND next_attempt <= ?
+            ORDER BY next_attempt, id LIMIT ?
+        """, (stamp, limit)).fetchall()
+        conn.executemany("UPDATE notifications SET status = 'sending', next_attempt = ? WHERE id = ?",
+                         [(stamp, m[0]) for m in batch])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if not batch:
+        return {'coalesced': coalesced, 'sent': 0, 'failed': 0}
+    try:
+        errors = list(transport([{'id': m[0], 'phone': m[1], 'body': m[2]} for m in batch]))
+    except Exception as e:
+        errors = [f"{type(e).__name__}: {e}"] * len(batch)
+    sent, retry = [], []
+    for (message_id, _, _, attempts), error in zip(batch, errors):
+        if error is None:
+            sent.append((stamp, message_id))
+        else:
+            backoff = now + timedelta(minutes=2 ** attempts)
+            status = 'failed' if attempts + 1 >= MAX_ATTEMPTS else 'queued'
+            retry.append((status, backoff.strftime('%Y-%m-%d %H:%M:%S'), str(error)[:500], message_id))
+    with conn:
+        conn.executemany("UPDATE notifications SET status = 'sent', sent_at = ?, error = NULL, attempts = attempts + 1 WHERE id = ?", sent)
+        conn.executemany("UPDATE notifications SET status = ?, next_attempt = ?, error = ?, attempts = attempts + 1 WHERE id = ?", retry)
+        conn.execute("""
+            UPDATE notification_outbox SET status = n.status FROM notifications n
+            WHERE n.id = notification_outbox.message_id AND notification_outbox.status = 'queued' AND n.status IN ('sent', 'failed')
+        """)
+    return {'coalesced': coalesced, 'sent': len(sent), 'failed': len(retry)}
+def summary(conn: sqlite3.Connection, on: Optional[date] = None) -> dict:
+    day = (on or datetime.now().date()).isoformat()
+    pending = conn.execute("SELECT COUNT(*) FROM notification_outbox WHERE status = 'pending'").fetchone()[0]
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM notifications WHERE created_at >= ? GROUP BY status",
+                               (day,)).fetchall())
+    waiting = conn.execute("SELECT COUNT(*) FROM notifications WHERE status = 'queued'").fetchone()[0]
+    return {'pending_items': pending, 'queued': waiting, 'sent_today': counts.get('sent', 0),
+            'failed_today': counts.get('failed', 0)}
+# === TRANSPORTS ===
+def file_transport(path: str) -> Callable[[list], list]:
+    # Appends each message as a JSON line; the local stand-in for a gateway
+    lock = threading.Lock()
+    def send(messages):
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        stamp = datetime.now().isoformat(timespec='seconds')
+        with lock, open(path, 'a', encoding='utf-8') as f:
+            for m in messages:
+                f.write(json.dumps({'sent_at': stamp, **m}) + "\n")
+        return [None] * len(messages)
+    return send
+def http_transport(url: str, token: Optional[str] = None, timeout: float = 30) -> Callable[[list], list]:
+    # POSTs {"messages": [...]} and expects {"errors": [...]} back, one per message (null when accepted)
+    import urllib.request
+    def send(messages):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        request = urllib.request.Request(url, json.dumps({'messages': messages}).encode(), headers)
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            errors = json.loads(response.read()).get('errors')
+        return errors if isinstance(errors, list) and len(errors) == len(messages) else [None] * len(messages)
+    return send
+class MockTransport:
+    # Keeps what it was given; phones in fail are refused. For tests and dry runs
+    def __init__(self, fail=()):
+        self.sent = []
+        self.batches = 0
+        self.fail = {_phone(p) for p in fail}
+    def __call__(self, messages):
+        self.batches += 1
+        errors = [("refused" if m['phone'] in self.fail else None) for m in messages]
+        self.sent += [m for m, e in zip(messages, errors) if e is None]
+        return errors
+def transport_from_spec(spec: str, default_path: str) -> Callable[[list], list]:
+    spec = spec or f"file:{default_path}"
+    if spec.startswith('file:'):
+        return file_transport(spec[5:] or default_path)
+    if spec.startswith(('http://', 'https://')):
+        return http_transport(spec, os.environ.get('SCHOOL_NOTIFY_TOKEN'))
+    if spec == 'mock':
+        return MockTransport()
+    raise ValueError(f"Unknown notification transport '{spec}'")
+# === WORKER ===
+class RateLimiter:
+    # Token bucket: up to per_minute sends, refilled continuously
+    def __init__(self, per_minute: int = PER_MINUTE):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.at = time.monotonic()
+    def available(self) -> int:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.at) * self.rate)
+        self.at = now
+        return int(self.tokens)
+    def spend(self, n: int) -> None:
+        self.tokens -= n
+class Worker:
+    # One per school: dispatches every interval seconds, or at once when woken, plus the arrears sweep once a day.
+    # Its RateLimiter is the school's only send budget, so "send now" wakes it instead of sending around the limit
+    def __init__(self, database: str, transport: Callable[[list], list], sender: str = "School",
+                 interval: float = NOTIFY_INTERVAL, per_minute: int = PER_MINUTE):
+        self.database = database
+        self.transport = transport
+        self.sender = sender
+        self.interval = interval
+        self.limiter = RateLimiter(per_minute)
+        self.woken = threading.Event()
+        self.stopped = threading.Event()
+        self.done = threading.Condition()
+        self.started = self.finished = 0  # passes begun and ended
+        self.last = None  # totals of the last pass
+        self.swept = None
+    def wake(self) -> None:
+        self.woken.set()
+    def stop(self) -> None:
+        self.stopped.set()
+        self.woken.set()
+    def send_now(self, timeout: float = 30) -> Optional[dict]:
+        # Wakes the worker and waits for a pass begun after the wake; None if it did not end within timeout
+        with self.done:
+            target = self.started + 1
+            self.woken.set()
+            self.done.wait_for(lambda: self.finished >= target or self.stopped.is_set(), timeout)
+            return self.last if self.finished >= target else None
+    def run_pass(self) -> dict:
+        totals = {'coalesced': 0, 'sent': 0, 'failed': 0, 'limited': False}
+        conn = sqlite3.connect(self.database, timeout=30, check_same_thread=False)
+        try:
+            if self.swept != datetime.now().date():
+                enqueue_arrears(conn)
+                self.swept = datetime.now().date()
+            while not self.stopped.is_set():
+                budget = min(BATCH_SIZE, self.limiter.available())
+                if budget <= 0:
+                    totals['limited'] = True
+                    break
+                result = dispatch(conn, self.transport, self.sender, budget)
+                self.limiter.spend(result['sent'] + result['failed'])
+                for k in ('coalesced', 'sent', 'failed'):
+                    totals[k] += result[k]
+                if result['sent'] + result['failed'] < budget:
+                    break
+        except Exception as e:  # a locked database or a gateway outage must not end the worker
+            totals['error'] = f"{type(e).__name__}: {e}"
+        finally:
+            conn.close()
+        return totals
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.woken.wait(self.interval)
+            if self.stopped.is_set():
+                break
+            with self.done:
+                self.woken.clear()
+                self.started += 1
+            totals = self.run_pass()
+            with self.done:
+                self.finished, self.last = self.started, totals
+                self.done.notify_all()
+def start_worker(database: str, transport: Callable[[list], list], sender: str = "School",
+                 interval: float = NOTIFY_INTERVAL, per_minute: int = PER_MINUTE) -> Worker:
+    # Daemon thread running a Worker; call stop() on the returned worker to end it
+    worker = Worker(database, transport, sender, interval, per_minute)
+    threading.Thread(target=worker.run, name='school-notifications', daemon=True).start()
+    return worker
@@ -0,0 +1,169 @@
+# Monthly payroll for teachers and non-teaching staff.
+# Each member of staff has a grade (staff_grades) and each grade a pay scale (pay_scales). generate() builds the
+# month's payroll rows for everyone in one INSERT ... SELECT; rows then move draft -> approved -> paid in bulk.
+# Regenerating a month replaces only its drafts. The legacy salary table (teachers only) is kept in step, so a
+# teacher already paid through it is left out of the run.
+import io
+import sqlite3
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Optional
+import pandas as pd
+from services import ServiceError
+from validation import is_valid_month
+# staff_type: table
+STAFF = {'teacher': 'teachers', 'non_teaching': 'non_teaching'}
+# action: (from status, to status, timestamp column)
+TRANSITIONS = {'approve': ('draft', 'approved', 'approved_at'), 'unapprove': ('approved', 'draft', None),
+               'pay': ('approved', 'paid', 'paid_at')}
+def ensure_payroll(conn: sqlite3.Connection) -> None:
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS pay_scales (grade TEXT PRIMARY KEY, basic REAL NOT NULL, allowances REAL NOT NULL DEFAULT 0,
+            deductions REAL NOT NULL DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS staff_grades (staff_type TEXT NOT NULL, staff_id INTEGER NOT NULL,
+            grade TEXT NOT NULL REFERENCES pay_scales (grade), PRIMARY KEY (staff_type, staff_id));
+        CREATE TABLE IF NOT EXISTS payroll (month TEXT NOT NULL, staff_type TEXT NOT NULL, staff_id INTEGER NOT NULL,
+            name TEXT NOT NULL, grade TEXT NOT NULL, basic REAL NOT NULL, allowances REAL NOT NULL, deductions REAL NOT NULL,
+            net REAL NOT NULL, status TEXT NOT NULL DEFAULT 'draft', approved_at TEXT, paid_at TEXT,
+            PRIMARY KEY (month, staff_type, staff_id));
+        CREATE INDEX IF NOT EXISTS idx_payroll_status ON payroll (month, status);
+    """)
+def _month(month):
+    if not is_valid_month(month):
+        raise ServiceError("Month must be YYYY-MM")
+    return month.strip()
+def _chunks(items, size=400):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+# === SETUP ===
+def save_pay_scales(conn: sqlite3.Connection, scales: Iterable) -> int:
+    # scales: (grade, basic, allowances, deductions); upserts, leaving grades not listed alone
+    rows = []
+    for grade, basic, allowances, deductions in scales:
+        grade = '' if pd.isna(grade) else str(grade).strip()
+        if not grade:
+            raise ServiceError("Grade cannot be empty")
+        try:
+            values = [0.0 if pd.isna(v) else float(v) for v in (basic, allowances, deductions)]
+        except (TypeError, ValueError):
+            raise ServiceError(f"Grade {grade}: amounts must be numbers")
+        if min(values) < 0:
+            raise ServiceError(f"Grade {grade}: amounts cannot be negative")
+        if values[2] > values[0] + values[1]:
+            raise ServiceError(f"Grade {grade}: deductions exceed gross pay")
+        rows.append([grade] + values)
+    with conn:
+        conn.executemany("""
+            INSERT INTO pay_scales VALUES (?, ?, ?, ?)
+            ON CONFLICT (grade) DO UPDATE SET basic = excluded.basic, allowances = excluded.allowances, deductions = excluded.deductions
+        """, rows)
+    return len(rows)
+def pay_scales(conn: sqlite3.Connection) -> pd.DataFrame:
+    return pd.read_sql_query("SELECT * FROM pay_scales ORDER BY grade", conn)
+def assign_grade(conn: sqlite3.Connection, staff_type: str, staff_ids: Iterable[int], grade: Optional[str]) -> int:
+    # grade None removes the assignment
+    if staff_type not in STAFF:
+        raise ServiceError(f"Staff type must be one of: {', '.join(STAFF)}")
+    ids = [int(i) for i in staff_ids]
+    if grade is not None and conn.execute("SELECT 1 FROM pay_scales WHERE grade = ?", (grade,)).fetchone() is None:
+        raise ServiceError(f"Unknown grade: {grade}")
+    with conn:
+        if grade is None:
+            conn.executemany("DELETE FROM staff_grades WHERE staff_type = ? AND staff_id = ?", [(staff_type, i) for i in ids])
+        else:
+            conn.executemany("INSERT OR REPLACE INTO staff_grades VALUES (?, ?, ?)", [(staff_type, i, grade) for i in ids])
+    return len(ids)
+def _staff_sql():
+    return " UNION ALL ".join(f"SELECT '{kind}' AS staff_type, id AS staff_id, name FROM {table}" for kind, table in STAFF.items())
+def staff_grades(conn: sqlite3.Connection) -> pd.DataFrame:
+    # Every member of staff with their grade, None where not graded yet
+    return pd.read_sql_query(f"""
+        SELECT s.staff_type, s.staff_id, s.name, g.grade FROM ({_staff_sql()}) s
+        LEFT JOIN staff_grades g ON g.staff_type = s.staff_type AND g.staff_id = s.staff_id
+        ORDER BY s.staff_type DESC, s.staff_id
+    """, conn)
+# === RUN ===
+def generate(conn: sqlite3.Connection, month: str) -> dict:
+    # One transaction: drop the month's drafts and rebuild them; approved and paid rows stay as they are.
+    # The month's unpaid salary rows follow payroll: updated from the drafts, removed where payroll has no row
+    month = _month(month)
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        conn.execute("DELETE FROM payroll WHERE month = ? AND status = 'draft'", (month,))
+        created = conn.execute(f"""
+            INSERT INTO payroll (month, staff_type, staff_id, name, grade, basic, allowances, deductions, net)
+            SELECT :month, s.staff_type, s.staff_id, s.name, p.grade, p.basic, p.allowances, p.deductions,
+                   ROUND(p.basic + p.allowances - p.deductions, 2)
+            FROM ({_staff_sql()}) s
+            JOIN staff_grades g ON g.staff_type = s.staff_type AND g.staff_id = s.staff_id
+            JOIN pay_scales p ON p.grade = g.grade
+            WHERE NOT EXISTS (SELECT 1 FROM salary x WHERE s.staff_type = 'teacher' AND x.teacher_id = s.staff_id
+                              AND x.month = :month AND x.paid)
+            ON CONFLICT (month, staff_type, staff_id) DO NOTHING
+        """, {'month': month}).rowcount
+        ungraded = conn.execute(f"""
+            SELECT COUNT(*) FROM ({_staff_sql()}) s
+            WHERE NOT EXISTS (SELECT 1 FROM staff_grades g JOIN pay_scales p ON p.grade = g.grade
+                              WHERE g.staff_type = s.staff_type AND g.staff_id = s.staff_id)
+        """).fetchone()[0]
+        conn.execute("""
+            INSERT INTO salary SELECT staff_id, month, net, 0 FROM payroll WHERE month = ? AND staff_type = 'teacher' AND status = 'draft'
+            ON CONFLICT (teacher_id, month) DO UPDATE SET amount = excluded.amount WHERE NOT salary.paid
+        """, (month,))
+        # Unpaid salary rows of teachers who dropped out of the run (grade or pay scale removed) would keep a stale amount
+        conn.execute("""
+            DELETE FROM salary WHERE month = :month AND NOT paid AND NOT EXISTS (
+                SELECT 1 FROM payroll p WHERE p.month = :month AND p.staff_type = 'teacher' AND p.staff_id = salary.teacher_id)
+        """, {'month': month})
+    total = conn.execute("SELECT COUNT(*) FROM payroll WHERE month = ?", (month,)).fetchone()[0]
+    return {'created': created, 'kept': total - created, 'ungraded': ungraded}
+def transition(conn: sqlite3.Connection, month: str, action: str, staff: Optional[list] = None) -> int:
+    # Moves rows of the month in bulk; staff is a list of (staff_type, staff_id), None for every eligible row.
+    # Returns how many rows moved; rows not in the starting status are skipped.
+    month = _month(month)
+    if action not in TRANSITIONS:
+        raise ServiceError(f"Action must be one of: {', '.join(TRANSITIONS)}")
+    source, target, stamp = TRANSITIONS[action]
+    now = datetime.now().isoformat(timespec='seconds')
+    sets = "status = ?" + (f", {stamp} = ?" if stamp else ", approved_at = NULL")
+    params = [target] + ([now] if stamp else [])
+    moved = 0
+    with conn:
+        if staff is None:
+            moved = conn.execute(f"UPDATE payroll SET {sets} WHERE month = ? AND status = ?", params + [month, source]).rowcount
+        else:
+            for chunk in _chunks([(str(k), int(i)) for k, i in staff]):
+                moved += conn.execute(f"""
+                    UPDATE payroll SET {sets} WHERE month = ? AND status = ?
+                    AND (staff_type, staff_id) IN (VALUES {', '.join(['(?, ?)'] * len(chunk))})
+                """, params + [month, source] + [v for row in chunk for v in row]).rowcount
+        if target == 'paid':
+            conn.execute("""
+                INSERT INTO salary SELECT staff_id, month, net, 1 FROM payroll WHERE month = ? AND staff_type = 'teacher' AND status = 'paid'
+                ON CONFLICT (teacher_id, month) DO UPDATE SET amount = excluded.amount, paid = 1
+            """, (month,))
+    return moved
+def payroll(conn: sqlite3.Connection, month: str) -> pd.DataFrame:
+    return pd.read_sql_query("SELECT * FROM payroll WHERE month = ? ORDER BY staff_type DESC, staff_id", conn, params=(_month(month),))
+def summary(conn: sqlite3.Connection, month: str) -> pd.DataFrame:
+    return pd.read_sql_query("""
+        SELECT status, COUNT(*) AS staff, ROUND(SUM(net), 2) AS net FROM payroll WHERE month = ? GROUP BY status
+    """, conn, params=(_month(month),))
+# === PAYSLIPS ===
+def payslip_text(row: dict, school: str = "") -> str:
+    return (f"{school}\nPAYSLIP - {row['month']}\n\n"
+            f"Name: {row['name']}\nStaff: {row['staff_type'].replace('_', '-')} #{row['staff_id']}\nGrade: {row['grade']}\n\n"
+            f"Basic pay:   {row['basic']:>12,.2f}\nAllowances:  {row['allowances']:>12,.2f}\n"
+            f"Deductions:  {row['deductions']:>12,.2f}\nNet pay:     {row['net']:>12,.2f}\n\n"
+            f"Status: {row['status']}{' on ' + row['paid_at'] if row.get('paid_at') else ''}\n")
+def payslips_zip(rows: pd.DataFrame, school: str = "", workers: int = 4) -> bytes:
+    # Slips are rendered on a thread pool while the main thread deflates finished ones into the archive
+    # (zlib releases the GIL, so the two overlap); map() keeps the archive in payroll order
+    buffer = io.BytesIO()
+    records = rows.to_dict('records')
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf, ThreadPoolExecutor(max_workers=workers) as pool:
+        for record, text in zip(records, pool.map(lambda r: payslip_text(r, school), records)):
+            zf.writestr(f"payslip_{record['month']}_{record['staff_type']}_{record['staff_id']}.txt", text)
+    return buffer.getvalue()
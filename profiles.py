@@ -0,0 +1,117 @@
+# Student 360 profile: demographics, photo thumbnail, term attendance, results with class positions, fees and
+# payments, and the class's teachers, from a handful of queries that all go through indexes keyed on the
+# student (or their class) instead of loading whole tables.
+# Triggers keep two generation counters the app caches profiles on:
+#   student_versions (student_id) bumped by writes to that pupil's students, attendance, results and fees rows
+#   class_versions   (class)      bumped by results in the class (positions move) and its teacher assignments
+import io
+import sqlite3
+from datetime import date, datetime
+from typing import Optional
+import pandas as pd
+from PIL import Image, ImageOps
+THUMBNAIL = (160, 200)
+TERM_STARTS = [(1, 1), (5, 1), (9, 1)]  # (month, day): January, May and September terms
+BUMP = {
+    'student': "INSERT INTO student_versions SELECT {0}, 1 WHERE {0} IS NOT NULL "
+               "ON CONFLICT (student_id) DO UPDATE SET generation = generation + 1;",
+    'class': "INSERT INTO class_versions SELECT {0}, 1 WHERE {0} IS NOT NULL "
+             "ON CONFLICT (class) DO UPDATE SET generation = generation + 1;",
+    'class_of': "INSERT INTO class_versions SELECT class, 1 FROM students WHERE id = {0} "
+                "ON CONFLICT (class) DO UPDATE SET generation = generation + 1;",
+}
+# table: (counter, column) pairs bumped for the old and new row of every write
+WATCHED = {
+    'students': [('student', 'id'), ('class', 'class')],
+    'attendance': [('student', 'student_id')],
+    'results': [('student', 'student_id'), ('class_of', 'student_id')],
+    'fees': [('student', 'student_id')],
+    'class_teachers': [('class', 'class')],
+    'subject_assignments': [('class', 'class')],
+}
+def ensure_profile(conn: sqlite3.Connection) -> None:
+    script = """
+        CREATE TABLE IF NOT EXISTS student_versions (student_id INTEGER PRIMARY KEY, generation INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS class_versions (class TEXT PRIMARY KEY, generation INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS idx_attendance_student ON attendance (student_id, date, present);
+        CREATE INDEX IF NOT EXISTS idx_fees_student ON fees (student_id);
+        CREATE INDEX IF NOT EXISTS idx_students_class ON students (class);
+    """
+    for table, counters in WATCHED.items():
+        for op, rows in (('INSERT', ['NEW']), ('UPDATE', ['OLD', 'NEW']), ('DELETE', ['OLD'])):
+            body = " ".join(BUMP[kind].format(f"{row}.{column}") for row in rows for kind, column in counters)
+            script += f"CREATE TRIGGER IF NOT EXISTS {table}_profile_{op.lower()} AFTER {op} ON {table} BEGIN {body} END;\n"
+    conn.executescript(script)
+def versions(conn: sqlite3.Connection, student_id: int) -> Optional[tuple]:
+    # (student generation, class generation), or None for an unknown student
+    return conn.execute("""
+        SELECT COALESCE(sv.generation, 0), COALESCE(cv.generation, 0) FROM students s
+        LEFT JOIN student_versions sv ON sv.student_id = s.id LEFT JOIN class_versions cv ON cv.class = s.class
+        WHERE s.id = ?
+    """, (int(student_id),)).fetchone()
+def term_start(on: date) -> date:
+    return max(date(on.year, m, d) for m, d in TERM_STARTS if date(on.year, m, d) <= on)
+def thumbnail(path: Optional[str], size: tuple = THUMBNAIL) -> Optional[bytes]:
+    if not path:
+        return None
+    try:
+        with Image.open(path) as im:
+            thumb = ImageOps.fit(ImageOps.exif_transpose(im).convert('RGB'), size)
+    except (OSError, ValueError):
+        return None
+    buffer = io.BytesIO()
+    thumb.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+def student_profile(conn: sqlite3.Connection, student_id: int, on: Optional[date] = None) -> Optional[dict]:
+    on = on or datetime.now().date()
+    student_id = int(student_id)
+    row = conn.execute("SELECT * FROM students WHERE id = ?", (student_id,))
+    names = [c[0] for c in row.description]
+    row = row.fetchone()
+    if row is None:
+        return None
+    student = dict(zip(names, row))
+    class_ = student['class']
+    start = term_start(on)
+    days, present = conn.execute("""
+        SELECT COUNT(*), COALESCE(SUM(present), 0) FROM attendance WHERE student_id = ? AND date BETWEEN ? AND ?
+    """, (student_id, start.isoformat(), on.isoformat())).fetchone()
+    results = pd.read_sql_query("""
+        SELECT subject, score, position, out_of FROM (
+            SELECT r.student_id, r.subject, r.score, RANK() OVER (PARTITION BY r.subject ORDER BY r.score DESC) AS position,
+                   COUNT(*) OVER (PARTITION BY r.subject) AS out_of
+            FROM students s JOIN results r ON r.student_id = s.id WHERE s.class = ?)
+        WHERE student_id = ? ORDER BY subject
+    """, conn, params=(class_, student_id))
+    overall = conn.execute("""
+        SELECT position, out_of, total FROM (
+            SELECT r.student_id, SUM(r.score) AS total, RANK() OVER (ORDER BY SUM(r.score) DESC) AS position,
+                   COUNT(*) OVER () AS out_of
+            FROM students s JOIN results r ON r.student_id = s.id WHERE s.class = ? GROUP BY r.student_id)
+        WHERE student_id = ?
+    """, (class_, student_id)).fetchone()
+    fees = pd.read_sql_query("""
+        SELECT class, fee_amount, COALESCE(paid_amount, 0) AS paid, fee_amount - COALESCE(paid_amount, 0) AS balance, date_paid
+        FROM fees WHERE student_id = ? ORDER BY rowid
+    """, conn, params=(student_id,))
+    payments = pd.read_sql_query("""
+        SELECT paid_on, class, amount, collected_by FROM fee_payments WHERE student_id = ? ORDER BY id DESC
+    """, conn, params=(student_id,))
+    teachers = pd.read_sql_query("""
+        SELECT 'Class teacher' AS role, t.id AS teacher_id, t.name FROM class_teachers ct JOIN teachers t ON t.id = ct.teacher_id
+        WHERE ct.class = ?
+        UNION ALL
+        SELECT sa.subject, t.id, t.name FROM subject_assignments sa JOIN teachers t ON t.id = sa.teacher_id WHERE sa.class = ?
+    """, conn, params=(class_, class_))
+    return {
+        'student': student,
+        'photo': thumbnail(student.get('passport_picture_path')),
+        'attendance': {'since': start, 'days': days, 'present': present, 'rate': present / days if days else None},
+        'results': results,
+        'overall': dict(zip(['position', 'out_of', 'total'], overall)) if overall else None,
+        'average': float(results['score'].mean()) if not results.empty else None,
+        'fees': fees,
+        'balance': float(fees['balance'].sum()),
+        'payments': payments,
+        'teachers': teachers,
+    }
@@ -0,0 +1,162 @@
+# End-of-year rollover: every pupil moves to the next class in one statement, final-year classes graduate,
+# new fee rows are billed from the class fee schedule, and class-teacher and subject assignments move up with their
+# pupils. teachers_follow=False leaves them on the class name, for schools whose teachers keep the same class each year.
+# All of it is one transaction. A dry run executes exactly the same statements and rolls back, so the preview
+# always matches what a real run would do.
+#   class_progression (class -> next_class; NULL next_class = final year)
+#   alumni            (student_id, last_class, graduated_on, academic_year); the student row stays, class 'Alumni'
+#   rollovers         one row per academic year, so a year cannot be rolled over twice
+#   assignment_history class_teachers and subject_assignments as they stood before each rollover
+import re
+import sqlite3
+from datetime import datetime
+from typing import Iterable, Optional
+import pandas as pd
+from services import ServiceError
+ALUMNI_CLASS = 'Alumni'
+# Class-name prefixes in school order, used only to suggest a progression
+STAGES = ['CRECHE', 'NURSERY', 'KG', 'P', 'PRIMARY', 'B', 'BASIC', 'JHS', 'SHS']
+def ensure_rollover(conn: sqlite3.Connection) -> None:
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS class_progression (class TEXT PRIMARY KEY, next_class TEXT);
+        CREATE TABLE IF NOT EXISTS alumni (student_id INTEGER PRIMARY KEY REFERENCES students (id), last_class TEXT NOT NULL,
+            graduated_on DATE NOT NULL, academic_year TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS rollovers (academic_year TEXT PRIMARY KEY, ran_at TEXT NOT NULL, promoted INTEGER NOT NULL,
+            graduated INTEGER NOT NULL, fee_rows INTEGER NOT NULL, teachers_follow INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS assignment_history (academic_year TEXT NOT NULL, kind TEXT NOT NULL, class TEXT NOT NULL,
+            subject TEXT, teacher_id INTEGER NOT NULL);
+    """)
+# === PROGRESSION ===
+def suggest_progression(classes: Iterable[str]) -> dict:
+    # KG1 -> KG2, ..., the last of a stage -> the first class of the next stage present, the last stage graduates
+    parsed = {}
+    for c in classes:
+        match = re.fullmatch(r'\s*([A-Za-z]+)\s*(\d+)\s*', c)
+        if match:
+            parsed[c] = (match.group(1).upper(), int(match.group(2)))
+    order = sorted(parsed, key=lambda c: (STAGES.index(parsed[c][0]) if parsed[c][0] in STAGES else len(STAGES), parsed[c]))
+    return {c: (order[i + 1] if i + 1 < len(order) else None) for i, c in enumerate(order)}
+def progression(conn: sqlite3.Connection) -> pd.DataFrame:
+    # Saved mapping plus every class in use that has none yet, filled with the suggestion
+    saved = dict(conn.execute("SELECT class, next_class FROM class_progression").fetchall())
+    classes = [r[0] for r in conn.execute("SELECT DISTINCT class FROM students WHERE class != ? ORDER BY class", (ALUMNI_CLASS,))]
+    suggested = suggest_progression(classes)
+    rows = [(c, saved[c] if c in saved else suggested.get(c), c in saved) for c in sorted(set(classes) | set(saved))]
+    order = list(suggested) + sorted(set(c for c, _, _ in rows) - set(suggested))
+    return pd.DataFrame(sorted(rows, key=lambda r: order.index(r[0])), columns=['class', 'next_class', 'saved'])
+def save_progression(conn: sqlite3.Connection, mapping: dict) -> int:
+    # mapping: {class: next class or None to graduate}
+    rows = []
+    for class_, next_class in mapping.items():
+        class_ = str(class_).strip()
+        next_class = str(next_class).strip() if next_class is not None and not pd.isna(next_class) and str(next_class).strip() else None
+        if not class_ or class_ == ALUMNI_CLASS or next_class == ALUMNI_CLASS:
+            raise ServiceError(f"'{ALUMNI_CLASS}' is reserved for graduates; leave the next class empty instead")
+        rows.append((class_, next_class))
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO class_progression VALUES (?, ?)", rows)
+    return len(rows)
+# === ROLLOVER ===
+ASSIGNMENTS_SQL = """
+    SELECT 'class_teacher' AS kind, NULL AS id, class, NULL AS subject, teacher_id FROM class_teachers
+    UNION ALL SELECT 'subject', id, class, subject, teacher_id FROM subject_assignments
+"""
+def _move_assignments(conn) -> pd.DataFrame:
+    # Rebuilt through a temp table: moving rows in place would collide with the next class's rows mid-statement.
+    # Assignments of final-year classes go to the entry class when there is exactly one (a loop), else they lapse.
+    # Two subject assignments landing on one class and subject (two classes merged, or a class moving into one that
+    # stays) would lose one of them, so that stops the rollover, naming each clash, before anything is deleted
+    entry = [r[0] for r in conn.execute("""
+        SELECT class FROM class_progression WHERE class NOT IN (SELECT next_class FROM class_progression WHERE next_class IS NOT NULL)
+    """)]
+    conn.execute("DROP TABLE IF EXISTS temp.class_map")
+    conn.execute("""
+        CREATE TEMP TABLE class_map AS
+        SELECT class, COALESCE(next_class, ?) AS next_class FROM class_progression
+    """, (entry[0] if len(entry) == 1 else None,))
+    changes = pd.read_sql_query(f"""
+        SELECT a.kind, a.subject, a.teacher_id, a.class AS from_class, m.next_class AS to_class
+        FROM ({ASSIGNMENTS_SQL}) a JOIN temp.class_map m ON m.class = a.class ORDER BY a.kind, a.class, a.subject
+    """, conn)
+    conn.execute("DROP TABLE IF EXISTS temp.moved")
+    conn.execute(f"""
+        CREATE TEMP TABLE moved AS
+        SELECT a.*, a.class AS from_class, COALESCE(m.next_class, a.class) AS to_class
+        FROM ({ASSIGNMENTS_SQL}) a LEFT JOIN temp.class_map m ON m.class = a.class
+        WHERE m.class IS NULL OR m.next_class IS NOT NULL
+    """)
+    clashes = conn.execute("""
+        SELECT to_class, subject, GROUP_CONCAT('teacher ' || teacher_id || ' from ' || from_class, ', ') FROM temp.moved
+        WHERE kind = 'subject' GROUP BY to_class, subject HAVING COUNT(DISTINCT teacher_id) > 1 ORDER BY to_class, subject
+    """).fetchall()
+    if clashes:
+        listed = "; ".join(f"{c} {s} ({t})" for c, s, t in clashes[:10]) + ("; ..." if len(clashes) > 10 else "")
+        raise ServiceError(f"Teachers moving up would share a class and subject: {listed}. Change the progression or "
+                           "the subject assignments first")
+    # Rows that land on the same key with the same teacher are one assignment; class teachers may be several
+    conn.execute("DELETE FROM class_teachers")
+    conn.execute("INSERT INTO class_teachers (class, teacher_id) SELECT DISTINCT to_class, teacher_id FROM temp.moved WHERE kind = 'class_teacher'")
+    conn.execute("DELETE FROM subject_assignments")
+    conn.execute("""
+        INSERT INTO subject_assignments (id, class, subject, teacher_id)
+        SELECT MIN(id), to_class, subject, teacher_id FROM temp.moved WHERE kind = 'subject' GROUP BY to_class, subject
+    """)
+    return changes
+def rollover(conn: sqlite3.Connection, academic_year: str, teachers_follow: bool = True, dry_run: bool = True,
+             on: Optional[datetime] = None) -> dict:
+    # Returns the diff: class moves, graduates, fee rows billed, assignment changes and classes left unmapped
+    academic_year = (academic_year or '').strip()
+    if not academic_year:
+        raise ServiceError("Academic year is required")
+    if conn.execute("SELECT 1 FROM rollovers WHERE academic_year = ?", (academic_year,)).fetchone():
+        raise ServiceError(f"{academic_year} has already been rolled over")
+    if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM class_progression)").fetchone()[0]:
+        raise ServiceError("Save the class progression first")
+    today = (on or datetime.now()).date().isoformat()
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        moves = pd.read_sql_query("""
+            SELECT s.class AS from_class, COALESCE(p.next_class, ?) AS to_class, COUNT(*) AS students
+            FROM students s JOIN class_progression p ON p.class = s.class GROUP BY s.class ORDER BY s.class
+        """, conn, params=(ALUMNI_CLASS,))
+        unmapped = pd.read_sql_query("""
+            SELECT class, COUNT(*) AS students FROM students
+            WHERE class != ? AND class NOT IN (SELECT class FROM class_progression) GROUP BY class ORDER BY class
+        """, conn, params=(ALUMNI_CLASS,))
+        conn.execute(f"INSERT INTO assignment_history SELECT ?, kind, class, subject, teacher_id FROM ({ASSIGNMENTS_SQL})",
+                     (academic_year,))
+        graduated = conn.execute("""
+            INSERT OR REPLACE INTO alumni
+            SELECT s.id, s.class, ?, ? FROM students s JOIN class_progression p ON p.class = s.class WHERE p.next_class IS NULL
+        """, (today, academic_year)).rowcount
+        promoted = conn.execute("""
+            UPDATE students SET class = COALESCE(p.next_class, ?) FROM class_progression p WHERE p.class = students.class
+        """, (ALUMNI_CLASS,)).rowcount - graduated
+        # One fee row per pupil and class, billed from the class's latest template row; repeaters keep theirs
+        due = """
+            FROM students s
+            JOIN (SELECT class, fee_amount, MAX(rowid) FROM fees WHERE student_id IS NULL GROUP BY class) f ON f.class = s.class
+            WHERE s.class != ? AND NOT EXISTS (SELECT 1 FROM fees x WHERE x.student_id = s.id AND x.class = s.class)
+        """
+        billed = conn.execute(f"SELECT COALESCE(SUM(f.fee_amount), 0) {due}", (ALUMNI_CLASS,)).fetchone()[0]
+        fees = conn.execute(f"INSERT INTO fees (class, fee_amount, student_id, paid_amount) SELECT s.class, f.fee_amount, s.id, 0 {due}",
+                            (ALUMNI_CLASS,)).rowcount
+        # to_class None: the assignment lapses (final-year class with no single entry class to loop back to)
+        changes = _move_assignments(conn) if teachers_follow else pd.DataFrame(
+            columns=['kind', 'subject', 'teacher_id', 'from_class', 'to_class'])
+        conn.execute("INSERT INTO rollovers VALUES (?, ?, ?, ?, ?, ?)",
+                     (academic_year, datetime.now().isoformat(timespec='seconds'), promoted, graduated, fees, int(teachers_follow)))
+        report = {'academic_year': academic_year, 'dry_run': dry_run, 'promoted': promoted, 'graduated': graduated,
+                  'fee_rows': fees, 'billed': round(billed, 2), 'moves': moves, 'unmapped': unmapped,
+                  'assignment_changes': changes}
+    except Exception:
+        conn.rollback()
+        raise
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    return report
+def history(conn: sqlite3.Connection) -> pd.DataFrame:
+    return pd.read_sql_query("SELECT * FROM rollovers ORDER BY academic_year DESC", conn)
@@ -0,0 +1,70 @@
+# Typed table loading: the dtype of every column the app reads into pandas, and a loader that projects columns.
+# read_sql_query alone gives object columns for all text, dates as strings and BOOLEAN flags as int64; here
+# low-cardinality text is categorical, free text is Arrow-backed, IDs and scores are the smallest integer that
+# holds them (nullable where the column allows NULL), dates are datetime64 and flags are bool.
+# A session's copy of students or attendance shrinks several times over (python -m benchmarks.memory_bench).
+import sqlite3
+from typing import Iterable, Optional
+import pandas as pd
+try:
+    import pyarrow  # noqa: F401  (installed with streamlit)
+    TEXT = 'string[pyarrow]'
+except ImportError:
+    TEXT = object
+CATEGORY, DATE = 'category', 'date'
+# Nullable counterparts, used when a column declared NOT NULL here still holds NULLs
+NULLABLE = {'int8': 'Int8', 'int16': 'Int16', 'int32': 'Int32', 'bool': 'boolean'}
+TABLES = {
+    'users': {'username': TEXT, 'password': TEXT, 'role': CATEGORY},
+    'students': {'id': 'int32', 'first_name': TEXT, 'middle_name': TEXT, 'surname': TEXT, 'class': CATEGORY, 'dob': DATE,
+                 'gender': CATEGORY, 'residence': TEXT, 'guardian_name': TEXT, 'guardian_phone': TEXT,
+                 'insurance_number': TEXT, 'registration_date': DATE, 'has_medical_condition': 'boolean',
+                 'medical_details': TEXT, 'passport_picture_path': TEXT},
+    'teachers': {'id': 'int32', 'name': TEXT, 'subject': CATEGORY, 'email': TEXT, 'phone': TEXT},
+    'non_teaching': {'id': 'int32', 'name': TEXT, 'role': CATEGORY, 'email': TEXT, 'phone': TEXT},
+    'attendance': {'date': DATE, 'student_id': 'int32', 'present': 'bool'},
+    'results': {'student_id': 'int32', 'subject': CATEGORY, 'score': 'int16'},
+    'salary': {'teacher_id': 'int32', 'month': CATEGORY, 'amount': 'float64', 'paid': 'bool'},
+    'fees': {'class': CATEGORY, 'fee_amount': 'float64', 'student_id': 'Int32', 'paid_amount': 'float64', 'date_paid': DATE,
+             'collected_by': CATEGORY},
+    'reports': {'teacher_id': 'int32', 'report_content': TEXT, 'date': DATE},
+    'register': {'teacher_id': 'int32', 'class': CATEGORY, 'date': DATE, 'marked': 'bool'},
+    'class_teachers': {'class': CATEGORY, 'teacher_id': 'int32'},
+    'teacher_attendance': {'date': DATE, 'teacher_id': 'int32', 'present': 'bool'},
+    'timetables': {'id': 'int32', 'class': CATEGORY, 'day': CATEGORY, 'period': 'int8', 'subject': CATEGORY,
+                   'teacher_id': 'Int32'},
+    'subject_assignments': {'id': 'int32', 'class': CATEGORY, 'subject': CATEGORY, 'teacher_id': 'int32'},
+    'login_logs': {'id': 'int32', 'username': CATEGORY, 'login_time': DATE, 'ip_address': CATEGORY},
+    'activities': {'id': 'int32', 'activity': TEXT, 'date': DATE, 'description': TEXT},
+}
+# Columns computed in the SELECT, so they are built once in SQLite rather than by concatenating Series
+COMPUTED = {
+    'students': {'full_name': ("first_name || ' ' || COALESCE(NULLIF(middle_name, '') || ' ', '') || surname", TEXT)},
+}
+def columns(table: str) -> list:
+    return list(TABLES[table]) + list(COMPUTED.get(table, {}))
+def typed(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    # Converts the columns named in dtypes; columns it does not name are left as read
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            continue
+        if dtype == DATE:
+            df[column] = pd.to_datetime(df[column], errors='coerce', format='ISO8601')
+        elif dtype in NULLABLE and df[column].isna().any():
+            df[column] = df[column].astype(NULLABLE[dtype])
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+def load_frame(conn: sqlite3.Connection, table: str, columns_: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    # Reads only the requested columns (all, computed ones included, by default) with their registered dtypes.
+    # Tables not in the registry are read as they are.
+    if table not in TABLES:
+        return pd.read_sql_query(f"SELECT * FROM {table}", conn)
+    computed = COMPUTED.get(table, {})
+    wanted = list(columns_) if columns_ else columns(table)
+    unknown = [c for c in wanted if c not in TABLES[table] and c not in computed]
+    if unknown:
+        raise KeyError(f"{table} has no column {', '.join(unknown)}")
+    select = ", ".join(f"{computed[c][0]} AS {c}" if c in computed else f'"{c}"' for c in wanted)
+    df = pd.read_sql_query(f"SELECT {select} FROM {table}", conn)
+    return typed(df, {**TABLES[table], **{c: dtype for c, (_, dtype) in computed.items()}})
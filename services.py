@@ -0,0 +1,197 @@
+import os
+import sqlite3
+from datetime import date, datetime
+from typing import Iterable, Mapping, Optional
+import pandas as pd
+import sync
+from validation import is_valid_class, is_valid_day, is_valid_period, is_valid_subject
+# Business logic with no Streamlit in it. Every function takes an open sqlite3 connection, so the same code
+# runs from the UI, scripts, worker threads and benchmarks. Writes run as one transaction (`with conn`).
+# Rule violations raise ServiceError with a message fit to show the user as is.
+class ServiceError(ValueError):
+    pass
+def connect(database: str) -> sqlite3.Connection:
+    # check_same_thread=False so a connection opened by the caller can be handed to a worker thread
+    return sqlite3.connect(database, check_same_thread=False)
+def _today(on: Optional[date]) -> date:
+    return on or datetime.now().date()
+# === TABLE VERSIONS ===
+# A per-table generation counter bumped by triggers on every write, whoever makes it (UI, API, scripts).
+# Readers compare generations to tell whether cached or previously served data is still current.
+VERSIONED_TABLES = ["students", "attendance", "results", "fees", "timetables", "activities"]
+def ensure_table_versions(conn: sqlite3.Connection) -> None:
+    conn.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, generation INTEGER NOT NULL DEFAULT 0)")
+    conn.executemany("INSERT OR IGNORE INTO table_versions (name) VALUES (?)", [(t,) for t in VERSIONED_TABLES])
+    for table in VERSIONED_TABLES:
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{op.lower()} AFTER {op} ON {table}
+                BEGIN UPDATE table_versions SET generation = generation + 1 WHERE name = '{table}'; END
+            """)
+    conn.commit()
+def table_generations(conn: sqlite3.Connection, tables: Iterable[str]) -> dict:
+    tables = list(tables)
+    rows = conn.execute(f"SELECT name, generation FROM table_versions WHERE name IN ({', '.join('?' * len(tables))})", tables)
+    return dict(rows.fetchall())
+# === FEES ===
+def insert_student_fees(conn: sqlite3.Connection, first_id: int, last_id: int) -> None:
+    # Class fee is the template row (student_id NULL); the latest one wins if a class was set up twice
+    conn.execute("""
+        INSERT INTO fees (class, fee_amount, student_id, paid_amount)
+        SELECT s.class, COALESCE(f.fee_amount, 0), s.id, 0
+        FROM students s
+        LEFT JOIN (SELECT class, fee_amount, MAX(rowid) FROM fees WHERE student_id IS NULL GROUP BY class) f ON f.class = s.class
+        WHERE s.id BETWEEN ? AND ?
+          AND NOT EXISTS (SELECT 1 FROM fees x WHERE x.student_id = s.id AND x.class = s.class)
+    """, (first_id, last_id))
+def record_payment(conn: sqlite3.Connection, student_id: int, amount: float, collected_by: str,
+                   on: Optional[date] = None) -> float:
+    # Adds to the fee row of the student's current class, creating it from the class fee if missing; returns the new total paid
+    row = conn.execute("SELECT class FROM students WHERE id = ?", (student_id,)).fetchone()
+    if row is None:
+        raise ServiceError("Student not found")
+    if amount < 0:
+        raise ServiceError("Amount cannot be negative")
+    with conn:
+        insert_student_fees(conn, student_id, student_id)
+        conn.execute("""
+            UPDATE fees SET paid_amount = COALESCE(paid_amount, 0) + ?, date_paid = ?, collected_by = ?
+            WHERE student_id = ? AND class = ?
+        """, (amount, _today(on), collected_by, student_id, row[0]))
+    return conn.execute("SELECT paid_amount FROM fees WHERE student_id = ? AND class = ?", (student_id, row[0])).fetchone()[0]
+# === ATTENDANCE ===
+# Marks go through sync.merge_events like a pushed tablet batch: a later mark for the same day corrects an earlier one.
+def _merge_marks(conn, kind, client_id, value, keys, on, reference):
+    result = sync.record_marks(conn, kind, client_id, value, keys, on)
+    if result['rejected']:
+        raise ServiceError(f"Unknown {reference}: {', '.join(r['error'].split()[-1] for r in result['rejected'])}")
+    return result['applied']
+def mark_attendance_bulk(conn: sqlite3.Connection, student_ids: Iterable[int], present: bool,
+                         on: Optional[date] = None, client_id: str = 'ui') -> int:
+    # Returns how many marks were applied; unknown student IDs raise ServiceError after the rest are saved
+    return _merge_marks(conn, 'attendance', client_id, present, [{'student_id': sid} for sid in student_ids], on, "student ID")
+def mark_class_attendance(conn: sqlite3.Connection, class_name: str, present: bool, on: Optional[date] = None,
+                          client_id: str = 'ui') -> int:
+    # Returns the class size; ServiceError if nobody is in the class
+    ids = [r[0] for r in conn.execute("SELECT id FROM students WHERE class = ?", (class_name,)).fetchall()]
+    if not ids:
+        raise ServiceError("No students found in class or invalid class")
+    mark_attendance_bulk(conn, ids, present, on, client_id)
+    return len(ids)
+def mark_teacher_attendance(conn: sqlite3.Connection, teacher_ids: Iterable[int], present: bool,
+                            on: Optional[date] = None, client_id: str = 'ui') -> int:
+    return _merge_marks(conn, 'teacher_attendance', client_id, present, [{'teacher_id': tid} for tid in teacher_ids], on, "teacher ID")
+def mark_register(conn: sqlite3.Connection, teacher_id: int, class_name: str, on: Optional[date] = None,
+                  client_id: str = 'ui') -> int:
+    if not is_valid_class(class_name):
+        raise ServiceError("Invalid class name")
+    return _merge_marks(conn, 'register', client_id, True, [{'teacher_id': teacher_id, 'class': class_name.strip()}], on, "teacher ID")
+# === TIMETABLE ===
+def available_teachers(conn: sqlite3.Connection, subject: str, class_name: str) -> list:
+    # Teachers of the subject not yet assigned to teach it in this class
+    rows = conn.execute("""
+        SELECT id, name FROM teachers t
+        WHERE subject = ?
+          AND NOT EXISTS (SELECT 1 FROM subject_assignments a WHERE a.teacher_id = t.id AND a.class = ? AND a.subject = ?)
+        ORDER BY id
+    """, (subject, class_name, subject)).fetchall()
+    return [{'id': r[0], 'name': r[1]} for r in rows]
+def check_conflict(conn: sqlite3.Connection, class_name: str, day: str, period: int, teacher_id: Optional[int]) -> bool:
+    # True if the teacher already has another class in this slot
+    if not teacher_id:
+        return False
+    return conn.execute("""
+        SELECT EXISTS (SELECT 1 FROM timetables WHERE day = ? AND period = ? AND teacher_id = ? AND class != ?)
+    """, (day, int(period), int(teacher_id), class_name)).fetchone()[0] == 1
+def _check_slot(conn, class_name, day, period, subject, teacher_id):
+    if not is_valid_class(class_name): raise ServiceError("Invalid class name")
+    if not is_valid_day(day): raise ServiceError("Invalid day")
+    if not is_valid_period(period): raise ServiceError("Period must be between 1 and 8")
+    if not is_valid_subject(subject): raise ServiceError("Invalid subject")
+    if check_conflict(conn, class_name.strip(), day, period, teacher_id):
+        raise ServiceError("Teacher is already assigned to another class at this time")
+def add_timetable_slot(conn: sqlite3.Connection, class_name: str, day: str, period: int, subject: str,
+                       teacher_id: Optional[int] = None) -> int:
+    _check_slot(conn, class_name, day, period, subject, teacher_id)
+    try:
+        with conn:
+            new_id = (conn.execute("SELECT MAX(id) FROM timetables").fetchone()[0] or 0) + 1
+            conn.execute("INSERT INTO timetables VALUES (?, ?, ?, ?, ?, ?)",
+                         (new_id, class_name.strip(), day, int(period), subject.strip(), teacher_id))
+    except sqlite3.IntegrityError:
+        raise ServiceError("This class already has a subject scheduled for this day and period")
+    return new_id
+def update_timetable_slot(conn: sqlite3.Connection, slot_id: int, class_name: str, day: str, period: int, subject: str,
+                          teacher_id: Optional[int] = None) -> int:
+    _check_slot(conn, class_name, day, period, subject, teacher_id)
+    try:
+        with conn:
+            conn.execute("UPDATE timetables SET class=?, day=?, period=?, subject=?, teacher_id=? WHERE id=?",
+                         (class_name.strip(), day, int(period), subject.strip(), teacher_id, slot_id))
+    except sqlite3.IntegrityError:
+        raise ServiceError("This class already has a subject scheduled for this day and period")
+    return slot_id
+# === RESULTS ===
+def known_subjects(conn: sqlite3.Connection) -> list:
+    rows = conn.execute("""
+        SELECT subject FROM subject_assignments UNION SELECT subject FROM timetables UNION SELECT subject FROM teachers
+    """).fetchall()
+    return sorted({r[0].strip() for r in rows if r[0] and r[0].strip()})
+def upsert_results(conn: sqlite3.Connection, valid: pd.DataFrame) -> int:
+    # valid: validated rows with student_id, subject and score columns
+    rows = list(zip(valid['student_id'].astype(int), valid['subject'], valid['score'].astype(int)))
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", rows)
+    return len(rows)
+# === STUDENTS ===
+def admit_students(conn: sqlite3.Connection, valid: pd.DataFrame, photo_folder: str,
+                   photos: Optional[Mapping] = None) -> tuple:
+    # valid: rows from validate_admissions; photos: {row number or file name: (extension, bytes)}.
+    # Returns (first new id, count). Photo files written before a failure are removed again.
+    photos = photos or {}
+    written = []
+    try:
+        with conn:
+            first_id = (conn.execute("SELECT MAX(id) FROM students").fetchone()[0] or 0) + 1
+            reg_date = datetime.now().date()
+            rows = []
+            for new_id, r in zip(range(first_id, first_id + len(valid)), valid.to_dict('records')):
+                photo = photos.get(r['photo']) or photos.get(str(r['row']))
+                photo_path = None
+                if photo:
+                    photo_path = os.path.join(photo_folder, f"{new_id}.{photo[0]}")
+                    with open(photo_path, "wb") as f:
+                        f.write(photo[1])
+                    written.append(photo_path)
+                rows.append((new_id, r['first_name'], r['middle_name'], r['surname'], r['class'], r['dob'], r['gender'],
+                             r['residence'], r['guardian_name'], r['guardian_phone'], r['insurance_number'], reg_date,
+                             r['has_medical_condition'], r['medical_details'], photo_path))
+            conn.executemany("""
+                INSERT INTO students
+                (id, first_name, middle_name, surname, class, dob, gender, residence, guardian_name, guardian_phone,
+                 insurance_number, registration_date, has_medical_condition, medical_details, passport_picture_path)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            insert_student_fees(conn, first_id, first_id + len(rows) - 1)
+    except Exception:
+        for path in written:
+            os.remove(path)
+        raise
+    return first_id, len(rows)
+def student_report(conn: sqlite3.Connection, student_id: int) -> dict:
+    # {'student': {...}, 'results': DataFrame, 'attendance': DataFrame} for one student, read with indexed lookups
+    cursor = conn.execute("""
+        SELECT *, first_name || ' ' || COALESCE(middle_name, '') || ' ' || surname AS full_name FROM students WHERE id = ?
+    """, (student_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ServiceError("Student not found")
+    student = dict(zip([c[0] for c in cursor.description], row))
+    results = pd.read_sql_query("SELECT * FROM results WHERE student_id = ? ORDER BY subject", conn, params=(student_id,))
+    attendance = pd.read_sql_query("SELECT * FROM attendance WHERE student_id = ? ORDER BY date", conn, params=(student_id,))
+    return {'student': student, 'results': results, 'attendance': attendance}
+def report_card_text(report: dict) -> str:
+    s = report['student']
+    return (f"Report Card for {s['full_name']}\nClass: {s['class']}\nGuardian: {s['guardian_name']}\n"
+            f"Insurance: {s['insurance_number']}\nMedical: {s['has_medical_condition']} - {s['medical_details']}\n\n"
+            f"Results:\n{report['results'].to_string(index=False)}\n\nAttendance:\n{report['attendance'].to_string(index=False)}")
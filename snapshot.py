@@ -0,0 +1,128 @@
+# Read-mostly snapshot: an in-memory copy of a school's database for pages that only read.
+# The copy is a shared in-memory database (SQLite's memdb VFS) filled with VACUUM INTO from a source connection in
+# one read transaction, so in WAL mode writers carry on meanwhile. Every reader takes its own read-only connection
+# to it from a pool, so readers run side by side instead of queueing on one connection or on the file.
+# A copy is used only while PRAGMA data_version on the watch connection says nobody has committed since; a stale
+# copy sends readers to the file (pages see their own writes) and wakes a refresher thread, which takes the next
+# copy once the current one is SCHOOL_SNAPSHOT_INTERVAL seconds old. A burst of marks or payments therefore costs one
+# copy, not one per click. A replaced copy is freed as soon as the last reader still holding it closes.
+#   SCHOOL_SNAPSHOT_INTERVAL  least seconds between copies
+#   SCHOOL_SNAPSHOT_MAX_MB    databases larger than this are not copied; readers fall back to the file
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+import tenants
+SNAPSHOT_INTERVAL = float(os.environ.get('SCHOOL_SNAPSHOT_INTERVAL', 10))
+SNAPSHOT_MAX_MB = int(os.environ.get('SCHOOL_SNAPSHOT_MAX_MB', 256))
+_NAMES = itertools.count(1)  # memdb names are process-wide, so every copy gets a new one
+class Copy(tenants.ConnectionPool):
+    # One copy and its idle reader connections. holder keeps the memory alive until retire(); readers that still
+    # have a connection out keep it until they close, and those connections are not pooled again
+    def __init__(self, name: str, version: int, holder: sqlite3.Connection, size: int = tenants.POOL_SIZE):
+        super().__init__(f"{name}&mode=ro", size)
+        self.version = version
+        self.holder = holder
+    def open(self) -> tenants.PooledConnection:
+        return sqlite3.connect(self.database, uri=True, check_same_thread=False, factory=tenants.PooledConnection)
+    def retire(self) -> None:
+        self.size = 0
+        self.close()
+        self.holder.close()
+class Snapshot:
+    def __init__(self, database: str, interval: float = SNAPSHOT_INTERVAL, max_mb: int = SNAPSHOT_MAX_MB):
+        self.database = database
+        self.interval = interval
+        self.max_bytes = max_mb * 1024 * 1024
+        self.lock = threading.Lock()  # one refresh at a time; guards source
+        self.swap = threading.Lock()  # guards watch and copy; held only for a pragma or a swap
+        self.source = None
+        self.watch = None
+        self.copy = None
+        self.copied_at = 0.0
+        self.refreshes = 0
+        self.too_large = False
+        self.wake = threading.Event()
+        self.thread = None
+        self.closed = False
+    def _version(self) -> int:
+        if self.watch is None:
+            self.watch = sqlite3.connect(self.database, timeout=30, check_same_thread=False)
+        return self.watch.execute("PRAGMA data_version").fetchone()[0]
+    def _swap(self, copy: Optional[Copy]) -> None:
+        # Under swap, so no reader is between picking the old copy and opening a connection to it
+        with self.swap:
+            old, self.copy = self.copy, copy
+            if old is not None:
+                old.retire()
+    def refresh(self) -> Optional[Copy]:
+        # Takes a new copy if the file changed since the current one; returns the current copy
+        with self.lock:
+            with self.swap:
+                version = self._version()
+                if self.copy is not None and self.copy.version == version:
+                    return self.copy
+            if self.source is None:
+                self.source = sqlite3.connect(self.database, timeout=30, uri=True, check_same_thread=False)
+            pages, page_size = (self.source.execute(f"PRAGMA {p}").fetchone()[0] for p in ('page_count', 'page_size'))
+            self.too_large = pages * page_size > self.max_bytes
+            if self.too_large:
+                self._swap(None)
+                return None
+            # version was read first: a commit landing before the copy only makes the copy newer than it says
+            name = f"file:/school-snapshot-{next(_NAMES)}?vfs=memdb"
+            holder = sqlite3.connect(name, uri=True, check_same_thread=False)
+            try:
+                self.source.execute("VACUUM INTO ?", (name,))
+            except sqlite3.Error:
+                holder.close()
+                raise
+            copy = Copy(name, version, holder)
+            self._swap(copy)
+            self.copied_at = time.monotonic()
+            self.refreshes += 1
+            return copy
+    def connect(self) -> Optional[tenants.PooledConnection]:
+        # A read-only connection to the copy while it is current; None (read the file) while a new one is due
+        if self.closed:
+            return None
+        with self.swap:
+            copy = self.copy
+            if copy is not None and copy.version == self._version():
+                return copy.connect()
+        if self.refreshes == 0 and not self.too_large:
+            self.refresh()  # the first read takes the first copy
+            with self.swap:
+                if self.copy is not None and self.copy.version == self._version():
+                    return self.copy.connect()
+        self.schedule()
+        return None
+    def schedule(self) -> None:
+        with self.swap:
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self._refresher, name=f"snapshot {self.database}", daemon=True)
+                self.thread.start()
+        self.wake.set()
+    def _refresher(self):
+        while not self.closed:
+            self.wake.wait()
+            time.sleep(max(0.0, self.copied_at + self.interval - time.monotonic()))
+            self.wake.clear()  # after the wait, so writes made meanwhile are in this copy
+            if self.closed:
+                break
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                pass  # readers stay on the file; the next stale read wakes this again
+    def close(self) -> None:
+        self.closed = True
+        self.wake.set()
+        with self.lock:
+            self._swap(None)
+            with self.swap:
+                for conn in (self.source, self.watch):
+                    if conn is not None:
+                        conn.close()
+                self.source = self.watch = None
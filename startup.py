@@ -0,0 +1,154 @@
+# Cold start. After a deploy or power cut the first request used to pay for importing pandas and the feature
+# modules, schema setup, encoding the login photo and a cold SQLite page cache; now none of that is on its path.
+# Modules the pages need are imported on first use through deferred(), so the login page renders at once, and a
+# warm-up thread does the slow first-time work in timed phases while the first user is still typing a password.
+# status() is the readiness/health report with those timings. The app shows it at ?health=1, and it is written to
+# SCHOOL_HEALTH_FILE (if set) after every phase for container health checks.
+#   python startup.py [streamlit options]   start the app with the warm-up begun at process start, not first visit
+#   python startup.py --check               exit 0 once SCHOOL_HEALTH_FILE says ready, 1 before, 2 if a phase failed
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+HEALTH_FILE = os.environ.get('SCHOOL_HEALTH_FILE', '')
+PREFETCH_MB = int(os.environ.get('SCHOOL_PREFETCH_MB', 512))  # database files read into the OS cache at boot, up to this size
+# Every module handed out by deferred(), so a warm-up can import them all ahead of the first page. The app script
+# runs again on every rerun, so a name asked for twice gets the same proxy
+DEFERRED = {}
+class Deferred:
+    # Stands in for a module until an attribute is first read; importlib's module locks make a first use from
+    # the warm-up thread and from a page at the same time safe
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+    def __repr__(self):
+        return f"<deferred module '{self._name}'{' (loaded)' if self._module is not None else ''}>"
+def deferred(name: str) -> Deferred:
+    if name not in DEFERRED:
+        DEFERRED[name] = Deferred(name)
+    return DEFERRED[name]
+def preload(names: Optional[Iterable[str]] = None) -> list:
+    # Imports what deferred() handed out (or names); returns the modules that were not imported yet
+    fresh = [n for n in (list(DEFERRED) if names is None else names) if n not in sys.modules]
+    for name in fresh:
+        importlib.import_module(name)
+    return fresh
+def prefetch(path: str, max_mb: int = PREFETCH_MB) -> int:
+    # Reads the file front to back so its pages are in the OS cache before the first query faults them in one by
+    # one; returns the bytes read (0 if the file is larger than max_mb or missing)
+    try:
+        if os.path.getsize(path) > max_mb * 1024 * 1024:
+            return 0
+        total = 0
+        with open(path, 'rb', buffering=0) as f:
+            while chunk := f.read(1 << 20):
+                total += len(chunk)
+        return total
+    except OSError:
+        return 0
+# === WARM-UP ===
+WARM_UP_THREAD = 'school-warm-up'
+class _NoContextWarnings(logging.Filter):
+    # Warm-up fills st.cache_* entries with no session attached on purpose; Streamlit would warn on every call
+    def filter(self, record):
+        return threading.current_thread().name != WARM_UP_THREAD
+class Startup:
+    # Phases run in order on one daemon thread; a failing phase is recorded and the rest still run
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.phases = []
+        self.queued = 0
+        self.current = None
+        self.thread = None
+        self.done = threading.Event()
+    def begin(self, phases: list) -> None:
+        # phases: [(name, callable)]. A second call queues its phases after the running ones
+        logger = logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context')
+        if not any(isinstance(f, _NoContextWarnings) for f in logger.filters):
+            logger.addFilter(_NoContextWarnings())
+        with self.lock:
+            self.queued += len(phases)
+            self.done.clear()
+            previous = self.thread
+            self.thread = threading.Thread(target=self._run, args=(phases, previous), name=WARM_UP_THREAD, daemon=True)
+            self.thread.start()
+    def _run(self, phases, previous):
+        if previous is not None:
+            previous.join()
+        for name, step in phases:
+            self.current = name
+            start = time.perf_counter()
+            try:
+                result, error = step(), None
+            except Exception as e:  # the app still serves; the page that needs this pays for it instead
+                result, error = None, f"{type(e).__name__}: {e}"
+            with self.lock:
+                self.phases.append({'phase': name, 'seconds': round(time.perf_counter() - start, 3), 'ok': error is None,
+                                    **({'error': error} if error else {}),
+                                    **({'result': result} if isinstance(result, (int, float, str, list)) else {})})
+                self.current = None
+                if len(self.phases) == self.queued:
+                    self.done.set()
+            write_health(self)
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+    def status(self) -> dict:
+        with self.lock:
+            phases = list(self.phases)
+            ready = self.done.is_set()
+        failed = [p['phase'] for p in phases if not p['ok']]
+        return {'status': 'degraded' if failed else 'ready' if ready else 'warming', 'ready': ready,
+                'started_at': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+                'uptime_seconds': round(time.time() - self.started, 1), 'current_phase': self.current,
+                'warm_up_seconds': round(sum(p['seconds'] for p in phases), 3), 'failed': failed, 'phases': phases,
+                'pid': os.getpid()}
+STATE = Startup()  # one per process: the launcher's boot phases and the app's own go in the same report
+def write_health(state: Startup = STATE, path: str = HEALTH_FILE) -> None:
+    if not path:
+        return
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(state.status(), f, indent=2)
+        os.replace(temp, path)
+    except OSError:
+        pass
+def boot_phases(databases: Iterable[str]) -> list:
+    # What can be done before Streamlit has run the app once: the heavy third-party imports and the page cache
+    phases = [('imports', lambda: preload(['numpy', 'pandas', 'pyarrow', 'pyarrow.parquet', 'PIL.Image']))]
+    for database in databases:
+        phases.append((f"prefetch {os.path.basename(database)}", lambda d=database: prefetch(d)))
+    return phases
+def check(path: str = HEALTH_FILE) -> int:
+    if not path or not os.path.exists(path):
+        print("no health file; set SCHOOL_HEALTH_FILE", file=sys.stderr)
+        return 1
+    with open(path, encoding='utf-8') as f:
+        status = json.load(f)
+    print(json.dumps(status, indent=2))
+    return 2 if status['failed'] else 0 if status['ready'] else 1
+def main():
+    if sys.argv[1:2] == ['--check']:
+        sys.exit(check())
+    import tenants
+    STATE.begin(boot_phases(t.database for t in tenants.load_tenants().values()))
+    from streamlit.web import cli
+    sys.argv = ['streamlit', 'run', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'), *sys.argv[1:]]
+    sys.exit(cli.main())
+if __name__ == '__main__':
+    import startup  # run as the importable module, so the app sees the same STATE
+    startup.main()
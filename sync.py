@@ -0,0 +1,218 @@
+# Offline-tolerant capture of attendance and registers.
+# Capture clients (tablets, the UI) record events locally, each with a client timestamp, and push them in batches.
+# The server merges batches idempotently: an event_id is applied at most once, and for each row
+# (kind + key, e.g. attendance on (date, student_id)) the latest event wins by (recorded_at, client_id, event_id).
+# Events that lose to a newer mark with a different value come back as conflicts instead of vanishing.
+import json
+import os
+import sqlite3
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable, Optional
+# kind: (table, key columns, value column)
+KINDS = {
+    'attendance': ('attendance', ['date', 'student_id'], 'present'),
+    'teacher_attendance': ('teacher_attendance', ['date', 'teacher_id'], 'present'),
+    'register': ('register', ['teacher_id', 'class', 'date'], 'marked'),
+}
+# Days a received event is kept. After that a client resending it merges it again, which is harmless:
+# sync_versions still holds the winner of each row, so an old event can only come back as superseded
+EVENT_RETENTION_DAYS = int(os.environ.get('SCHOOL_SYNC_RETENTION_DAYS', 90))
+# Key columns that must name an existing row
+REFERENCES = {'student_id': 'students', 'teacher_id': 'teachers'}
+def ensure_sync_tables(conn: sqlite3.Connection) -> None:
+    # sync_events: events received in the last EVENT_RETENTION_DAYS, for idempotency and audit;
+    # sync_versions: the event holding each row
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_events (event_id TEXT PRIMARY KEY, client_id TEXT NOT NULL, kind TEXT NOT NULL,
+        row_key TEXT NOT NULL, value INTEGER NOT NULL, recorded_at TEXT NOT NULL, received_at TEXT NOT NULL, status TEXT NOT NULL)
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_versions (kind TEXT NOT NULL, row_key TEXT NOT NULL, recorded_at TEXT NOT NULL,
+        client_id TEXT NOT NULL, event_id TEXT NOT NULL, value INTEGER NOT NULL, PRIMARY KEY (kind, row_key))
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_events_received ON sync_events (received_at)")
+    conn.commit()
+def prune_events(conn: sqlite3.Connection, days: int = EVENT_RETENTION_DAYS, batch: int = 5000) -> int:
+    # Every UI mark adds an event row; drops those received more than days ago, a batch per transaction so
+    # marking is never held up for long. Returns the rows deleted
+    ensure_sync_tables(conn)
+    cutoff = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+    deleted = 0
+    while True:
+        with conn:
+            cursor = conn.execute("""
+                DELETE FROM sync_events WHERE rowid IN (SELECT rowid FROM sync_events WHERE received_at < ? LIMIT ?)
+            """, (cutoff, batch))
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch:
+            return deleted
+def new_event(client_id: str, kind: str, value: bool, recorded_at: Optional[datetime] = None, **key) -> dict:
+    table, key_columns, value_column = KINDS[kind]
+    return {'event_id': f"{client_id}:{uuid.uuid4().hex}", 'client_id': client_id, 'kind': kind,
+            'recorded_at': (recorded_at or datetime.now()).isoformat(timespec='microseconds'),
+            value_column: bool(value), **{c: key[c] for c in key_columns}}
+def _normalize(event):
+    # -> (event_id, client_id, kind, row_key, key values, value, recorded_at); raises ValueError/KeyError if malformed
+    table, key_columns, value_column = KINDS[event['kind']]
+    values = []
+    for column in key_columns:
+        v = event[column]
+        if column == 'date':
+            v = date.fromisoformat(str(v)).isoformat()
+        elif column.endswith('_id'):
+            v = int(v)
+        else:
+            v = str(v).strip()
+            if not v:
+                raise ValueError(f"{column} is empty")
+        values.append(v)
+    recorded_at = datetime.fromisoformat(str(event['recorded_at'])).isoformat(timespec='microseconds')
+    return (str(event['event_id']), str(event['client_id']), event['kind'], json.dumps(values), values,
+            int(bool(event[value_column])), recorded_at)
+def _chunks(items, size=500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+def _check_references(conn, parsed, rejected):
+    missing = set()
+    for column, table in REFERENCES.items():
+        ids = sorted({p[4][KINDS[p[2]][1].index(column)] for p in parsed if column in KINDS[p[2]][1]})
+        for chunk in _chunks(ids):
+            found = {r[0] for r in conn.execute(f"SELECT id FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)}
+            missing.update((column, i) for i in set(chunk) - found)
+    if not missing:
+        return parsed
+    kept = []
+    for p in parsed:
+        unknown = [f"unknown {c} {v}" for c, v in zip(KINDS[p[2]][1], p[4]) if (c, v) in missing]
+        if unknown:
+            rejected.append({'index': None, 'event_id': p[0], 'error': ', '.join(unknown)})
+        else:
+            kept.append(p)
+    return kept
+def merge_events(conn: sqlite3.Connection, events: Iterable[dict]) -> dict:
+    # One transaction per batch. Returns counts, the ids of every event now safely stored (accepted or duplicate,
+    # so the client can drop them from its outbox), conflicts and rejected events.
+    received_at = datetime.now().isoformat(timespec='seconds')
+    parsed, rejected = [], []
+    for index, event in enumerate(events):
+        try:
+            parsed.append(_normalize(event))
+        except (KeyError, TypeError, ValueError) as e:
+            rejected.append({'index': index, 'event_id': event.get('event_id') if isinstance(event, dict) else None,
+                             'error': f"{type(e).__name__}: {e}"})
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")  # versions are read then written; keep concurrent merges from interleaving
+    with conn:
+        parsed = _check_references(conn, parsed, rejected)
+        seen = set()
+        for chunk in _chunks([p[0] for p in parsed]):
+            rows = conn.execute(f"SELECT event_id FROM sync_events WHERE event_id IN ({', '.join('?' * len(chunk))})", chunk)
+            seen.update(r[0] for r in rows)
+        fresh, duplicates = [], 0
+        for p in parsed:
+            if p[0] in seen:
+                duplicates += 1
+            else:
+                seen.add(p[0])  # the same event twice in one batch counts once
+                fresh.append(p)
+        # Latest event per row: sort ascending so the last one written into the dict wins
+        fresh.sort(key=lambda p: (p[6], p[1], p[0]))
+        latest = {}
+        for p in fresh:
+            latest[(p[2], p[3])] = p
+        current = {}
+        for kind in {k for k, _ in latest}:
+            keys = [row_key for k, row_key in latest if k == kind]
+            for chunk in _chunks(keys):
+                rows = conn.execute(f"""
+                    SELECT row_key, recorded_at, client_id, event_id, value FROM sync_versions
+                    WHERE kind = ? AND row_key IN ({', '.join('?' * len(chunk))})
+                """, [kind] + chunk)
+                current.update({(kind, r[0]): r[1:] for r in rows})
+        applied, status = [], {}
+        for row, p in latest.items():
+            held = current.get(row)
+            if held is None or (p[6], p[1], p[0]) > held[:3]:
+                applied.append(p)
+                status[p[0]] = 'applied'
+        winners = {(p[2], p[3]): (p[6], p[1], p[0], p[5]) for p in applied}
+        conflicts = []
+        for p in fresh:
+            if p[0] in status:
+                continue
+            winner = winners.get((p[2], p[3])) or current[(p[2], p[3])]
+            status[p[0]] = 'superseded'
+            if winner[3] != p[5]:
+                status[p[0]] = 'conflict'
+                conflicts.append({'event_id': p[0], 'kind': p[2], 'key': json.loads(p[3]), 'value': bool(p[5]),
+                                  'recorded_at': p[6], 'winner_event_id': winner[2], 'winner_value': bool(winner[3]),
+                                  'winner_recorded_at': winner[0]})
+        for kind, (table, key_columns, value_column) in KINDS.items():
+            rows = [p[4] + [p[5]] for p in applied if p[2] == kind]
+            if rows:
+                columns = ', '.join(key_columns + [value_column])
+                conn.executemany(f"""
+                    INSERT INTO {table} ({columns}) VALUES ({', '.join('?' * (len(key_columns) + 1))})
+                    ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {value_column} = excluded.{value_column}
+                """, rows)
+        conn.executemany("INSERT OR REPLACE INTO sync_versions VALUES (?, ?, ?, ?, ?, ?)",
+                         [(p[2], p[3], p[6], p[1], p[0], p[5]) for p in applied])
+        conn.executemany("INSERT INTO sync_events VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(p[0], p[1], p[2], p[3], p[5], p[6], received_at, status[p[0]]) for p in fresh])
+    return {'received': len(parsed) + len(rejected), 'applied': len(applied), 'duplicates': duplicates,
+            'stored': [p[0] for p in parsed], 'conflicts': conflicts, 'rejected': rejected}
+def record_marks(conn: sqlite3.Connection, kind: str, client_id: str, value: bool, keys: Iterable[dict],
+                 on: Optional[date] = None) -> dict:
+    # Server-side capture (the Streamlit pages): same merge path as a pushed batch, so a later correction wins
+    day = (on or datetime.now().date()).isoformat()
+    events = [new_event(client_id, kind, value, **({'date': day} | key)) for key in keys]
+    return merge_events(conn, events)
+# === CLIENT OUTBOX ===
+class Outbox:
+    # Local queue on the capture device. Marks are written here first (works offline), then pushed in batches;
+    # events leave the outbox only once the server reports them stored, so retries are always safe.
+    def __init__(self, path: str, client_id: str):
+        self.client_id = client_id
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS outbox (seq INTEGER PRIMARY KEY AUTOINCREMENT, event_id TEXT UNIQUE, body TEXT NOT NULL)")
+        self.conn.commit()
+    def record(self, kind: str, value: bool, **key) -> str:
+        event = new_event(self.client_id, kind, value, **key)
+        with self.conn:
+            self.conn.execute("INSERT INTO outbox (event_id, body) VALUES (?, ?)", (event['event_id'], json.dumps(event)))
+        return event['event_id']
+    def pending(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+    def push(self, send: Callable[[list], dict], batch_size: int = 500) -> dict:
+        # send(events) -> merge_events() result, e.g. http_sender() or a direct call on a server connection.
+        # Stops at the first failed send and leaves the rest queued; rejected events are dropped and reported.
+        totals = {'sent': 0, 'applied': 0, 'duplicates': 0, 'conflicts': [], 'rejected': []}
+        while True:
+            batch = self.conn.execute("SELECT event_id, body FROM outbox ORDER BY seq LIMIT ?", (batch_size,)).fetchall()
+            if not batch:
+                return totals
+            result = send([json.loads(body) for _, body in batch])
+            done = (set(result['stored']) | {r['event_id'] for r in result['rejected']}) - {None}
+            with self.conn:
+                self.conn.executemany("DELETE FROM outbox WHERE event_id = ?", [(e,) for e in done])
+            totals['sent'] += len(batch)
+            totals['applied'] += result['applied']
+            totals['duplicates'] += result['duplicates']
+            totals['conflicts'] += result['conflicts']
+            totals['rejected'] += result['rejected']
+            if not done:
+                return totals
+    def close(self) -> None:
+        self.conn.close()
+def http_sender(base_url: str, token: Optional[str] = None, timeout: float = 30) -> Callable[[list], dict]:
+    # Posts batches to the API's /sync endpoint
+    import urllib.request
+    def send(events):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        request = urllib.request.Request(base_url.rstrip('/') + '/sync', json.dumps({'events': events}).encode(), headers)
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    return send
@@ -0,0 +1,123 @@
+# Several schools served by one process, each with its own SQLite file, assets, photo folder and backups.
+# Separate files keep campuses from queueing behind one write lock, and one process saves the memory and startup
+# of running the app once per school. The registry comes from SCHOOL_TENANTS (default tenants.json):
+#   {"schools": [{"key": "north", "name": "North Campus", "database": "north.db", "image_path": "assets/north",
+#                 "photo_folder": "photos/north", "backup_dir": "backups/north"}, ...]}
+# Relative paths are taken from the file's folder. Without the file there is one school configured from
+# SCHOOL_DB / SCHOOL_IMAGE_PATH / SCHOOL_PHOTO_FOLDER / SCHOOL_BACKUP_DIR, exactly as before.
+import json
+import os
+import sqlite3
+import threading
+from typing import NamedTuple, Optional
+TENANTS_FILE = os.environ.get('SCHOOL_TENANTS', 'tenants.json')
+POOL_SIZE = 4  # idle connections kept per school
+class TenantError(Exception):
+    pass
+class Tenant(NamedTuple):
+    key: str
+    name: str
+    database: str
+    image_path: str
+    photo_folder: str
+    backup_dir: str
+def default_tenant() -> Tenant:
+    # Read when the registry loads rather than at import, so scripts can set the environment first
+    return Tenant('default', os.environ.get('SCHOOL_NAME', 'D.O Buadu'), os.environ.get('SCHOOL_DB', 'school.db'),
+                  os.environ.get('SCHOOL_IMAGE_PATH', r"C:\Users\ameah\Desktop\app host\xschool"),
+                  os.environ.get('SCHOOL_PHOTO_FOLDER', 'student_photos'), os.environ.get('SCHOOL_BACKUP_DIR', 'backups'))
+def load_tenants(path: str = TENANTS_FILE) -> dict:
+    # -> {key: Tenant} in file order; raises TenantError on a malformed registry
+    if not os.path.exists(path):
+        tenant = default_tenant()
+        return {tenant.key: tenant}
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    tenants, databases = {}, {}
+    for i, entry in enumerate(config.get('schools') or []):
+        try:
+            key = str(entry['key']).strip()
+            database = os.path.join(base, entry['database'])
+        except (KeyError, TypeError) as e:
+            raise TenantError(f"School {i + 1} in {path}: missing {e}")
+        if not key or key in tenants:
+            raise TenantError(f"School {i + 1} in {path}: key '{key}' is empty or already used")
+        if os.path.normcase(database) in databases:
+            raise TenantError(f"'{key}' and '{databases[os.path.normcase(database)]}' share {database}")
+        databases[os.path.normcase(database)] = key
+        tenants[key] = Tenant(key, entry.get('name') or key, database,
+                              os.path.join(base, entry.get('image_path', '.')),
+                              os.path.join(base, entry.get('photo_folder', os.path.join('student_photos', key))),
+                              os.path.join(base, entry.get('backup_dir', os.path.join('backups', key))))
+    if not tenants:
+        raise TenantError(f"{path} lists no schools")
+    return tenants
+# === CONNECTION POOLS ===
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to its pool, so callers keep the usual connect/close pattern
+    pool = None
+    checked_out = False
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif self.checked_out:
+            self.checked_out = False
+            self.pool.release(self)
+class ConnectionPool:
+    # Idle connections to one database; each is used by one caller at a time, from whichever thread took it
+    def __init__(self, database: str, size: int = POOL_SIZE):
+        self.database = database
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+    def connect(self) -> PooledConnection:
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            conn = self.open()
+            conn.pool = self
+        conn.checked_out = True
+        return conn
+    def open(self) -> PooledConnection:
+        return sqlite3.connect(self.database, timeout=30, check_same_thread=False, factory=PooledConnection)
+    def release(self, conn: PooledConnection) -> None:
+        if conn.in_transaction:
+            conn.rollback()  # never hand out a half-finished transaction
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        conn.pool = None
+        conn.close()
+    def close(self) -> None:
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.pool = None
+            conn.close()
+class Registry:
+    # Tenants plus one lazily created pool each
+    def __init__(self, tenants: dict):
+        self.tenants = tenants
+        self.pools = {}
+        self.lock = threading.Lock()
+    @classmethod
+    def load(cls, path: str = TENANTS_FILE) -> 'Registry':
+        return cls(load_tenants(path))
+    @property
+    def default(self) -> Tenant:
+        return next(iter(self.tenants.values()))
+    def get(self, key: Optional[str]) -> Tenant:
+        # Unknown or missing keys fall back to the first school
+        return self.tenants.get(key) or self.default
+    def pool(self, key: str) -> ConnectionPool:
+        with self.lock:
+            if key not in self.pools:
+                self.pools[key] = ConnectionPool(self.tenants[key].database)
+            return self.pools[key]
+    def close(self) -> None:
+        with self.lock:
+            pools, self.pools = self.pools, {}
+        for pool in pools.values():
+            pool.close()
@@ -0,0 +1,134 @@
+import importlib.util
+import re
+from datetime import datetime
+import startup
+np = startup.deferred('numpy')
+pd = startup.deferred('pandas')
+# Optional; lets the Series checks run on Arrow's (RE2) string kernels. Looked up rather than imported, so
+# importing this module for the form checks stays cheap
+ARROW_STRINGS = importlib.util.find_spec('pyarrow') is not None
+# === PATTERNS ===
+# Compiled once at import; the scalar checks used by the forms and the Series checks used by bulk imports share them.
+# ARROW_PATTERNS spell the same rules in RE2 syntax for the Arrow path (RE2 classes like \w are ASCII-only).
+EMAIL_RE = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
+PHONE_RE = re.compile(r'\+?[0-9]{10,15}')
+NAME_RE = re.compile(r'[^\W\d_]+(?:[ \t]+[^\W\d_]+)*')
+ARROW_PATTERNS = {
+    EMAIL_RE: r'[\p{L}\p{N}_.-]+@[\p{L}\p{N}_.-]+\.[\p{L}\p{N}_]+',
+    PHONE_RE: r'\+?[0-9]{10,15}',
+    NAME_RE: r'\p{L}+(?:[ \t]+\p{L}+)*',
+}
+USERNAME_RE = re.compile(r'[^\W_]{3,}')
+MONTH_RE = re.compile(r'\d{4}-(0[1-9]|1[0-2])')
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+ROLES = ["admin", "headteacher", "teacher"]
+GENDERS = ["Male", "Female", "Other"]
+def min_dob(max_years=18, today=None):
+    today = today or datetime.now().date()
+    try:
+        return today.replace(year=today.year - max_years)
+    except ValueError:  # 29 February
+        return today.replace(year=today.year - max_years, day=28)
+# === SCALAR CHECKS ===
+def is_valid_email(email): return bool(email and EMAIL_RE.fullmatch(email.strip()))
+def is_valid_phone(phone): return bool(phone and PHONE_RE.fullmatch(phone.strip()))
+def is_valid_name_part(name): return bool(name and NAME_RE.fullmatch(name.strip()))
+def is_valid_name(name): return is_valid_name_part(name) and len(name.strip()) >= 2
+def is_valid_class(class_name): return bool(class_name and class_name.strip())
+def is_valid_subject(subject): return bool(subject and len(subject.strip()) >= 2)
+def is_valid_date(dob, max_years=18):
+    if not dob: return False
+    today = datetime.now().date()
+    return min_dob(max_years, today) <= dob <= today
+def is_valid_day(day): return day in DAYS
+def is_valid_period(period): return 1 <= period <= 8
+def is_valid_username(username): return bool(username and username.strip() and USERNAME_RE.fullmatch(username))
+def is_valid_password(password): return bool(password and len(password.strip()) >= 6)
+def is_valid_role(role): return role in ROLES
+def is_valid_activity(activity): return bool(activity and len(activity.strip()) >= 2)
+def is_valid_insurance_number(ins): return bool(ins and len(ins.strip()) >= 5)
+def is_valid_month(month): return bool(month and MONTH_RE.fullmatch(month.strip()))
+# === VECTORIZED CHECKS ===
+# Each invalid_* takes a Series and returns a boolean mask that is True on rows failing the rule.
+# With optional=True blank cells pass, mirroring the "field and not is_valid_x(field)" form checks.
+def text(series):
+    if ARROW_STRINGS:
+        return series.astype('string[pyarrow]').fillna('').str.strip()
+    return series.fillna('').astype(str).str.strip()
+def _bool(mask): return mask.astype(bool)
+def _mask(s, bad, optional):
+    return bad & _bool(s != '') if optional else bad
+def _no_match(s, pattern):
+    if s.dtype == 'string[pyarrow]':
+        return ~_bool(s.str.fullmatch(ARROW_PATTERNS[pattern]))
+    # Run the regex once per distinct value; bulk files repeat classes, residences and guardian phones a lot
+    codes, uniques = pd.factorize(s)
+    bad = np.fromiter((pattern.fullmatch(u) is None for u in uniques), dtype=bool, count=len(uniques))
+    return pd.Series(bad[codes], index=s.index)
+def invalid_email(series, optional=False):
+    s = text(series)
+    return _mask(s, _no_match(s, EMAIL_RE), optional)
+def invalid_phone(series, optional=False):
+    s = text(series)
+    return _mask(s, _no_match(s, PHONE_RE), optional)
+def invalid_name_part(series, optional=False):
+    s = text(series)
+    return _mask(s, _no_match(s, NAME_RE), optional)
+def invalid_name(series, optional=False):
+    s = text(series)
+    return _mask(s, _no_match(s, NAME_RE) | _bool(s.str.len() < 2), optional)
+def invalid_class(series):
+    return _bool(text(series) == '')
+def invalid_subject(series, subjects=None):
+    s = text(series)
+    bad = _bool(s.str.len() < 2)
+    if subjects:
+        bad |= ~_bool(s.str.lower().isin([x.lower() for x in subjects]))
+    return bad
+def invalid_insurance_number(series, optional=False):
+    s = text(series)
+    return _mask(s, _bool(s.str.len() < 5), optional)
+def invalid_required(series):
+    return _bool(text(series) == '')
+def invalid_choice(series, choices):
+    return ~_bool(series.isin(choices))
+def invalid_period(series):
+    p = pd.to_numeric(series, errors='coerce')
+    return ~p.between(1, 8) | (p % 1 != 0)
+def invalid_score(series):
+    s = pd.to_numeric(series, errors='coerce')
+    return s.isna() | (s % 1 != 0) | ~s.between(0, 100)
+def invalid_date(series, max_years=18):
+    # Expects parsed dates (see parse_dates); unparseable cells are NaT and fail
+    today = datetime.now().date()
+    return series.isna() | ~series.between(min_dob(max_years, today), today)
+def parse_dates(series):
+    return pd.to_datetime(series, errors='coerce').dt.date
+# === ERROR REPORTS ===
+def error_messages(masks):
+    # masks: DataFrame with one boolean column per rule, named by its message -> "msg1; msg2" per row ('' if valid)
+    errors = pd.Series('', index=masks.index)
+    for message in masks.columns:
+        errors = errors.mask(masks[message].fillna(True).astype(bool), errors + message + '; ')
+    return errors.str.rstrip('; ')
+def validate_frame(df, rules):
+    # rules: {message: callable(df) -> mask}; returns (masks, messages)
+    masks = pd.DataFrame({message: rule(df) for message, rule in rules.items()}, index=df.index)
+    return masks, error_messages(masks)
+# === RESULTS ===
+def validate_results(df, student_ids, subjects=None):
+    ids = pd.to_numeric(df['student_id'], errors='coerce')
+    subject = text(df['subject'])
+    if subjects:
+        canonical = {s.lower(): s for s in subjects}
+        subject = subject.str.lower().map(canonical).fillna(subject)
+    masks = pd.DataFrame({
+        "invalid student ID": ids.isna(),
+        "student ID not found": ids.notna() & ~ids.isin(student_ids),
+        "duplicate row": ids.notna() & pd.DataFrame({'id': ids, 'subject': subject.str.lower()}).duplicated(keep=False),
+        "score must be a whole number between 0 and 100": invalid_score(df['score']),
+        "invalid subject": invalid_subject(subject, subjects),
+    })
+    out = df.assign(student_id=ids, subject=subject, score=pd.to_numeric(df['score'], errors='coerce'), error=error_messages(masks))
+    out.insert(0, 'row', range(1, len(out) + 1))
+    return out
@@ -0,0 +1,74 @@
+# Teacher workload and daily cover from the timetable.
+# Load: periods per week, free periods per day, classes and subjects taught. Cover: on a date, the periods of teachers
+# marked absent in teacher_attendance, each with free teachers who could take it, qualified ones (teachers.subject
+# matches) first. "Free" is an index lookup on timetables (day, period, teacher_id) per slot, not a scan of the week.
+import sqlite3
+from datetime import date
+from typing import Optional
+import pandas as pd
+from validation import DAYS
+PERIODS_PER_DAY = 8
+def ensure_workload_indexes(conn: sqlite3.Connection) -> None:
+    conn.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_timetables_slot_teacher ON timetables (day, period, teacher_id);
+        CREATE INDEX IF NOT EXISTS idx_timetables_teacher ON timetables (teacher_id, day);
+        CREATE INDEX IF NOT EXISTS idx_teachers_subject ON teachers (subject);
+    """)
+def weekday(on: date) -> Optional[str]:
+    # Timetable day for a date, None at weekends
+    return DAYS[on.weekday()] if on.weekday() < len(DAYS) else None
+def teacher_load(conn: sqlite3.Connection) -> pd.DataFrame:
+    # One row per teacher, including those with nothing timetabled
+    per_day = ", ".join(f"{PERIODS_PER_DAY} - COUNT(CASE WHEN tt.day = '{d}' THEN 1 END) AS free_{d[:3].lower()}" for d in DAYS)
+    return pd.read_sql_query(f"""
+        SELECT t.id AS teacher_id, t.name, t.subject, COUNT(tt.id) AS periods_per_week, {per_day},
+               (SELECT GROUP_CONCAT(class, ', ') FROM (SELECT DISTINCT class FROM timetables WHERE teacher_id = t.id
+                    UNION SELECT class FROM subject_assignments WHERE teacher_id = t.id ORDER BY class)) AS classes,
+               (SELECT GROUP_CONCAT(subject, ', ') FROM (SELECT DISTINCT subject FROM timetables WHERE teacher_id = t.id
+                    UNION SELECT subject FROM subject_assignments WHERE teacher_id = t.id ORDER BY subject)) AS subjects,
+               (SELECT GROUP_CONCAT(class, ', ') FROM class_teachers WHERE teacher_id = t.id) AS class_teacher_of
+        FROM teachers t LEFT JOIN timetables tt ON tt.teacher_id = t.id
+        GROUP BY t.id ORDER BY periods_per_week DESC, t.id
+    """, conn)
+def absent_teachers(conn: sqlite3.Connection, on: date) -> list:
+    return [r[0] for r in conn.execute("SELECT teacher_id FROM teacher_attendance WHERE date = ? AND NOT present ORDER BY teacher_id",
+                                       (on.isoformat(),))]
+def uncovered_periods(conn: sqlite3.Connection, on: date) -> pd.DataFrame:
+    # Timetabled periods on the date whose teacher is marked absent
+    return pd.read_sql_query("""
+        SELECT tt.id AS slot_id, tt.period, tt.class, tt.subject, tt.teacher_id, t.name AS absent_teacher
+        FROM teacher_attendance a
+        JOIN timetables tt ON tt.teacher_id = a.teacher_id AND tt.day = ?
+        LEFT JOIN teachers t ON t.id = tt.teacher_id
+        WHERE a.date = ? AND NOT a.present
+        ORDER BY tt.period, tt.class
+    """, conn, params=(weekday(on) or '', on.isoformat()))
+def substitutes(conn: sqlite3.Connection, on: date, period: int, subject: str, exclude: tuple = ()) -> pd.DataFrame:
+    # Present teachers with no class in this period; qualified first, then whoever teaches least that day
+    day = weekday(on) or ''
+    return pd.read_sql_query(f"""
+        SELECT t.id AS teacher_id, t.name, t.subject, t.subject = :subject AS qualified,
+               (SELECT COUNT(*) FROM timetables x WHERE x.teacher_id = t.id AND x.day = :day) AS periods_today
+        FROM teachers t
+        WHERE NOT EXISTS (SELECT 1 FROM timetables x WHERE x.day = :day AND x.period = :period AND x.teacher_id = t.id)
+          AND NOT EXISTS (SELECT 1 FROM teacher_attendance a WHERE a.date = :on AND a.teacher_id = t.id AND NOT a.present)
+          AND t.id NOT IN ({', '.join(str(int(i)) for i in exclude)})
+        ORDER BY qualified DESC, periods_today, t.id
+    """, conn, params={'subject': subject, 'day': day, 'period': int(period), 'on': on.isoformat()})
+def cover_plan(conn: sqlite3.Connection, on: date) -> pd.DataFrame:
+    # Uncovered periods with one suggested substitute each; nobody is suggested twice for the same period
+    plan = uncovered_periods(conn, on)
+    suggested = {}
+    names, qualified = [], []
+    for row in plan.itertuples():
+        taken = suggested.setdefault(row.period, [])
+        options = substitutes(conn, on, row.period, row.subject, tuple(taken))
+        if options.empty:
+            names.append(None)
+            qualified.append(None)
+            continue
+        best = options.iloc[0]
+        taken.append(int(best['teacher_id']))
+        names.append(f"{best['name']} (ID {best['teacher_id']})")
+        qualified.append(bool(best['qualified']))
+    return plan.assign(suggested_cover=names, qualified=qualified)